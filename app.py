@@ -5,7 +5,7 @@ Author: Amaan
 
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 from orchestrator import PipelineOrchestrator
@@ -301,10 +301,25 @@ if page == "🔍 Search Papers":
         col_a, col_b = st.columns([3, 1])
         with col_b:
             n_results = st.number_input("Results", min_value=1, max_value=20, value=5, label_visibility="collapsed")
+
+        # Filters are applied inside the index before scoring
+        with st.expander("Filters"):
+            col_c, col_d, col_e = st.columns([2, 1, 1])
+            with col_c:
+                categories = st.multiselect("Categories", orchestrator.config.get('arxiv_categories', []))
+            with col_d:
+                days = st.number_input("Published in last N days (0 = any)", min_value=0, value=0)
+            with col_e:
+                only_summarized = st.checkbox("Only papers with summaries")
     
     if query:
         with st.spinner("Searching through papers..."):
-            results = orchestrator.search_papers(query, n_results)
+            results = orchestrator.search_papers(
+                query, n_results,
+                categories=categories or None,
+                date_from=(datetime.now() - timedelta(days=days)).date() if days else None,
+                has_summary=True if only_summarized else None
+            )
             
         if results['results']:
             st.session_state.last_search_results = results['results']
@@ -321,10 +336,14 @@ if page == "🔍 Search Papers":
                         st.markdown(f"**ArXiv ID:** {paper['arxiv_id']}")
                         st.markdown(f"**Similarity:** {paper['similarity']:.2%}")
 
-                        # Show structured summary if available
-                        if paper.get('has_summary') and paper.get('summary'):
-                            summary = paper['summary']
+                        # Structured summary is loaded only when the user asks for it
+                        summary = paper.get('summary')
+                        if paper.get('has_summary') and summary is None and st.toggle(
+                            "Show structured summary", value=(i == 1), key=f"summary_{paper['arxiv_id']}"
+                        ):
+                            summary = orchestrator.get_paper_summary(paper['arxiv_id'])
 
+                        if summary:
                             st.markdown("### Structured Summary")
 
                             # Create tabs for different sections
@@ -524,6 +543,19 @@ elif page == "📊 Dashboard":
         fig.update_layout(paper_bgcolor='#ffffff', font={'color': '#1e293b'})
         st.plotly_chart(fig, use_container_width=True)
 
+    # Topic clusters are maintained by the pipeline; this only reads the stored counts
+    topics = orchestrator.get_topics()
+    if topics:
+        st.markdown("### Topics")
+        topic_data = {
+            'Topic': [topic['label'] or f"Topic {topic['cluster_id']}" for topic in topics],
+            'Papers': [topic['size'] for topic in topics]
+        }
+        fig = px.bar(topic_data, x='Papers', y='Topic', orientation='h', title="Papers per Topic")
+        fig.update_layout(paper_bgcolor='#ffffff', plot_bgcolor='#ffffff', font={'color': '#1e293b'},
+                          yaxis={'categoryorder': 'total ascending'})
+        st.plotly_chart(fig, use_container_width=True)
+
 elif page == "⚙️ Pipeline Control":
     st.markdown("<h1 style='text-align: center;'>Pipeline Control</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align: center; color: #94a3b8;'>Manage and execute pipeline operations</p>", unsafe_allow_html=True)
@@ -555,6 +587,7 @@ elif page == "⚙️ Pipeline Control":
                     - Papers parsed: {parse.get('success', 0)}
                     - Embeddings created: {embed.get('success', 0)}
                     - Embedding API cost: ${embed.get('estimated_cost', 0):.4f}
+                    - Embedding cache hit rate: {embed.get('cache_hit_rate', 0):.0%} (~{embed.get('tokens_avoided', 0)} tokens avoided)
                     """
 
                     # Add summary results if not skipped
@@ -588,7 +621,8 @@ elif page == "⚙️ Pipeline Control":
             with st.spinner("Creating embeddings..."):
                 embed_results = orchestrator.vector_store.process_all_papers()
                 st.success(f"Created embeddings for {embed_results['success']} papers")
-                st.info(f"API cost: ${embed_results['estimated_cost']:.4f}")
+                st.info(f"API cost: ${embed_results['estimated_cost']:.4f} · cache hit rate "
+                        f"{embed_results['cache_hit_rate']:.0%} (~{embed_results['tokens_avoided']} tokens avoided)")
 
         if st.button("📝 Generate Summaries Only"):
             with st.spinner("Generating summaries..."):
@@ -746,6 +780,21 @@ elif page == "📚 Browse Papers":
                             else:
                                 st.error("Summarizer not available")
 
+                if paper['has_embeddings']:
+                    if st.button("🔎 More like this", key=f"similar_{paper['arxiv_id']}"):
+                        st.session_state.similar_to = paper['arxiv_id']
+
+            # Papers nearest to this one by centroid, shown under the paper that asked
+            if st.session_state.get('similar_to') == paper['arxiv_id']:
+                st.markdown("### More Like This")
+                similar = orchestrator.similar_papers(paper['arxiv_id'], k=5)['results']
+                if similar:
+                    for other in similar:
+                        st.markdown(f"- [{other['title']}](https://arxiv.org/abs/{other['arxiv_id']}) "
+                                    f"({other['similarity']:.2%})")
+                else:
+                    st.info("No similar papers found")
+
 # Footer
 st.markdown("<br><br>", unsafe_allow_html=True)
 st.markdown("""
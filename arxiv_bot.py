@@ -10,6 +10,7 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from typing import List, Dict
 import time
+from dedup import canonical_arxiv_id, NearDuplicateDetector
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -18,7 +19,7 @@ logger = logging.getLogger(__name__)
 class ArxivBot:
     """Fetches LLM/RAG papers from arXiv and stores in SQLite"""
     
-    def __init__(self, config_path="config.json"):
+    def __init__(self, config_path="config.json", db=None):
         # Load configuration from JSON
         if os.path.exists(config_path):
             with open(config_path, 'r') as f:
@@ -39,12 +40,18 @@ class ArxivBot:
         from database_manager import DatabaseManager
         
         # Initialize database
-        self.db = DatabaseManager()
+        self.db = db or DatabaseManager()
+        
+        # Near-duplicates are linked to the paper they repeat instead of processed again
+        self.dedup = NearDuplicateDetector(self.db)
         
         # Create PDF directory
         self.pdf_dir = self.config.get('pdf_directory', './data/pdfs')
         os.makedirs(self.pdf_dir, exist_ok=True)
         
+        # Papers are written in batches, one transaction each
+        self.write_batch_size = self.config.get('db_write_batch_size', 100)
+        
         logger.info("ArxivBot initialized with SQLite backend")
     
     def fetch_recent_papers(self, days_back=None, max_results=None) -> Dict:
@@ -59,6 +66,7 @@ class ArxivBot:
         results = {
             'papers_found': 0,
             'papers_stored': 0,
+            'duplicates': 0,
             'pdfs_downloaded': 0,
             'errors': []
         }
@@ -78,6 +86,7 @@ class ArxivBot:
             
             cutoff_date = datetime.now() - timedelta(days=days_back)
             
+            batch = []
             for paper in search.results():
                 # Check date
                 if paper.published.replace(tzinfo=None) < cutoff_date:
@@ -86,27 +95,12 @@ class ArxivBot:
                 # Check if relevant
                 if self._is_relevant(paper):
                     results['papers_found'] += 1
-                    
-                    # Extract paper data
-                    paper_data = self._extract_paper_data(paper)
-                    
-                    # Store in database
-                    if self.db.insert_paper(paper_data):
-                        results['papers_stored'] += 1
-                        
-                        # Download PDF
-                        if self._download_pdf(paper):
-                            results['pdfs_downloaded'] += 1
-                            
-                            # Mark PDF as downloaded
-                            self.db.cursor.execute(
-                                "UPDATE papers SET pdf_downloaded = 1 WHERE arxiv_id = ?",
-                                (paper_data['arxiv_id'],)
-                            )
-                            self.db.conn.commit()
-                    
-                    # Be polite to arXiv
-                    time.sleep(0.5)
+                    batch.append((paper, self._extract_paper_data(paper)))
+                    if len(batch) >= self.write_batch_size:
+                        self._store_batch(batch, results)
+                        batch = []
+            
+            self._store_batch(batch, results)
             
             # Log successful run
             self.db.log_pipeline_run(
@@ -128,9 +122,45 @@ class ArxivBot:
                 'FAILED', str(e)
             )
         
-        logger.info(f"Fetch complete: {results['papers_stored']} papers stored")
+        logger.info(f"Fetch complete: {results['papers_stored']} papers stored, "
+                    f"{results['duplicates']} near-duplicates linked")
         return results
     
+    def _store_batch(self, batch: List[tuple], results: Dict):
+        """Store (paper, paper_data) pairs in one transaction, then dedup and download the new ones"""
+        if not batch:
+            return
+        
+        # Known papers and other versions of them are not re-added
+        new_ids = set(self.db.insert_papers_bulk([paper_data for _, paper_data in batch]))
+        results['papers_stored'] += len(new_ids)
+        
+        downloaded, duplicates = [], []
+        try:
+            for paper, paper_data in batch:
+                arxiv_id = paper_data['arxiv_id']
+                if arxiv_id not in new_ids:
+                    continue
+                new_ids.discard(arxiv_id)  # a batch can hold the same paper twice
+                
+                original = self.dedup.check(
+                    arxiv_id, f"{paper_data['title']}\n{paper_data['abstract'] or ''}", 'abstract'
+                )
+                if original:
+                    duplicates.append((arxiv_id, original))
+                    results['duplicates'] += 1
+                
+                # Otherwise download the PDF
+                elif self._download_pdf(paper):
+                    results['pdfs_downloaded'] += 1
+                    downloaded.append(arxiv_id)
+                
+                    # Be polite to arXiv
+                    time.sleep(0.5)
+        finally:
+            # Mark PDFs as downloaded and link duplicates, even if the batch stopped part way
+            self.db.set_paper_flag(downloaded, 'pdf_downloaded', duplicates=duplicates)
+    
     def _is_relevant(self, paper) -> bool:
         """Check if paper matches our keywords"""
         text = (paper.title + " " + paper.summary).lower()
@@ -142,9 +172,11 @@ class ArxivBot:
         return False
     
     def _extract_paper_data(self, paper) -> Dict:
-        """Extract paper metadata"""
+        """Extract paper metadata (canonical id, version kept separately)"""
+        arxiv_id, version = canonical_arxiv_id(paper.entry_id)
         return {
-            'arxiv_id': paper.entry_id.split('/')[-1],
+            'arxiv_id': arxiv_id,
+            'version': version,
             'title': paper.title,
             'abstract': paper.summary,
             'authors': [author.name for author in paper.authors],
@@ -156,7 +188,7 @@ class ArxivBot:
     def _download_pdf(self, paper) -> bool:
         """Download PDF file"""
         try:
-            arxiv_id = paper.entry_id.split('/')[-1]
+            arxiv_id, _ = canonical_arxiv_id(paper.entry_id)
             pdf_path = os.path.join(self.pdf_dir, f"{arxiv_id}.pdf")
             
             # Skip if exists
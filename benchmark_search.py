@@ -0,0 +1,83 @@
+"""
+Benchmark search modes against exact float32 search using the stored embeddings.
+No API calls: queries are stored chunk vectors with a little noise added.
+Covers quantized rows and reduced-dimension (Matryoshka prefix) scans, each
+with and without the full-vector rescoring step.
+"""
+import argparse
+import time
+import numpy as np
+from database_manager import DatabaseManager
+from embedding_index import EmbeddingIndex
+
+parser = argparse.ArgumentParser(description="Recall@k and memory of quantized search modes")
+parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries")
+parser.add_argument("-k", type=int, default=10, help="Results per query")
+parser.add_argument("--pq-subspaces", type=int, default=64)
+parser.add_argument("--rescore-multiplier", type=int, default=8)
+parser.add_argument("--scan-dimensions", type=int, default=256,
+                    help="Prefix length for the reduced-dimension modes (0 to skip them)")
+args = parser.parse_args()
+
+db = DatabaseManager()
+
+
+def build_index(**kwargs) -> EmbeddingIndex:
+    index = EmbeddingIndex(**kwargs)
+    index.vector_loader = db.get_embedding_vectors
+    for batch in db.iter_embedding_rows():
+        row_ids, paper_ids, chunk_indices, vectors = zip(*batch)
+        index.add(row_ids, paper_ids, chunk_indices, vectors)
+    return index
+
+
+exact_index = build_index()
+if not len(exact_index):
+    print("No embeddings in the database - run the pipeline first.")
+    raise SystemExit(1)
+
+rng = np.random.default_rng(0)
+sample = rng.choice(len(exact_index), min(args.queries, len(exact_index)), replace=False)
+queries = exact_index.vectors[sample] + rng.normal(0, 0.02, (len(sample), exact_index.dim)).astype(np.float32)
+truth = [exact_index.search(q, args.k)[0] for q in queries]
+
+print(f"📏 {len(exact_index)} chunks, {exact_index.dim} dims, {len(queries)} queries, k={args.k}")
+print("="*72)
+print(f"{'mode':<20}{'MB / 1M chunks':>16}{'recall@k':>12}{'ms / query':>14}")
+
+modes = [
+    ('float32', dict()),
+    ('int8', dict(quantization='int8', rescore_multiplier=args.rescore_multiplier)),
+    ('int8 (no rescore)', dict(quantization='int8')),
+    # Train PQ on the whole corpus, however small, instead of waiting for
+    # pq_min_train_rows (the index would stay float32 below it)
+    ('pq', dict(quantization='pq', pq_subspaces=args.pq_subspaces, pq_min_train_rows=len(exact_index),
+                rescore_multiplier=args.rescore_multiplier)),
+    ('pq (no rescore)', dict(quantization='pq', pq_subspaces=args.pq_subspaces,
+                             pq_min_train_rows=len(exact_index))),
+]
+if 0 < args.scan_dimensions < exact_index.dim:
+    d = args.scan_dimensions
+    modes += [
+        (f'{d}d', dict(scan_dimensions=d, rescore_multiplier=args.rescore_multiplier)),
+        (f'{d}d (no rescore)', dict(scan_dimensions=d)),
+        (f'{d}d int8', dict(scan_dimensions=d, quantization='int8',
+                             rescore_multiplier=args.rescore_multiplier)),
+    ]
+
+for name, kwargs in modes:
+    index = exact_index if name == 'float32' else build_index(**kwargs)
+    if 'no rescore' in name:
+        index.vector_loader = None
+
+    start = time.perf_counter()
+    results = [index.search(q, args.k)[0] for q in queries]
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    recall = np.mean([len(np.intersect1d(r, t)) / len(t) for r, t in zip(results, truth)])
+    memory = index.memory_bytes()
+    if memory['encoding'] != kwargs.get('quantization', 'none'):
+        name += f" ({memory['encoding']})"
+    print(f"{name:<20}{memory['mb_per_million_rows']:>16.0f}{recall:>12.3f}{elapsed_ms:>14.2f}")
+
+db.close()
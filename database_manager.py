@@ -6,17 +6,87 @@ Author: Amaan
 import sqlite3
 import json
 import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
 from datetime import datetime
 from typing import List, Dict, Optional
 import logging
 
+import numpy as np
+
+from dedup import canonical_arxiv_id
+
+try:
+    import zstandard
+except ImportError:  # Optional: zlib is always available
+    zstandard = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Binary embedding format: 12 byte header followed by little-endian vector data
+#   magic (4s) | format version (B) | dtype code (B) | padding (2x) | dimension (I)
+EMBEDDING_MAGIC = b'RBEV'
+EMBEDDING_FORMAT_VERSION = 1
+EMBEDDING_DTYPES = {1: np.dtype('<f4')}
+_EMBEDDING_HEADER = struct.Struct('<4sBBxxI')
+
+
+def encode_embedding(embedding) -> bytes:
+    """Encode a vector as a versioned little-endian float32 blob"""
+    vector = np.asarray(embedding, dtype='<f4').ravel()
+    header = _EMBEDDING_HEADER.pack(EMBEDDING_MAGIC, EMBEDDING_FORMAT_VERSION, 1, vector.shape[0])
+    return header + vector.tobytes()
+
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+    """Decode an embedding blob (binary or legacy pickle) into a float32 array"""
+    if blob[:4] == EMBEDDING_MAGIC:
+        _, version, dtype_code, dim = _EMBEDDING_HEADER.unpack_from(blob)
+        if version != EMBEDDING_FORMAT_VERSION or dtype_code not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported embedding format v{version} dtype {dtype_code}")
+        # Zero-copy view over the blob bytes
+        return np.frombuffer(blob, dtype=EMBEDDING_DTYPES[dtype_code],
+                             count=dim, offset=_EMBEDDING_HEADER.size)
+
+    # Legacy rows written with pickle.dumps(list_of_floats)
+    return np.asarray(pickle.loads(blob), dtype=np.float32)
+
+
+# Codecs for paper_content; the codec is stored per row, so both can be read back
+CONTENT_CODECS = ('zlib', 'zstd')
+
+
+def compress_text(text: Optional[str], codec: str) -> Optional[bytes]:
+    """Compress UTF-8 text with 'zlib' or 'zstd'"""
+    if text is None:
+        return None
+    data = text.encode('utf-8')
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress_text(blob: Optional[bytes], codec: str) -> Optional[str]:
+    """Inverse of compress_text"""
+    if blob is None:
+        return None
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("Paper content is zstd-compressed. Please run: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(blob).decode('utf-8')
+    return zlib.decompress(blob).decode('utf-8')
+
+
 class DatabaseManager:
     """Core database manager for all RAG bot data"""
     
-    def __init__(self, db_path="./data/ragbot.db"):
+    def __init__(self, db_path="./data/ragbot.db", busy_timeout: float = 30.0,
+                 content_codec: Optional[str] = None):
         self.db_path = db_path
         
         # Create the directory if it doesn't exist
@@ -26,11 +96,61 @@ class DatabaseManager:
             if not os.path.exists(db_path):
                 logger.info(f"Created database directory: {db_dir}")
         
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
+        # One connection per thread: in WAL mode readers work from a snapshot
+        # and never wait on the ingest writer, and writers queue on the busy
+        # timeout instead of failing with "database is locked"
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []  # (thread, connection) pairs, closed by close()
+        self._connections_lock = threading.Lock()
+        
+        # Full text is stored compressed: zstd when installed, else zlib
+        self.content_codec = content_codec or ('zstd' if zstandard is not None else 'zlib')
+        if self.content_codec not in CONTENT_CODECS:
+            raise ValueError(f"Unknown content codec '{content_codec}', expected one of {CONTENT_CODECS}")
+        if self.content_codec == 'zstd' and zstandard is None:
+            raise ImportError("zstandard not installed. Please run: pip install zstandard")
         self._create_tables()
         logger.info(f"Database initialized at {db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection for the calling thread"""
+        # check_same_thread=False only so close() can close it from another thread
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # INSERT OR REPLACE must fire delete triggers so the FTS index stays in sync
+        conn.execute("PRAGMA recursive_triggers = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Durable at each WAL checkpoint rather than each commit
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+        with self._connections_lock:
+            # Connections of threads that have exited are never used again
+            alive = []
+            for thread, other in self._connections:
+                if thread.is_alive():
+                    alive.append((thread, other))
+                else:
+                    other.close()
+            alive.append((threading.current_thread(), conn))
+            self._connections = alive
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """The calling thread's cursor (execute then fetch, never shared across threads)"""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.conn.cursor()
+        return cursor
     
     def _create_tables(self):
         """Create all necessary tables"""
@@ -46,12 +166,26 @@ class DatabaseManager:
             categories TEXT,  -- JSON array
             pdf_url TEXT,
             pdf_downloaded BOOLEAN DEFAULT 0,
-            full_text TEXT,
-            sections TEXT,  -- JSON object
             processed BOOLEAN DEFAULT 0,
             embedding_created BOOLEAN DEFAULT 0,
             summary_generated BOOLEAN DEFAULT 0,
-            fetched_date DATETIME DEFAULT CURRENT_TIMESTAMP
+            fetched_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER DEFAULT 1,  -- arXiv version; arxiv_id is the canonical id
+            duplicate_of TEXT  -- set for near-duplicates, which are not processed
+        )
+        """)
+        
+        # Parsed PDF text, compressed and kept out of papers so metadata
+        # scans never page through megabytes of full text
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS paper_content (
+            paper_id TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,  -- 'zlib' or 'zstd'
+            full_text BLOB,
+            sections BLOB,  -- compressed JSON object
+            text_length INTEGER,  -- characters before compression
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (paper_id) REFERENCES papers(arxiv_id)
         )
         """)
         
@@ -100,62 +234,637 @@ class DatabaseManager:
         )
         """)
 
+        # Cached search query embeddings (keyed by model + normalized query)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS query_embedding_cache (
+            model TEXT NOT NULL,
+            query TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (model, query)
+        )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_last_used ON query_embedding_cache(last_used)")
+
+        # Content-addressed chunk embeddings: sha256(model, chunk_text) -> vector.
+        # Survives reset_embeddings.py so unchanged text is never paid for twice
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            content_hash TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            token_count INTEGER,
+            created_at REAL NOT NULL
+        )
+        """)
+
+        # Chunks whose embedding request failed, retried with exponential backoff.
+        # A paper is only marked embedding_created once none of its chunks are queued
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_retry_queue (
+            paper_id TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            chunk_text TEXT NOT NULL,
+            chunk_type TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (paper_id, chunk_index)
+        )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_retry_next_attempt ON embedding_retry_queue(next_attempt)")
+
+        # One unit vector per paper: weighted mean of its normalized chunk vectors.
+        # chunk_count tells a stale centroid (chunks added since) from a current one
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS paper_centroids (
+            paper_id TEXT PRIMARY KEY,
+            centroid BLOB NOT NULL,
+            chunk_count INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """)
+
+        # Sparse kNN graph between papers (top neighbours by centroid similarity)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS paper_neighbors (
+            paper_id TEXT NOT NULL,
+            neighbor_id TEXT NOT NULL,
+            similarity REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (paper_id, neighbor_id)
+        )
+        """)
+
+        # Topic clusters over paper centroids, refined by mini-batch k-means.
+        # absorbed = points each centroid has learned from (its learning rate)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS topic_clusters (
+            cluster_id INTEGER PRIMARY KEY,
+            centroid BLOB NOT NULL,
+            absorbed INTEGER NOT NULL DEFAULT 0,
+            size INTEGER NOT NULL DEFAULT 0,
+            label TEXT,
+            updated_at REAL NOT NULL
+        )
+        """)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS paper_topics (
+            paper_id TEXT PRIMARY KEY,
+            cluster_id INTEGER NOT NULL,
+            similarity REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_paper_topics_cluster ON paper_topics(cluster_id)")
+
+        # MinHash signatures (abstract / full text) and their LSH band buckets
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS paper_minhash (
+            paper_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            signature BLOB NOT NULL,
+            PRIMARY KEY (paper_id, field)
+        )
+        """)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS minhash_buckets (
+            field TEXT NOT NULL,
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            paper_id TEXT NOT NULL,
+            PRIMARY KEY (field, band, bucket, paper_id)
+        )
+        """)
+
+        self._create_fts_tables()
+
+        # Generation counter for on-disk vector caches: bumped whenever stored
+        # embeddings are deleted or rewritten, so appended-only caches can tell
+        # they are stale
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        self.cursor.execute("INSERT OR IGNORE INTO embedding_generation (id, generation) VALUES (1, 0)")
+        self.cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_embeddings_delete_generation
+        AFTER DELETE ON embeddings
+        BEGIN
+            UPDATE embedding_generation SET generation = generation + 1 WHERE id = 1;
+        END
+        """)
+        self.cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_embeddings_update_generation
+        AFTER UPDATE OF embedding ON embeddings
+        BEGIN
+            UPDATE embedding_generation SET generation = generation + 1 WHERE id = 1;
+        END
+        """)
+
         # Create indices for performance
-        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_papers_processed ON papers(processed)")
-        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_paper ON embeddings(paper_id)")
         self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_summaries_paper ON paper_summaries(paper_id)")
 
         self.conn.commit()
+        self._run_migrations()
+
+    # Schema migrations as (PRAGMA user_version, description, method, query plan checks).
+    # Each runs once, in its own transaction, on databases with a lower
+    # user_version; checks are (query, index it should use) pairs that
+    # tests/test_migrations.py verifies with EXPLAIN QUERY PLAN.
+    _MIGRATIONS = [
+        (1, 'arXiv version and duplicate_of columns', '_migrate_paper_versions', []),
+        (2, 'full text moved to paper_content', '_move_inline_content', []),
+        (3, 'indexes for pipeline queues and listings', '_migrate_query_indexes', [
+            ("""SELECT arxiv_id FROM papers
+                WHERE processed = 0 AND pdf_downloaded = 1 AND duplicate_of IS NULL
+                ORDER BY fetched_date DESC LIMIT 50""", 'idx_papers_to_parse'),
+            ("""SELECT arxiv_id FROM papers
+                WHERE processed = 1 AND embedding_created = 0 AND duplicate_of IS NULL
+                  AND arxiv_id NOT IN (SELECT paper_id FROM embedding_retry_queue) LIMIT 50""",
+             'idx_papers_to_embed'),
+            ("""SELECT arxiv_id FROM papers
+                WHERE processed = 1 AND summary_generated = 0 AND duplicate_of IS NULL LIMIT 20""",
+             'idx_papers_to_summarize'),
+            ("""SELECT p.arxiv_id FROM papers p
+                LEFT JOIN paper_summaries ps ON p.arxiv_id = ps.paper_id
+                WHERE p.processed = 1 AND p.summary_generated = 0 AND p.duplicate_of IS NULL
+                  AND ps.paper_id IS NULL LIMIT 50""", 'idx_papers_to_summarize'),
+            ("SELECT arxiv_id FROM papers ORDER BY fetched_date DESC LIMIT 20", 'idx_papers_fetched'),
+            ("SELECT arxiv_id FROM papers ORDER BY published_date DESC LIMIT 20", 'idx_papers_published'),
+            ("SELECT paper_id FROM paper_summaries ORDER BY created_date DESC LIMIT 100", 'idx_summaries_created'),
+            ("""SELECT chunk_index, chunk_text, embedding, chunk_type FROM embeddings
+                WHERE paper_id = '' ORDER BY chunk_index""", 'idx_embeddings_paper_chunk'),
+        ]),
+        (4, 'corpus_stats counters kept by triggers', '_migrate_stats_counters', []),
+        (5, 'summary removal counter', '_migrate_summary_removals', []),
+    ]
+    SCHEMA_VERSION = _MIGRATIONS[-1][0]
+
+    def _run_migrations(self):
+        """Bring the schema up to SCHEMA_VERSION, recording progress in PRAGMA user_version"""
+        current = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if current > self.SCHEMA_VERSION:
+            logger.warning(f"Database schema v{current} is newer than this code (v{self.SCHEMA_VERSION})")
+            return
+
+        for version, description, method, _ in self._MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                self.cursor.execute("BEGIN IMMEDIATE")
+                getattr(self, method)()
+                self.cursor.execute(f"PRAGMA user_version = {version}")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                logger.error(f"Schema migration {version} ({description}) failed")
+                raise
+            logger.info(f"Applied schema migration {version}: {description}")
+
+    def explain_query_plan(self, sql: str, params: tuple = ()) -> List[str]:
+        """SQLite's EXPLAIN QUERY PLAN for a query, one line per plan step"""
+        self.cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[3] for row in self.cursor.fetchall()]
+
+    def query_uses_index(self, sql: str, index: str, params: tuple = ()) -> bool:
+        """True if the plan for sql reads through the named index"""
+        pattern = re.compile(rf'\bINDEX {re.escape(index)}\b')
+        return any(pattern.search(step) for step in self.explain_query_plan(sql, params))
+
+    def _migrate_paper_versions(self):
+        self._add_missing_columns('papers', {'version': 'INTEGER DEFAULT 1', 'duplicate_of': 'TEXT'})
+
+    def _migrate_query_indexes(self):
+        # Partial indexes hold only the papers waiting in each pipeline queue,
+        # so they stay small however large the archive grows; the WHERE
+        # clauses must match the queue queries term for term
+        self.cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_papers_to_parse ON papers(fetched_date)
+        WHERE processed = 0 AND pdf_downloaded = 1 AND duplicate_of IS NULL
+        """)
+        self.cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_papers_to_embed ON papers(fetched_date)
+        WHERE processed = 1 AND embedding_created = 0 AND duplicate_of IS NULL
+        """)
+        self.cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_papers_to_summarize ON papers(fetched_date)
+        WHERE processed = 1 AND summary_generated = 0 AND duplicate_of IS NULL
+        """)
+        # Listings newest first
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_papers_fetched ON papers(fetched_date)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_papers_published ON papers(published_date)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_summaries_created ON paper_summaries(created_date)")
+        # A plain processed index would win over the partial ones in the planner
+        self.cursor.execute("DROP INDEX IF EXISTS idx_papers_processed")
+        # Chunks of a paper in order, without a sort
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_paper_chunk ON embeddings(paper_id, chunk_index)")
+        self.cursor.execute("DROP INDEX IF EXISTS idx_embeddings_paper")
     
+    # corpus_stats column -> expression that recomputes it from the tables
+    _STATS_COUNTS = {
+        'total_papers': "SELECT COUNT(*) FROM papers",
+        'processed_papers': "SELECT COUNT(*) FROM papers WHERE processed = 1",
+        'papers_with_embeddings': "SELECT COUNT(*) FROM papers WHERE embedding_created = 1",
+        'papers_with_summaries': "SELECT COUNT(*) FROM papers WHERE summary_generated = 1",
+        'total_chunks': "SELECT COUNT(*) FROM embeddings",
+        'total_summaries': "SELECT COUNT(*) FROM paper_summaries",
+        'structure_score_sum': "SELECT COALESCE(SUM(structure_score), 0) FROM paper_summaries",
+        'structure_score_count': "SELECT COUNT(structure_score) FROM paper_summaries",
+    }
+
+    def _migrate_stats_counters(self):
+        # A single row of counters that triggers keep in step with every
+        # write, so the dashboard's stats are one row read instead of
+        # COUNT(*) scans; the average score is kept as a sum and a count
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS corpus_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_papers INTEGER NOT NULL DEFAULT 0,
+            processed_papers INTEGER NOT NULL DEFAULT 0,
+            papers_with_embeddings INTEGER NOT NULL DEFAULT 0,
+            papers_with_summaries INTEGER NOT NULL DEFAULT 0,
+            total_chunks INTEGER NOT NULL DEFAULT 0,
+            total_summaries INTEGER NOT NULL DEFAULT 0,
+            structure_score_sum REAL NOT NULL DEFAULT 0,
+            structure_score_count INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        self.cursor.execute("INSERT OR IGNORE INTO corpus_stats (id) VALUES (1)")
+
+        # Flag columns hold 0/1; IFNULL keeps a NULL flag from nulling the counter
+        flags = {'processed_papers': 'processed', 'papers_with_embeddings': 'embedding_created',
+                 'papers_with_summaries': 'summary_generated'}
+        added = ', '.join(f"{column} = {column} + IFNULL(new.{flag} = 1, 0)" for column, flag in flags.items())
+        removed = ', '.join(f"{column} = {column} - IFNULL(old.{flag} = 1, 0)" for column, flag in flags.items())
+        changed = ', '.join(f"{column} = {column} + IFNULL(new.{flag} = 1, 0) - IFNULL(old.{flag} = 1, 0)"
+                            for column, flag in flags.items())
+        score_added = ("structure_score_sum = structure_score_sum + IFNULL(new.structure_score, 0), "
+                       "structure_score_count = structure_score_count + (new.structure_score IS NOT NULL)")
+        score_removed = ("structure_score_sum = structure_score_sum - IFNULL(old.structure_score, 0), "
+                         "structure_score_count = structure_score_count - (old.structure_score IS NOT NULL)")
+
+        triggers = {
+            'trg_stats_papers_insert': ('AFTER INSERT ON papers', f"total_papers = total_papers + 1, {added}"),
+            'trg_stats_papers_delete': ('AFTER DELETE ON papers', f"total_papers = total_papers - 1, {removed}"),
+            'trg_stats_papers_update': ('AFTER UPDATE OF processed, embedding_created, summary_generated ON papers',
+                                        changed),
+            'trg_stats_embeddings_insert': ('AFTER INSERT ON embeddings', "total_chunks = total_chunks + 1"),
+            'trg_stats_embeddings_delete': ('AFTER DELETE ON embeddings', "total_chunks = total_chunks - 1"),
+            'trg_stats_summaries_insert': ('AFTER INSERT ON paper_summaries',
+                                           f"total_summaries = total_summaries + 1, {score_added}"),
+            'trg_stats_summaries_delete': ('AFTER DELETE ON paper_summaries',
+                                           f"total_summaries = total_summaries - 1, {score_removed}"),
+            'trg_stats_summaries_update': ('AFTER UPDATE OF structure_score ON paper_summaries',
+                                           f"{score_removed}, {score_added}"),
+        }
+        for name, (event, assignments) in triggers.items():
+            self.cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                UPDATE corpus_stats SET {assignments} WHERE id = 1;
+            END
+            """)
+
+        self._recount_stats()
+
+    def _migrate_summary_removals(self):
+        # Only ever increases (INSERT OR REPLACE counts too, recursive_triggers is on), so
+        # together with MAX(rowid) it tells readers whether paper_summaries only grew
+        self._add_missing_columns('corpus_stats', {'summaries_removed': 'INTEGER NOT NULL DEFAULT 0'})
+        self.cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_summaries_removed AFTER DELETE ON paper_summaries
+        BEGIN
+            UPDATE corpus_stats SET summaries_removed = summaries_removed + 1 WHERE id = 1;
+        END
+        """)
+
+    def _recount_stats(self):
+        """Recompute corpus_stats from the tables (one scan each)"""
+        self.cursor.execute(f"""
+        UPDATE corpus_stats SET {', '.join(f'{column} = ({query})' for column, query in self._STATS_COUNTS.items())}
+        WHERE id = 1
+        """)
+
+    def recount_stats(self) -> bool:
+        """Rebuild the counters, e.g. after editing the database with triggers disabled"""
+        try:
+            self._recount_stats()
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error recounting stats: {e}")
+            self.conn.rollback()
+            return False
+
+    def _add_missing_columns(self, table: str, columns: Dict[str, str]):
+        """Add columns introduced after a database was created"""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in self.cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+                logger.info(f"Added column {table}.{name}")
+
+    def _move_inline_content(self):
+        """Move full_text/sections of databases created before paper_content into it, then drop the columns"""
+        self.cursor.execute("PRAGMA table_info(papers)")
+        if 'full_text' not in {row[1] for row in self.cursor.fetchall()}:
+            return
+
+        read = self.conn.cursor()
+        read.execute("""
+        SELECT arxiv_id, full_text, sections FROM papers
+        WHERE full_text IS NOT NULL OR sections IS NOT NULL
+        """)
+        moved = 0
+        while True:
+            rows = read.fetchmany(200)
+            if not rows:
+                break
+            self.cursor.executemany("""
+            INSERT OR IGNORE INTO paper_content (paper_id, codec, full_text, sections, text_length)
+            VALUES (?, ?, ?, ?, ?)
+            """, [(arxiv_id, self.content_codec, compress_text(full_text, self.content_codec),
+                   compress_text(sections, self.content_codec), len(full_text or ''))
+                  for arxiv_id, full_text, sections in rows])
+            moved += len(rows)
+
+        for column in ('full_text', 'sections'):
+            try:
+                self.cursor.execute(f"ALTER TABLE papers DROP COLUMN {column}")
+            except sqlite3.OperationalError:
+                # SQLite before 3.35 cannot drop columns; emptying them frees the pages for reuse
+                self.cursor.execute(f"UPDATE papers SET {column} = NULL")
+        logger.info(f"Moved the content of {moved} papers to paper_content")
+
+    def _create_fts_tables(self):
+        """Create FTS5 indexes over paper titles/abstracts and chunk text, kept in sync by triggers"""
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('papers_fts', 'chunks_fts')")
+        existing = {row[0] for row in self.cursor.fetchall()}
+
+        # External-content tables: the text lives in papers / embeddings only
+        self.cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+            title, abstract,
+            content='papers', content_rowid='rowid',
+            tokenize='porter unicode61'
+        )
+        """)
+        self.cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+            chunk_text,
+            content='embeddings', content_rowid='id',
+            tokenize='porter unicode61'
+        )
+        """)
+
+        self.cursor.executescript("""
+        CREATE TRIGGER IF NOT EXISTS trg_papers_fts_insert AFTER INSERT ON papers BEGIN
+            INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.rowid, new.title, new.abstract);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_papers_fts_delete AFTER DELETE ON papers BEGIN
+            INSERT INTO papers_fts (papers_fts, rowid, title, abstract)
+            VALUES ('delete', old.rowid, old.title, old.abstract);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_papers_fts_update AFTER UPDATE OF title, abstract ON papers BEGIN
+            INSERT INTO papers_fts (papers_fts, rowid, title, abstract)
+            VALUES ('delete', old.rowid, old.title, old.abstract);
+            INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.rowid, new.title, new.abstract);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_chunks_fts_insert AFTER INSERT ON embeddings BEGIN
+            INSERT INTO chunks_fts (rowid, chunk_text) VALUES (new.id, new.chunk_text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_chunks_fts_delete AFTER DELETE ON embeddings BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, chunk_text) VALUES ('delete', old.id, old.chunk_text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_chunks_fts_update AFTER UPDATE OF chunk_text ON embeddings BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, chunk_text) VALUES ('delete', old.id, old.chunk_text);
+            INSERT INTO chunks_fts (rowid, chunk_text) VALUES (new.id, new.chunk_text);
+        END;
+        """)
+
+        # Index rows that existed before the FTS tables did
+        if 'papers_fts' not in existing:
+            self.cursor.execute("INSERT INTO papers_fts (papers_fts) VALUES ('rebuild')")
+        if 'chunks_fts' not in existing:
+            self.cursor.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+    def rebuild_search_index(self):
+        """Rebuild both FTS indexes from their content tables (e.g. after a VACUUM)"""
+        self.cursor.execute("INSERT INTO papers_fts (papers_fts) VALUES ('rebuild')")
+        self.cursor.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+        self.conn.commit()
+
+    @staticmethod
+    def _fts_query(text: str, operator: str = 'AND') -> str:
+        """Build a safe FTS5 MATCH expression from free text (terms are quoted)"""
+        terms = re.findall(r'\w+', text.lower())
+        return f' {operator} '.join(f'"{term}"' for term in terms)
+
+    def _run_with_budget(self, sql: str, params: tuple, budget_ms: Optional[float]) -> List:
+        """Run a read query on a dedicated connection, aborting it once budget_ms has passed"""
+        # Separate from the thread's main connection so the progress handler
+        # never interrupts anything but this query
+        conn = getattr(self._local, 'lexical_conn', None)
+        if conn is None:
+            conn = self._local.lexical_conn = self._connect()
+            conn.row_factory = None  # callers unpack plain tuples
+        if budget_ms is not None:
+            deadline = time.perf_counter() + budget_ms / 1000
+            conn.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            if 'interrupted' in str(e):
+                logger.warning(f"Lexical search exceeded its {budget_ms:.0f}ms budget")
+                return []
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def search_papers_bm25(self, query: str, limit: int = 50,
+                           budget_ms: Optional[float] = None) -> List[tuple]:
+        """Rank papers by BM25 over title (weighted x2) and abstract, returns (arxiv_id, score)"""
+        match = self._fts_query(query, 'OR')
+        if not match:
+            return []
+        return self._run_with_budget("""
+        SELECT p.arxiv_id, bm25(papers_fts, 2.0, 1.0) AS score
+        FROM papers_fts
+        JOIN papers p ON p.rowid = papers_fts.rowid
+        WHERE papers_fts MATCH ? AND p.duplicate_of IS NULL
+        ORDER BY score
+        LIMIT ?
+        """, (match, limit), budget_ms)
+
+    def search_chunks_bm25(self, query: str, limit: int = 50,
+                           budget_ms: Optional[float] = None) -> List[tuple]:
+        """Rank embedded chunks by BM25, returns (embedding row id, paper_id, score)"""
+        match = self._fts_query(query, 'OR')
+        if not match:
+            return []
+        return self._run_with_budget("""
+        SELECT e.id, e.paper_id, bm25(chunks_fts) AS score
+        FROM chunks_fts
+        JOIN embeddings e ON e.id = chunks_fts.rowid
+        WHERE chunks_fts MATCH ?
+        ORDER BY score
+        LIMIT ?
+        """, (match, limit), budget_ms)
+
     def insert_paper(self, paper_data: Dict) -> bool:
-        """Insert or update a paper"""
+        """Insert a paper under its canonical arXiv id, True if it is new.
+
+        A paper that is already stored keeps its row and processing state; a
+        newer version only refreshes the metadata.
+        """
+        return bool(self.insert_papers_bulk([paper_data]))
+
+    def insert_papers_bulk(self, papers: List[Dict]) -> List[str]:
+        """Insert many papers in one transaction, returns the canonical ids that were new.
+
+        Same version rules as insert_paper; when a batch holds several
+        versions of one paper the newest wins.
+        """
+        latest = {}
+        for paper_data in papers:
+            arxiv_id, version = canonical_arxiv_id(paper_data['arxiv_id'])
+            version = paper_data.get('version', version)
+            if arxiv_id not in latest or version > latest[arxiv_id][0]:
+                latest[arxiv_id] = (version, paper_data)
+
         try:
-            # Convert lists to JSON strings
-            authors = json.dumps(paper_data.get('authors', []))
-            categories = json.dumps(paper_data.get('categories', []))
-            
-            self.cursor.execute("""
-            INSERT OR REPLACE INTO papers (
+            existing = {}
+            ids = list(latest)
+            for start in range(0, len(ids), 900):
+                batch = ids[start:start + 900]
+                placeholders = ','.join('?' * len(batch))
+                self.cursor.execute(f"SELECT arxiv_id, version FROM papers WHERE arxiv_id IN ({placeholders})",
+                                    batch)
+                existing.update({row[0]: row[1] or 1 for row in self.cursor.fetchall()})
+
+            inserts, updates = [], []
+            for arxiv_id, (version, paper_data) in latest.items():
+                # Convert lists to JSON strings
+                authors = json.dumps(paper_data.get('authors', []))
+                categories = json.dumps(paper_data.get('categories', []))
+                if arxiv_id not in existing:
+                    inserts.append((arxiv_id, paper_data['title'], paper_data.get('abstract'), authors,
+                                    paper_data.get('published_date'), categories,
+                                    paper_data.get('pdf_url'), version))
+                elif version > existing[arxiv_id]:
+                    updates.append((paper_data['title'], paper_data.get('abstract'), authors, categories,
+                                    paper_data.get('pdf_url'), version, arxiv_id))
+
+            self.cursor.executemany("""
+            INSERT INTO papers (
                 arxiv_id, title, abstract, authors, published_date,
-                categories, pdf_url
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                paper_data['arxiv_id'],
-                paper_data['title'],
-                paper_data.get('abstract'),
-                authors,
-                paper_data.get('published_date'),
-                categories,
-                paper_data.get('pdf_url')
-            ))
-            
+                categories, pdf_url, version
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, inserts)
+            self.cursor.executemany("""
+            UPDATE papers
+            SET title = ?, abstract = ?, authors = ?, categories = ?, pdf_url = ?, version = ?
+            WHERE arxiv_id = ?
+            """, updates)
+
+            self.conn.commit()
+            for update in updates:
+                logger.info(f"Updated {update[-1]} to v{update[-2]}")
+            return [row[0] for row in inserts]
+        except Exception as e:
+            logger.error(f"Error inserting papers: {e}")
+            self.conn.rollback()
+            return []
+
+    def mark_duplicate(self, arxiv_id: str, duplicate_of: str) -> bool:
+        """Link a paper to the paper it duplicates; duplicates are skipped by every pipeline step"""
+        try:
+            self._mark_duplicates([(arxiv_id, duplicate_of)])
             self.conn.commit()
             return True
         except Exception as e:
-            logger.error(f"Error inserting paper: {e}")
+            logger.error(f"Error marking duplicate: {e}")
+            self.conn.rollback()
+            return False
+
+    def _mark_duplicates(self, duplicates: List[tuple]):
+        self.cursor.executemany("UPDATE papers SET duplicate_of = ? WHERE arxiv_id = ?",
+                                [(duplicate_of, arxiv_id) for arxiv_id, duplicate_of in duplicates])
+
+    def find_minhash_candidates(self, field: str, buckets: List[tuple]) -> Dict[str, np.ndarray]:
+        """Signatures of papers sharing at least one LSH (band, bucket) with the given keys"""
+        if not buckets:
+            return {}
+        matches = ' OR '.join(['(b.band = ? AND b.bucket = ?)'] * len(buckets))
+        self.cursor.execute(f"""
+        SELECT DISTINCT m.paper_id, m.signature
+        FROM minhash_buckets b
+        JOIN paper_minhash m ON m.paper_id = b.paper_id AND m.field = b.field
+        WHERE b.field = ? AND ({matches})
+        """, [field] + [value for key in buckets for value in key])
+        return {row[0]: np.frombuffer(row[1], dtype='<u4') for row in self.cursor.fetchall()}
+
+    def store_minhash(self, paper_id: str, field: str, signature: np.ndarray, buckets: List[tuple]) -> bool:
+        """Store a paper's MinHash signature and LSH buckets for one field"""
+        try:
+            self.cursor.execute("DELETE FROM minhash_buckets WHERE field = ? AND paper_id = ?", (field, paper_id))
+            self.cursor.execute("""
+            INSERT OR REPLACE INTO paper_minhash (paper_id, field, signature) VALUES (?, ?, ?)
+            """, (paper_id, field, np.asarray(signature, dtype='<u4').tobytes()))
+            self.cursor.executemany("""
+            INSERT OR IGNORE INTO minhash_buckets (field, band, bucket, paper_id) VALUES (?, ?, ?, ?)
+            """, [(field, band, bucket, paper_id) for band, bucket in buckets])
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error storing MinHash signature: {e}")
             self.conn.rollback()
             return False
     
-    def update_paper_content(self, arxiv_id: str, full_text: str, sections: Dict) -> bool:
+    def update_paper_content(self, arxiv_id: str, full_text: str, sections: Dict,
+                             duplicate_of: Optional[str] = None) -> bool:
         """Update paper with parsed content"""
+        return self.update_paper_contents_bulk([(arxiv_id, full_text, sections)],
+                                               [(arxiv_id, duplicate_of)] if duplicate_of else [])
+
+    def update_paper_contents_bulk(self, contents: List[tuple], duplicates: List[tuple] = ()) -> bool:
+        """Store parsed (arxiv_id, full_text, sections) for many papers in one transaction,
+        along with (arxiv_id, duplicate_of) links for the ones that duplicate another paper"""
+        codec = self.content_codec
         try:
-            sections_json = json.dumps(sections)
-            
-            self.cursor.execute("""
-            UPDATE papers 
-            SET full_text = ?, sections = ?, processed = 1
-            WHERE arxiv_id = ?
-            """, (full_text, sections_json, arxiv_id))
+            self.cursor.executemany("""
+            INSERT OR REPLACE INTO paper_content (paper_id, codec, full_text, sections, text_length)
+            VALUES (?, ?, ?, ?, ?)
+            """, [(arxiv_id, codec, compress_text(full_text, codec), compress_text(json.dumps(sections), codec),
+                   len(full_text or '')) for arxiv_id, full_text, sections in contents])
+            self.cursor.executemany("""
+            UPDATE papers SET processed = 1 WHERE arxiv_id = ?
+            """, [(arxiv_id,) for arxiv_id, _, _ in contents])
+            self._mark_duplicates(duplicates)
             
             self.conn.commit()
             return True
         except Exception as e:
-            logger.error(f"Error updating paper: {e}")
+            logger.error(f"Error updating papers: {e}")
+            self.conn.rollback()
             return False
     
-    def get_paper(self, arxiv_id: str) -> Optional[Dict]:
-        """Get complete paper data"""
-        self.cursor.execute("SELECT * FROM papers WHERE arxiv_id = ?", (arxiv_id,))
+    # Metadata columns of papers; listings never touch paper_content
+    _PAPER_COLUMNS = """arxiv_id, title, abstract, authors, published_date, categories, pdf_url,
+        pdf_downloaded, processed, embedding_created, summary_generated, fetched_date,
+        version, duplicate_of"""
+
+    def get_paper(self, arxiv_id: str, content: tuple = ()) -> Optional[Dict]:
+        """Get paper metadata, plus the content fields named in `content`
+        ('full_text', 'sections'), which are decompressed only when asked for"""
+        self.cursor.execute(f"SELECT {self._PAPER_COLUMNS} FROM papers WHERE arxiv_id = ?", (arxiv_id,))
         row = self.cursor.fetchone()
         
         if not row:
@@ -165,15 +874,83 @@ class DatabaseManager:
         # Parse JSON fields
         paper['authors'] = json.loads(paper['authors']) if paper['authors'] else []
         paper['categories'] = json.loads(paper['categories']) if paper['categories'] else []
-        paper['sections'] = json.loads(paper['sections']) if paper['sections'] else {}
+        if content:
+            paper.update(self.get_paper_content(arxiv_id, content))
         
         return paper
+
+    def get_paper_content(self, arxiv_id: str, fields: tuple = ('full_text', 'sections')) -> Dict:
+        """Decompressed full_text and/or sections of a parsed paper (None / {} if not parsed)"""
+        content = {'full_text': None, 'sections': {}}
+        columns = [field for field in ('full_text', 'sections') if field in fields]
+        if columns:
+            self.cursor.execute(f"SELECT codec, {', '.join(columns)} FROM paper_content WHERE paper_id = ?",
+                                (arxiv_id,))
+            row = self.cursor.fetchone()
+            if row:
+                if 'full_text' in columns:
+                    content['full_text'] = decompress_text(row['full_text'], row['codec'])
+                if 'sections' in columns:
+                    sections = decompress_text(row['sections'], row['codec'])
+                    content['sections'] = json.loads(sections) if sections else {}
+        return {field: content[field] for field in columns}
     
+    def get_papers_brief(self, arxiv_ids: List[str]) -> Dict[str, Dict]:
+        """Get display columns (no full text) and summary availability for several papers"""
+        papers = {}
+        arxiv_ids = list(arxiv_ids)
+        for start in range(0, len(arxiv_ids), 900):
+            batch = arxiv_ids[start:start + 900]
+            placeholders = ','.join('?' * len(batch))
+            self.cursor.execute(f"""
+            SELECT p.arxiv_id, p.title, p.abstract, p.published_date,
+                   ps.paper_id IS NOT NULL AS has_summary
+            FROM papers p
+            LEFT JOIN paper_summaries ps ON ps.paper_id = p.arxiv_id
+            WHERE p.arxiv_id IN ({placeholders})
+            """, batch)
+            papers.update({row['arxiv_id']: dict(row) for row in self.cursor.fetchall()})
+
+        return papers
+
+    def get_paper_filter_metadata(self, arxiv_ids: List[str]) -> Dict[str, tuple]:
+        """Search filter columns per paper: (categories, published_date, has_summary)"""
+        metadata = {}
+        arxiv_ids = list(arxiv_ids)
+        for start in range(0, len(arxiv_ids), 900):
+            batch = arxiv_ids[start:start + 900]
+            placeholders = ','.join('?' * len(batch))
+            self.cursor.execute(f"""
+            SELECT p.arxiv_id, p.categories, p.published_date,
+                   ps.paper_id IS NOT NULL AS has_summary
+            FROM papers p
+            LEFT JOIN paper_summaries ps ON ps.paper_id = p.arxiv_id
+            WHERE p.arxiv_id IN ({placeholders})
+            """, batch)
+            for row in self.cursor.fetchall():
+                categories = json.loads(row['categories']) if row['categories'] else []
+                metadata[row['arxiv_id']] = (categories, row['published_date'], bool(row['has_summary']))
+        return metadata
+
+    def get_summarized_paper_ids(self, after_rowid: int = 0) -> List[str]:
+        """Ids of papers that have a structured summary, limited to summaries stored after `after_rowid`"""
+        self.cursor.execute("SELECT paper_id FROM paper_summaries WHERE rowid > ?", (after_rowid,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_summary_watermark(self) -> tuple:
+        """(summaries_removed, highest paper_summaries rowid); while the first stays
+        the same, summaries were only added, each with a rowid above the second"""
+        self.cursor.execute("""
+        SELECT summaries_removed, (SELECT COALESCE(MAX(rowid), 0) FROM paper_summaries)
+        FROM corpus_stats WHERE id = 1
+        """)
+        return tuple(self.cursor.fetchone())
+
     def get_unprocessed_papers(self, limit: int = 50) -> List[Dict]:
         """Get papers that need processing"""
-        self.cursor.execute("""
-        SELECT * FROM papers
-        WHERE processed = 0 AND pdf_downloaded = 1
+        self.cursor.execute(f"""
+        SELECT {self._PAPER_COLUMNS} FROM papers
+        WHERE processed = 0 AND pdf_downloaded = 1 AND duplicate_of IS NULL
         ORDER BY fetched_date DESC
         LIMIT ?
         """, (limit,))
@@ -188,10 +965,12 @@ class DatabaseManager:
         return papers
     
     def get_papers_for_summarization(self, limit: int = 20) -> List[Dict]:
-        """Get papers ready for Nikita's summarization"""
-        self.cursor.execute("""
-        SELECT * FROM papers
-        WHERE processed = 1 AND summary_generated = 0 AND full_text IS NOT NULL
+        """Get papers ready for Nikita's summarization (metadata only; see get_paper_content)"""
+        self.cursor.execute(f"""
+        SELECT {self._PAPER_COLUMNS} FROM papers
+        WHERE processed = 1 AND summary_generated = 0 AND duplicate_of IS NULL
+          AND EXISTS (SELECT 1 FROM paper_content pc WHERE pc.paper_id = papers.arxiv_id
+                      AND pc.text_length > 0)
         LIMIT ?
         """, (limit,))
         
@@ -200,43 +979,80 @@ class DatabaseManager:
             paper = dict(row)
             paper['authors'] = json.loads(paper['authors']) if paper['authors'] else []
             paper['categories'] = json.loads(paper['categories']) if paper['categories'] else []
-            paper['sections'] = json.loads(paper['sections']) if paper['sections'] else {}
             papers.append(paper)
         
         return papers
     
     def store_embedding(self, paper_id: str, chunk_index: int, 
-                       chunk_text: str, embedding: List[float], chunk_type: str) -> bool:
-        """Store embedding for a chunk"""
+                       chunk_text: str, embedding: List[float], chunk_type: str,
+                       mark_created: bool = True) -> bool:
+        """Store embedding for a chunk (mark_created=False leaves the paper flag to the caller)"""
+        return self.store_embeddings_bulk([(paper_id, chunk_index, chunk_text, embedding, chunk_type)],
+                                          mark_created=mark_created)
+
+    def store_embeddings_bulk(self, rows: List[tuple], mark_created: bool = False) -> bool:
+        """Store (paper_id, chunk_index, chunk_text, embedding, chunk_type) rows in one transaction.
+
+        mark_created sets embedding_created once per paper, not once per chunk.
+        """
         try:
-            import pickle
-            embedding_blob = pickle.dumps(embedding)
+            self._insert_embeddings(rows)
             
-            self.cursor.execute("""
-            INSERT INTO embeddings (paper_id, chunk_index, chunk_text, embedding, chunk_type)
-            VALUES (?, ?, ?, ?, ?)
-            """, (paper_id, chunk_index, chunk_text, embedding_blob, chunk_type))
-            
-            # Mark paper as having embeddings
-            self.cursor.execute("""
-            UPDATE papers SET embedding_created = 1 WHERE arxiv_id = ?
-            """, (paper_id,))
+            # Mark papers as having embeddings
+            if mark_created:
+                self.cursor.executemany("""
+                UPDATE papers SET embedding_created = 1 WHERE arxiv_id = ?
+                """, [(paper_id,) for paper_id in sorted({row[0] for row in rows})])
             
             self.conn.commit()
             return True
         except Exception as e:
-            logger.error(f"Error storing embedding: {e}")
+            logger.error(f"Error storing embeddings: {e}")
+            self.conn.rollback()
             return False
     
+    def store_embedding_batch(self, rows: List[tuple], failed: List[Dict], error: str, base_delay: float,
+                              resolved: List[tuple] = (), complete: List[str] = ()) -> Optional[int]:
+        """Store embedding rows and the retry queue changes they imply in one transaction.
+
+        rows are as in store_embeddings_bulk, failed chunks are queued as in
+        queue_embedding_retries, resolved (paper_id, chunk_index) keys leave the
+        queue, and complete papers are marked as in mark_embeddings_created.
+        Returns the number of papers marked, None if nothing was written.
+        """
+        try:
+            self._insert_embeddings(rows)
+            self._delete_embedding_retries(resolved)
+            self._queue_embedding_retries(failed, error, base_delay)
+            marked = self._mark_embeddings_created(complete)
+            self.conn.commit()
+            return marked
+        except Exception as e:
+            logger.error(f"Error storing embedding batch: {e}")
+            self.conn.rollback()
+            return None
+
+    def _insert_embeddings(self, rows: List[tuple]):
+        self.cursor.executemany("""
+        INSERT INTO embeddings (paper_id, chunk_index, chunk_text, embedding, chunk_type)
+        VALUES (?, ?, ?, ?, ?)
+        """, [(paper_id, chunk_index, chunk_text, encode_embedding(embedding), chunk_type)
+              for paper_id, chunk_index, chunk_text, embedding, chunk_type in rows])
+
     def search_papers(self, query: str, limit: int = 10) -> List[Dict]:
-        """Simple text search in papers"""
+        """Full-text search in paper titles and abstracts, best BM25 match first"""
+        match = self._fts_query(query)
+        if not match:
+            return []
+
         self.cursor.execute("""
-        SELECT arxiv_id, title, abstract, published_date
-        FROM papers
-        WHERE (title LIKE ? OR abstract LIKE ?) AND processed = 1
-        ORDER BY published_date DESC
+        SELECT p.arxiv_id, p.title, p.abstract, p.published_date
+        FROM papers_fts
+        JOIN papers p ON p.rowid = papers_fts.rowid
+        WHERE papers_fts MATCH ? AND p.processed = 1 AND p.duplicate_of IS NULL
+        ORDER BY bm25(papers_fts, 2.0, 1.0)
         LIMIT ?
-        """, (f"%{query}%", f"%{query}%", limit))
+        """, (match, limit))
         
         return [dict(row) for row in self.cursor.fetchall()]
     
@@ -267,18 +1083,573 @@ class DatabaseManager:
         ORDER BY chunk_index
         """, (paper_id,))
         
-        import pickle
         embeddings = []
         for row in self.cursor.fetchall():
             embeddings.append({
                 'chunk_index': row[0],
                 'chunk_text': row[1],
-                'embedding': pickle.loads(row[2]) if row[2] else None,
+                'embedding': decode_embedding(row[2]) if row[2] else None,
                 'chunk_type': row[3]
             })
         
         return embeddings
-    
+
+    def iter_embedding_rows(self, after_id: int = 0, batch_size: int = 5000):
+        """Yield batches of (id, paper_id, chunk_index, embedding) for rows with id > after_id"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+        SELECT id, paper_id, chunk_index, embedding
+        FROM embeddings
+        WHERE id > ? AND embedding IS NOT NULL
+        ORDER BY id
+        """, (after_id,))
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [(row[0], row[1], row[2], decode_embedding(row[3])) for row in rows]
+
+    def get_embedding_vectors(self, row_ids) -> np.ndarray:
+        """Get float32 vectors for specific embedding rows, in the order given"""
+        row_ids = [int(row_id) for row_id in row_ids]
+        if not row_ids:
+            return np.empty((0, 0), dtype=np.float32)
+
+        found = {}
+        for start in range(0, len(row_ids), 900):
+            batch = row_ids[start:start + 900]
+            placeholders = ','.join('?' * len(batch))
+            self.cursor.execute(f"""
+            SELECT id, embedding FROM embeddings WHERE id IN ({placeholders})
+            """, batch)
+            found.update({row[0]: decode_embedding(row[1]) for row in self.cursor.fetchall() if row[1]})
+
+        dim = len(next(iter(found.values()))) if found else 0
+        vectors = np.zeros((len(row_ids), dim), dtype=np.float32)
+        for i, row_id in enumerate(row_ids):
+            if row_id in found:
+                vectors[i] = found[row_id]
+        return vectors
+
+    def get_cached_query_embedding(self, model: str, query: str,
+                                   max_age_seconds: float) -> Optional[np.ndarray]:
+        """Get a cached query embedding if present and not expired"""
+        now = time.time()
+        self.cursor.execute("""
+        SELECT embedding FROM query_embedding_cache
+        WHERE model = ? AND query = ? AND created_at >= ?
+        """, (model, query, now - max_age_seconds))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
+
+        try:
+            self.cursor.execute("""
+            UPDATE query_embedding_cache SET last_used = ? WHERE model = ? AND query = ?
+            """, (now, model, query))
+            self.conn.commit()
+        except Exception as e:
+            logger.warning(f"Could not touch query cache entry: {e}")
+        return decode_embedding(row[0])
+
+    def store_cached_query_embedding(self, model: str, query: str, embedding,
+                                     max_entries: int, max_age_seconds: float) -> bool:
+        """Cache a query embedding, evicting expired and least recently used entries"""
+        now = time.time()
+        try:
+            self.cursor.execute("""
+            INSERT OR REPLACE INTO query_embedding_cache (model, query, embedding, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?)
+            """, (model, query, encode_embedding(embedding), now, now))
+
+            self.cursor.execute("DELETE FROM query_embedding_cache WHERE created_at < ?",
+                                (now - max_age_seconds,))
+            self.cursor.execute("""
+            DELETE FROM query_embedding_cache WHERE rowid IN (
+                SELECT rowid FROM query_embedding_cache
+                ORDER BY last_used DESC
+                LIMIT -1 OFFSET ?
+            )
+            """, (max_entries,))
+
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error caching query embedding: {e}")
+            self.conn.rollback()
+            return False
+
+    def mark_embeddings_created(self, paper_ids: List[str]) -> int:
+        """Set embedding_created for papers that have no chunks waiting in the retry queue"""
+        try:
+            marked = self._mark_embeddings_created(paper_ids)
+            self.conn.commit()
+            return marked
+        except Exception as e:
+            logger.error(f"Error marking embeddings created: {e}")
+            self.conn.rollback()
+            return 0
+
+    def _mark_embeddings_created(self, paper_ids: List[str]) -> int:
+        self.cursor.executemany("""
+        UPDATE papers SET embedding_created = 1
+        WHERE arxiv_id = ?
+          AND NOT EXISTS (SELECT 1 FROM embedding_retry_queue WHERE paper_id = papers.arxiv_id)
+        """, [(paper_id,) for paper_id in paper_ids])
+        return max(self.cursor.rowcount, 0)
+
+    # Pipeline status flags that set_paper_flag may change
+    _STATUS_FLAGS = ('pdf_downloaded', 'processed', 'embedding_created', 'summary_generated')
+
+    def set_paper_flag(self, paper_ids: List[str], flag: str, value: bool = True,
+                       duplicates: List[tuple] = ()) -> bool:
+        """Set one pipeline status flag for many papers in one transaction, along with
+        (arxiv_id, duplicate_of) links found while processing the same batch"""
+        if flag not in self._STATUS_FLAGS:
+            raise ValueError(f"Unknown status flag '{flag}', expected one of {self._STATUS_FLAGS}")
+        try:
+            self.cursor.executemany(f"UPDATE papers SET {flag} = ? WHERE arxiv_id = ?",
+                                    [(int(value), paper_id) for paper_id in paper_ids])
+            self._mark_duplicates(duplicates)
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error setting {flag}: {e}")
+            self.conn.rollback()
+            return False
+
+    def queue_embedding_retries(self, chunks: List[Dict], error: str, base_delay: float) -> bool:
+        """Add failed chunks ({paper_id, index, text, type}) to the retry queue.
+
+        Chunks already queued get one more attempt counted and a doubled delay.
+        """
+        try:
+            self._queue_embedding_retries(chunks, error, base_delay)
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error queueing embedding retries: {e}")
+            self.conn.rollback()
+            return False
+
+    def _queue_embedding_retries(self, chunks: List[Dict], error: str, base_delay: float):
+        now = time.time()
+        self.cursor.executemany("""
+        INSERT INTO embedding_retry_queue
+            (paper_id, chunk_index, chunk_text, chunk_type, attempts, next_attempt, last_error, created_at)
+        VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+        ON CONFLICT (paper_id, chunk_index) DO UPDATE SET
+            chunk_text = excluded.chunk_text,
+            attempts = attempts + 1,
+            next_attempt = ? + ? * (1 << MIN(attempts, 16)),
+            last_error = excluded.last_error
+        """, [(chunk['paper_id'], chunk['index'], chunk['text'], chunk.get('type'),
+               now + base_delay, error, now, now, base_delay) for chunk in chunks])
+
+    def get_due_embedding_retries(self, limit: int, max_attempts: int) -> List[Dict]:
+        """Queued chunks whose next attempt is due, oldest first"""
+        self.cursor.execute("""
+        SELECT paper_id, chunk_index AS "index", chunk_text AS text, chunk_type AS type, attempts
+        FROM embedding_retry_queue
+        WHERE next_attempt <= ? AND attempts < ?
+        ORDER BY next_attempt
+        LIMIT ?
+        """, (time.time(), max_attempts, limit))
+        return [dict(row) for row in self.cursor.fetchall()]
+
+    def delete_embedding_retries(self, keys: List[tuple]) -> bool:
+        """Remove (paper_id, chunk_index) entries from the retry queue"""
+        try:
+            self._delete_embedding_retries(keys)
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error removing embedding retries: {e}")
+            self.conn.rollback()
+            return False
+
+    def _delete_embedding_retries(self, keys: List[tuple]):
+        self.cursor.executemany("""
+        DELETE FROM embedding_retry_queue WHERE paper_id = ? AND chunk_index = ?
+        """, keys)
+
+    def get_embedding_retry_stats(self, max_attempts: int) -> Dict:
+        """Queued chunks still being retried and ones that exhausted their attempts"""
+        self.cursor.execute("""
+        SELECT COALESCE(SUM(attempts < ?), 0), COALESCE(SUM(attempts >= ?), 0)
+        FROM embedding_retry_queue
+        """, (max_attempts, max_attempts))
+        pending, exhausted = self.cursor.fetchone()
+        return {'pending': pending, 'exhausted': exhausted}
+
+    def get_cached_embeddings(self, content_hashes: List[str]) -> Dict[str, tuple]:
+        """Cached chunk embeddings by content hash: {hash: (vector, token_count)}"""
+        cached = {}
+        content_hashes = list(content_hashes)
+        for start in range(0, len(content_hashes), 900):
+            batch = content_hashes[start:start + 900]
+            placeholders = ','.join('?' * len(batch))
+            self.cursor.execute(f"""
+            SELECT content_hash, embedding, token_count FROM embedding_cache
+            WHERE content_hash IN ({placeholders})
+            """, batch)
+            for content_hash, blob, token_count in self.cursor.fetchall():
+                cached[content_hash] = (decode_embedding(blob), token_count)
+        return cached
+
+    def store_cached_embeddings(self, model: str, entries: List[tuple]) -> bool:
+        """Cache chunk embeddings given as (content_hash, vector, token_count) tuples"""
+        now = time.time()
+        try:
+            self.cursor.executemany("""
+            INSERT OR REPLACE INTO embedding_cache (content_hash, model, embedding, token_count, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """, [(content_hash, model, encode_embedding(vector), token_count, now)
+                  for content_hash, vector, token_count in entries])
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error caching chunk embeddings: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_chunk_vectors_for_papers(self, paper_ids: List[str]) -> Dict[str, List[tuple]]:
+        """Stored chunk vectors per paper: {paper_id: [(chunk_type, vector), ...]}"""
+        chunks = {}
+        paper_ids = list(paper_ids)
+        for start in range(0, len(paper_ids), 900):
+            batch = paper_ids[start:start + 900]
+            placeholders = ','.join('?' * len(batch))
+            self.cursor.execute(f"""
+            SELECT paper_id, chunk_type, embedding FROM embeddings
+            WHERE paper_id IN ({placeholders}) AND embedding IS NOT NULL
+            ORDER BY paper_id, chunk_index
+            """, batch)
+            for paper_id, chunk_type, blob in self.cursor.fetchall():
+                chunks.setdefault(paper_id, []).append((chunk_type, decode_embedding(blob)))
+        return chunks
+
+    def store_paper_centroids(self, entries: List[tuple]) -> bool:
+        """Store paper centroids given as (paper_id, vector, chunk_count) tuples"""
+        now = time.time()
+        try:
+            self.cursor.executemany("""
+            INSERT OR REPLACE INTO paper_centroids (paper_id, centroid, chunk_count, updated_at)
+            VALUES (?, ?, ?, ?)
+            """, [(paper_id, encode_embedding(vector), chunk_count, now)
+                  for paper_id, vector, chunk_count in entries])
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error storing paper centroids: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_stale_centroid_papers(self) -> List[str]:
+        """Papers whose centroid is missing or was computed from a different set of chunks"""
+        self.cursor.execute("""
+        SELECT e.paper_id
+        FROM (SELECT paper_id, COUNT(*) AS n FROM embeddings
+              WHERE embedding IS NOT NULL GROUP BY paper_id) e
+        LEFT JOIN paper_centroids c ON c.paper_id = e.paper_id
+        WHERE c.paper_id IS NULL OR c.chunk_count != e.n
+        """)
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_max_centroid_rowid(self) -> int:
+        """Highest paper_centroids rowid; INSERT OR REPLACE gives every stored centroid a new one"""
+        self.cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM paper_centroids")
+        return self.cursor.fetchone()[0]
+
+    def iter_paper_centroids(self, after_rowid: int = 0, batch_size: int = 5000):
+        """Yield batches of (paper_id, centroid) for papers that still have embeddings,
+        limited to centroids stored after `after_rowid`"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+        SELECT paper_id, centroid FROM paper_centroids
+        WHERE rowid > ? AND paper_id IN (SELECT paper_id FROM embeddings)
+        ORDER BY rowid
+        """, (after_rowid,))
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [(row[0], decode_embedding(row[1])) for row in rows]
+
+    def get_papers_missing_neighbors(self) -> List[str]:
+        """Papers with a centroid newer than their neighbour list (or no list yet)"""
+        self.cursor.execute("""
+        SELECT c.paper_id
+        FROM paper_centroids c
+        LEFT JOIN (SELECT paper_id, MAX(updated_at) AS updated_at
+                   FROM paper_neighbors GROUP BY paper_id) n ON n.paper_id = c.paper_id
+        WHERE n.paper_id IS NULL OR c.updated_at > n.updated_at
+        """)
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_paper_neighbors(self, paper_ids: Optional[List[str]] = None) -> Dict[str, List[tuple]]:
+        """Neighbour lists, best first: {paper_id: [(neighbor_id, similarity), ...]} (all papers if None)"""
+        if paper_ids is None:
+            batches = [None]
+        else:
+            paper_ids = list(paper_ids)
+            batches = [paper_ids[start:start + 900] for start in range(0, len(paper_ids), 900)]
+
+        neighbors = {}
+        for batch in batches:
+            where = '' if batch is None else f"WHERE paper_id IN ({','.join('?' * len(batch))})"
+            self.cursor.execute(f"""
+            SELECT paper_id, neighbor_id, similarity FROM paper_neighbors
+            {where}
+            ORDER BY paper_id, similarity DESC
+            """, batch or [])
+            for paper_id, neighbor_id, similarity in self.cursor.fetchall():
+                neighbors.setdefault(paper_id, []).append((neighbor_id, similarity))
+        return neighbors
+
+    def replace_paper_neighbors(self, graph: Dict[str, List[tuple]]) -> bool:
+        """Replace the neighbour lists of these papers in one transaction"""
+        now = time.time()
+        try:
+            self.cursor.executemany("DELETE FROM paper_neighbors WHERE paper_id = ?",
+                                    [(paper_id,) for paper_id in graph])
+            self.cursor.executemany("""
+            INSERT INTO paper_neighbors (paper_id, neighbor_id, similarity, updated_at)
+            VALUES (?, ?, ?, ?)
+            """, [(paper_id, neighbor_id, similarity, now)
+                  for paper_id, edges in graph.items() for neighbor_id, similarity in edges])
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error storing paper neighbours: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_topic_centroids(self) -> Optional[tuple]:
+        """Stored topic centroids and absorbed counts as arrays, None if there are none"""
+        self.cursor.execute("SELECT centroid, absorbed FROM topic_clusters ORDER BY cluster_id")
+        rows = self.cursor.fetchall()
+        if not rows:
+            return None
+        try:
+            centroids = np.vstack([decode_embedding(row[0]) for row in rows])
+        except ValueError:  # mixed dimensions, e.g. after switching embedding provider
+            return None
+        return centroids, np.array([row[1] for row in rows], dtype=np.int64)
+
+    def store_topic_clusters(self, centroids: np.ndarray, absorbed, sizes, labels: List[str]) -> bool:
+        """Replace all topic clusters"""
+        now = time.time()
+        try:
+            self.cursor.execute("DELETE FROM topic_clusters")
+            self.cursor.executemany("""
+            INSERT INTO topic_clusters (cluster_id, centroid, absorbed, size, label, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, [(cluster_id, encode_embedding(centroid), int(count), int(size), label, now)
+                  for cluster_id, (centroid, count, size, label)
+                  in enumerate(zip(centroids, absorbed, sizes, labels))])
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error storing topic clusters: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_topic_clusters(self) -> List[Dict]:
+        """Topic labels and paper counts, largest first"""
+        self.cursor.execute("""
+        SELECT cluster_id, label, size FROM topic_clusters
+        WHERE size > 0
+        ORDER BY size DESC
+        """)
+        return [dict(row) for row in self.cursor.fetchall()]
+
+    def get_papers_missing_topics(self) -> List[str]:
+        """Papers with a centroid newer than their topic assignment (or no assignment yet)"""
+        self.cursor.execute("""
+        SELECT c.paper_id
+        FROM paper_centroids c
+        LEFT JOIN paper_topics t ON t.paper_id = c.paper_id
+        WHERE t.paper_id IS NULL OR c.updated_at > t.updated_at
+        """)
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_paper_topics(self) -> Dict[str, int]:
+        """Current topic of every assigned paper: {paper_id: cluster_id}"""
+        self.cursor.execute("SELECT paper_id, cluster_id FROM paper_topics")
+        return {row[0]: row[1] for row in self.cursor.fetchall()}
+
+    def store_paper_topics(self, entries: List[tuple]) -> bool:
+        """Store topic assignments given as (paper_id, cluster_id, similarity) tuples"""
+        now = time.time()
+        try:
+            self.cursor.executemany("""
+            INSERT OR REPLACE INTO paper_topics (paper_id, cluster_id, similarity, updated_at)
+            VALUES (?, ?, ?, ?)
+            """, [(paper_id, int(cluster_id), float(similarity), now)
+                  for paper_id, cluster_id, similarity in entries])
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error storing paper topics: {e}")
+            self.conn.rollback()
+            return False
+
+    def migrate_embedding_blobs(self, batch_size: int = 500) -> Dict:
+        """Convert legacy pickled embeddings to the binary format in one transaction.
+
+        Rows are read and rewritten in batches of batch_size, but committed
+        together: every rewrite fires trg_embeddings_update_generation, and
+        vector caches should see the generation move once, not once per row.
+        Safe to interrupt and re-run: an interrupted run is rolled back.
+        """
+        results = {'converted': 0, 'failed': [], 'batches': 0}
+        last_id = 0
+
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            generation = self.get_embedding_generation()
+            while True:
+                self.cursor.execute("""
+                SELECT id, embedding FROM embeddings
+                WHERE id > ? AND embedding IS NOT NULL AND substr(embedding, 1, 4) != ?
+                ORDER BY id
+                LIMIT ?
+                """, (last_id, EMBEDDING_MAGIC, batch_size))
+                rows = self.cursor.fetchall()
+                if not rows:
+                    break
+
+                updates = []
+                for row_id, blob in rows:
+                    try:
+                        updates.append((encode_embedding(decode_embedding(blob)), row_id))
+                    except Exception as e:
+                        logger.error(f"Could not convert embedding {row_id}: {e}")
+                        results['failed'].append(row_id)
+
+                self.cursor.executemany("UPDATE embeddings SET embedding = ? WHERE id = ?", updates)
+                last_id = rows[-1][0]
+                results['converted'] += len(updates)
+                results['batches'] += 1
+                logger.info(f"Converted {results['converted']} embeddings (last id {last_id})")
+
+            # Undo the per-row bumps: one rewrite of the table, one new generation
+            if results['converted']:
+                self.cursor.execute("UPDATE embedding_generation SET generation = ? WHERE id = 1",
+                                    (generation + 1,))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Embedding migration failed after id {last_id}, nothing was converted: {e}")
+            raise
+
+        return results
+
+    # Tables whose paper_id column follows a paper's id
+    _PAPER_ID_COLUMNS = [
+        ('embeddings', 'paper_id'), ('paper_summaries', 'paper_id'), ('embedding_retry_queue', 'paper_id'),
+        ('paper_centroids', 'paper_id'), ('paper_neighbors', 'paper_id'), ('paper_neighbors', 'neighbor_id'),
+        ('paper_topics', 'paper_id'), ('paper_minhash', 'paper_id'), ('minhash_buckets', 'paper_id'),
+        ('paper_content', 'paper_id')
+    ]
+
+    def migrate_canonical_ids(self) -> Dict:
+        """Rename versioned paper ids (2512.01537v2) to canonical ids, one paper per transaction.
+
+        When several versions of a paper are stored, the newest (or a row
+        already under the canonical id) keeps the canonical id; the others are linked to it with duplicate_of and their
+        chunks and derived rows are dropped so they leave search results.
+        Safe to re-run.
+        """
+        results = {'renamed': {}, 'duplicates': 0, 'failed': []}
+
+        self.cursor.execute("SELECT arxiv_id, version FROM papers WHERE duplicate_of IS NULL")
+        versions = {}
+        for arxiv_id, stored_version in self.cursor.fetchall():
+            canonical, version = canonical_arxiv_id(arxiv_id)
+            # A row already under its canonical id knows its version from the column
+            versions.setdefault(canonical, []).append(
+                (arxiv_id == canonical, version if arxiv_id != canonical else (stored_version or 1), arxiv_id))
+
+        for canonical, rows in versions.items():
+            if all(is_canonical for is_canonical, _, _ in rows):
+                continue
+            rows.sort(reverse=True)
+            _, version, keep = rows[0]
+            try:
+                if keep != canonical:
+                    self.cursor.execute("UPDATE papers SET arxiv_id = ?, version = ? WHERE arxiv_id = ?",
+                                        (canonical, version, keep))
+                    for table, column in self._PAPER_ID_COLUMNS:
+                        self.cursor.execute(f"UPDATE {table} SET {column} = ? WHERE {column} = ?",
+                                            (canonical, keep))
+                    results['renamed'][keep] = canonical
+
+                for _, _, duplicate in rows[1:]:
+                    self.cursor.execute("UPDATE papers SET duplicate_of = ?, embedding_created = 0 WHERE arxiv_id = ?",
+                                        (canonical, duplicate))
+                    for table, column in self._PAPER_ID_COLUMNS:
+                        if table != 'paper_summaries':
+                            self.cursor.execute(f"DELETE FROM {table} WHERE {column} = ?", (duplicate,))
+                    results['duplicates'] += 1
+
+                # Resident indexes hold paper ids; make them reload
+                self.cursor.execute("UPDATE embedding_generation SET generation = generation + 1 WHERE id = 1")
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Could not migrate {canonical}: {e}")
+                results['failed'].append(canonical)
+
+        logger.info(f"Canonical ids: {len(results['renamed'])} papers renamed, "
+                    f"{results['duplicates']} older versions linked")
+        return results
+
+    def get_max_embedding_id(self) -> int:
+        """Highest embeddings row id (a rowid seek, not a scan), 0 if the table is empty"""
+        self.cursor.execute("SELECT COALESCE(MAX(id), 0) FROM embeddings")
+        return self.cursor.fetchone()[0]
+
+    def get_embedding_generation(self) -> int:
+        """Get the embeddings generation counter (changes on delete/rewrite)"""
+        self.cursor.execute("SELECT generation FROM embedding_generation WHERE id = 1")
+        row = self.cursor.fetchone()
+        return row[0] if row else 0
+
+    def get_embedding_metadata(self, row_ids) -> tuple:
+        """Get (paper_ids, chunk_indices) for ascending embedding row ids, without loading blobs"""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if not len(row_ids):
+            return np.empty(0, dtype=object), np.empty(0, dtype=np.int32)
+
+        self.cursor.execute("""
+        SELECT id, paper_id, chunk_index FROM embeddings
+        WHERE id BETWEEN ? AND ?
+        ORDER BY id
+        """, (int(row_ids[0]), int(row_ids[-1])))
+        found = {row[0]: (row[1], row[2]) for row in self.cursor.fetchall()}
+
+        paper_ids = np.empty(len(row_ids), dtype=object)
+        chunk_indices = np.zeros(len(row_ids), dtype=np.int32)
+        for i, row_id in enumerate(row_ids.tolist()):
+            paper_ids[i], chunk_indices[i] = found.get(row_id, (None, 0))
+        return paper_ids, chunk_indices
+
+    def get_chunk_texts(self, row_ids: List[int]) -> Dict[int, str]:
+        """Get chunk text for specific embedding rows"""
+        if not row_ids:
+            return {}
+
+        placeholders = ','.join('?' * len(row_ids))
+        self.cursor.execute(f"""
+        SELECT id, chunk_text FROM embeddings WHERE id IN ({placeholders})
+        """, list(row_ids))
+
+        return {row[0]: row[1] for row in self.cursor.fetchall()}
+
     def log_pipeline_run(self, start_time, end_time, papers_fetched, papers_processed, status, error=None):
         """Log pipeline execution"""
         self.cursor.execute("""
@@ -288,22 +1659,12 @@ class DatabaseManager:
         self.conn.commit()
     
     def get_stats(self) -> Dict:
-        """Get database statistics"""
-        stats = {}
-
-        self.cursor.execute("SELECT COUNT(*) FROM papers")
-        stats['total_papers'] = self.cursor.fetchone()[0]
-
-        self.cursor.execute("SELECT COUNT(*) FROM papers WHERE processed = 1")
-        stats['processed_papers'] = self.cursor.fetchone()[0]
-
-        self.cursor.execute("SELECT COUNT(*) FROM papers WHERE embedding_created = 1")
-        stats['papers_with_embeddings'] = self.cursor.fetchone()[0]
-
-        self.cursor.execute("SELECT COUNT(*) FROM embeddings")
-        stats['total_chunks'] = self.cursor.fetchone()[0]
-
-        return stats
+        """Get database statistics (trigger-maintained counters, a single row read)"""
+        self.cursor.execute("""
+        SELECT total_papers, processed_papers, papers_with_embeddings, total_chunks
+        FROM corpus_stats WHERE id = 1
+        """)
+        return dict(self.cursor.fetchone())
 
     # ========== Paper Summary Methods (New) ==========
 
@@ -340,23 +1701,37 @@ class DatabaseManager:
         row = self.cursor.fetchone()
         if row:
             result = dict(row)
-            # DEBUG: Log what we're returning
-            logger.info(f"Retrieved summary for {paper_id}")
-            logger.info(f"Keys: {list(result.keys())}")
-            logger.info(f"Has abstract_summary: {bool(result.get('abstract_summary'))}")
-            logger.info(f"Abstract length: {len(result.get('abstract_summary', ''))}")
-            logger.info(f"Abstract value type: {type(result.get('abstract_summary'))}")
-            logger.info(f"Abstract first 50 chars: {result.get('abstract_summary', '')[:50]}")
+            logger.debug(f"Retrieved summary for {paper_id} "
+                         f"(abstract length: {len(result.get('abstract_summary') or '')})")
             return result
         return None
 
+    def get_paper_summaries(self, paper_ids: List[str]) -> Dict[str, Dict]:
+        """Get structured summaries for several papers in one query"""
+        if not paper_ids:
+            return {}
+
+        placeholders = ','.join('?' * len(paper_ids))
+        self.cursor.execute(f"""
+        SELECT paper_id, title, authors, date, abstract_summary,
+               methodology, results, related_work, raw_summary,
+               structure_score, created_date
+        FROM paper_summaries
+        WHERE paper_id IN ({placeholders})
+        """, list(paper_ids))
+
+        return {row['paper_id']: dict(row) for row in self.cursor.fetchall()}
+
     def get_papers_without_summaries(self, limit: int = 50) -> List[Dict]:
         """Get papers that need summaries (processed but not summarized)"""
         self.cursor.execute("""
-        SELECT p.arxiv_id, p.title, p.abstract, p.full_text, p.authors
+        SELECT p.arxiv_id, p.title, p.abstract, p.authors,
+               COALESCE(pc.text_length, 0) > 0 AS has_full_text
         FROM papers p
+        LEFT JOIN paper_content pc ON pc.paper_id = p.arxiv_id
         LEFT JOIN paper_summaries ps ON p.arxiv_id = ps.paper_id
-        WHERE p.processed = 1 AND ps.paper_id IS NULL
+        WHERE p.processed = 1 AND p.summary_generated = 0 AND p.duplicate_of IS NULL
+          AND ps.paper_id IS NULL
         LIMIT ?
         """, (limit,))
 
@@ -393,20 +1768,18 @@ class DatabaseManager:
             return False
 
     def get_summary_stats(self) -> Dict:
-        """Get statistics about summaries"""
-        stats = {}
-
-        self.cursor.execute("SELECT COUNT(*) FROM paper_summaries")
-        stats['total_summaries'] = self.cursor.fetchone()[0]
-
-        self.cursor.execute("SELECT AVG(structure_score) FROM paper_summaries")
-        avg_score = self.cursor.fetchone()[0]
-        stats['avg_structure_score'] = round(avg_score, 2) if avg_score else 0.0
-
-        self.cursor.execute("SELECT COUNT(*) FROM papers WHERE summary_generated = 1")
-        stats['papers_with_summaries'] = self.cursor.fetchone()[0]
-
-        return stats
+        """Get statistics about summaries (trigger-maintained counters)"""
+        self.cursor.execute("""
+        SELECT total_summaries, structure_score_sum, structure_score_count, papers_with_summaries
+        FROM corpus_stats WHERE id = 1
+        """)
+        row = self.cursor.fetchone()
+        avg_score = row['structure_score_sum'] / row['structure_score_count'] if row['structure_score_count'] else 0
+        return {
+            'total_summaries': row['total_summaries'],
+            'avg_structure_score': round(avg_score, 2) if avg_score else 0.0,
+            'papers_with_summaries': row['papers_with_summaries']
+        }
 
     def get_all_summaries(self, limit: int = 100) -> List[Dict]:
         """Get all paper summaries with basic paper info"""
@@ -450,5 +1823,9 @@ class DatabaseManager:
         return None
 
     def close(self):
-        """Close database connection"""
-        self.conn.close()
\ No newline at end of file
+        """Close every thread's database connections"""
+        with self._connections_lock:
+            for _, conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Dedup - arXiv version handling and near-duplicate detection at ingestion
+Papers are keyed by their canonical arXiv id (2512.01537v2 -> 2512.01537).
+Near duplicates (re-posts, the same text under a new id) are found with
+MinHash signatures over word shingles, bucketed with LSH in SQLite so a
+check is a handful of indexed lookups instead of a scan over every paper.
+"""
+
+import hashlib
+import re
+import zlib
+from typing import List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Estimated Jaccard similarity at which a paper is linked to an earlier one
+NEAR_DUPLICATE_THRESHOLD = 0.85
+
+_VERSION_RE = re.compile(r'^(?P<id>.+?)v(?P<version>\d+)$')
+_WORD_RE = re.compile(r'\w+')
+
+# Universal hashing modulo a Mersenne prime; 31-bit values keep a*x + b in uint64
+_PRIME = (1 << 31) - 1
+
+
+def canonical_arxiv_id(raw_id: str) -> Tuple[str, int]:
+    """Canonical id and version from an id or entry URL: '2512.01537v2' -> ('2512.01537', 2).
+
+    Ids without a version suffix are version 1.
+    """
+    arxiv_id = raw_id.strip().rstrip('/').split('/')[-1]
+    match = _VERSION_RE.match(arxiv_id)
+    if match:
+        return match.group('id'), int(match.group('version'))
+    return arxiv_id, 1
+
+
+class MinHasher:
+    """MinHash signatures over word k-shingles, one vectorized pass per text"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Distinct 31-bit hashes of the text's word k-shingles"""
+        words = _WORD_RE.findall(text.lower())
+        k = self.shingle_size
+        grams = [' '.join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))] if words else []
+        hashes = np.fromiter((zlib.crc32(gram.encode('utf-8')) & _PRIME for gram in grams),
+                             dtype=np.uint64, count=len(grams))
+        return np.unique(hashes)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """uint32 MinHash signature, None for text without words"""
+        shingles = self.shingles(text)
+        return self.signature_of(shingles) if len(shingles) else None
+
+    def signature_of(self, shingles: np.ndarray) -> np.ndarray:
+        """Signature of precomputed shingle hashes"""
+        signature = np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        # Blocks bound the (shingles x permutations) temporary for long full texts
+        for start in range(0, len(shingles), 4096):
+            block = shingles[start:start + 4096, None]
+            signature = np.minimum(signature, ((block * self._a + self._b) % _PRIME).min(axis=0))
+        return signature.astype(np.uint32)
+
+
+def estimate_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Fraction of matching signature slots"""
+    return float(np.mean(a == b))
+
+
+class NearDuplicateDetector:
+    """Finds earlier papers whose abstract or full text is nearly identical.
+
+    Signatures are split into `bands` bands; papers sharing any band bucket
+    are candidates, and candidates are confirmed on the full signature.
+    With 16 bands of 8 rows, pairs above ~0.7 similarity almost always
+    collide while unrelated papers almost never do.
+    """
+
+    def __init__(self, db, threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                 num_perm: int = 128, bands: int = 16, min_shingles: int = 10):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.db = db
+        self.threshold = threshold
+        self.bands = bands
+        self.min_shingles = min_shingles
+        self.hasher = MinHasher(num_perm)
+
+    def _buckets(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        """(band, bucket) keys; buckets are signed 64-bit to fit SQLite integers"""
+        rows = len(signature) // self.bands
+        return [(band, int.from_bytes(hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(),
+                                                      digest_size=8).digest(), 'little', signed=True))
+                for band in range(self.bands)]
+
+    def check(self, paper_id: str, text: str, field: str = 'abstract') -> Optional[str]:
+        """Id of an earlier near-duplicate of this text, else None.
+
+        Only papers that are not duplicates are remembered, so matches always
+        point at the original.
+        """
+        shingles = self.hasher.shingles(text or '')
+        if len(shingles) < self.min_shingles:
+            return None
+        signature = self.hasher.signature_of(shingles)
+        buckets = self._buckets(signature)
+
+        best, best_score = None, self.threshold
+        for other_id, other_signature in self.db.find_minhash_candidates(field, buckets).items():
+            if other_id == paper_id:
+                continue
+            score = estimate_jaccard(signature, other_signature)
+            if score >= best_score:
+                best, best_score = other_id, score
+
+        if best is None:
+            self.db.store_minhash(paper_id, field, signature, buckets)
+        else:
+            logger.info(f"{paper_id} is a near-duplicate of {best} ({field}, ~{best_score:.2f} Jaccard)")
+        return best
@@ -0,0 +1,85 @@
+"""
+Embedding Batcher - Token-aware packing of texts into embedding API requests
+Counts tokens with tiktoken when it is installed and falls back to a
+character-based estimate otherwise.
+"""
+
+import math
+from functools import lru_cache
+from typing import List
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # Optional: character estimates are used instead
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# OpenAI embeddings endpoint limits
+MAX_INPUT_TOKENS = 8191
+MAX_REQUEST_TOKENS = 300_000
+MAX_REQUEST_INPUTS = 2048
+
+# Without a tokenizer: ~4 characters per token on average, but budget limits
+# with 3 so dense text (numbers, code, non-English) still fits
+CHARS_PER_TOKEN = 4
+CHARS_PER_TOKEN_WORST = 3
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Token count of text (exact with tiktoken, an average-case estimate otherwise)"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def token_upper_bound(text: str, model: str) -> int:
+    """Token count to budget limits with (exact with tiktoken, pessimistic otherwise)"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN_WORST))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Cut text so it fits in max_tokens"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN_WORST]
+
+
+def pack_requests(token_counts: List[int], max_request_tokens: int = MAX_REQUEST_TOKENS,
+                  max_request_inputs: int = MAX_REQUEST_INPUTS) -> List[List[int]]:
+    """Group inputs into as few requests as the per-request limits allow.
+
+    Inputs keep their order (greedy next-fit), which keeps a paper's chunks
+    together; returns a list of requests, each a list of input positions.
+    """
+    requests = []
+    current, current_tokens = [], 0
+    for position, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_request_tokens
+                        or len(current) >= max_request_inputs):
+            requests.append(current)
+            current, current_tokens = [], 0
+        current.append(position)
+        current_tokens += tokens
+    if current:
+        requests.append(current)
+    return requests
@@ -0,0 +1,861 @@
+"""
+Embedding Index - Resident (optionally quantized) embedding matrix used by VectorStore
+"""
+
+import numpy as np
+import os
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingIndex:
+    """Contiguous, pre-normalized matrix of chunk embeddings with parallel id arrays.
+
+    quantization selects how rows are held in memory:
+      'none' - float32 rows, scored exactly
+      'int8' - int8 codes with a per-vector scale (4x smaller)
+      'pq'   - product-quantized uint8 codes, pq_subspaces bytes per row
+    Codebooks need a representative sample, so a 'pq' index keeps float32
+    rows until it holds pq_min_train_rows, then trains on all of them and
+    re-encodes; encoding is the representation currently in use.
+    Quantized scores are a first pass; the best k * rescore_multiplier rows
+    are rescored with float32 vectors fetched through vector_loader.
+
+    scan_dimensions > 0 keeps only that many leading dimensions of each vector,
+    renormalized (Matryoshka prefix, as text-embedding-3 models are trained
+    for). Queries are still full-dimension: the prefix drives the scan and the
+    shortlist is reranked with the full vectors from vector_loader.
+    """
+
+    QUANTIZATION_MODES = ('none', 'int8', 'pq')
+
+    # Rows scored per block, bounds the temporary float32 copy of quantized codes
+    SCAN_BLOCK_ROWS = 65536
+
+    def __init__(self, initial_capacity: int = 1024, quantization: str = 'none',
+                 pq_subspaces: int = 64, rescore_multiplier: int = 8, scan_dimensions: int = 0,
+                 pq_min_train_rows: Optional[int] = None):
+        if quantization not in self.QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+
+        self.dim = 0       # dimensions held in memory and scanned
+        self.full_dim = 0  # dimensions of the stored embeddings (and of queries)
+        self.scan_dimensions = scan_dimensions or 0
+        self.last_row_id = 0
+        self.quantization = quantization
+        self.encoding = 'none' if quantization == 'pq' else quantization
+        self.pq_subspaces = pq_subspaces
+        self.pq_min_train_rows = (ProductQuantizer.MIN_TRAIN_ROWS if pq_min_train_rows is None
+                                  else pq_min_train_rows)
+        self.rescore_multiplier = rescore_multiplier
+        self.vector_loader = None  # callable(row_ids) -> float32 matrix
+        self.pq = None
+
+        self._size = 0
+        self._capacity = 0
+        self._initial_capacity = initial_capacity
+
+        self._codes = np.empty((0, 0), dtype=np.float32)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._row_ids = np.empty(0, dtype=np.int64)
+        self._chunk_indices = np.empty(0, dtype=np.int32)
+        self._paper_ids = np.empty(0, dtype=object)
+
+        # Dense paper numbers, so per-paper arrays (filters, centroids) can be
+        # gathered per row with one fancy index
+        self.paper_numbers = {}
+        self.paper_list = []
+        self._paper_idx = np.empty(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Float32 rows (only available while rows are unquantized, see reconstruct)"""
+        if self.encoding != 'none':
+            raise AttributeError("Quantized index has no float32 rows, use reconstruct()")
+        return self._codes[:self._size]
+
+    @property
+    def row_ids(self) -> np.ndarray:
+        return self._row_ids[:self._size]
+
+    @property
+    def chunk_indices(self) -> np.ndarray:
+        return self._chunk_indices[:self._size]
+
+    @property
+    def paper_ids(self) -> np.ndarray:
+        return self._paper_ids[:self._size]
+
+    @property
+    def paper_idx(self) -> np.ndarray:
+        """Paper number of every row (index into paper_list)"""
+        return self._paper_idx[:self._size]
+
+    def _number_papers(self, paper_ids) -> np.ndarray:
+        numbers = np.empty(len(paper_ids), dtype=np.int32)
+        for i, paper_id in enumerate(paper_ids):
+            number = self.paper_numbers.get(paper_id)
+            if number is None:
+                number = self.paper_numbers[paper_id] = len(self.paper_list)
+                self.paper_list.append(paper_id)
+            numbers[i] = number
+        return numbers
+
+    def clear(self):
+        """Drop all rows (used when the embeddings table was reset)"""
+        vector_loader = self.vector_loader
+        self.__init__(self._initial_capacity, self.quantization, self.pq_subspaces,
+                      self.rescore_multiplier, self.scan_dimensions, self.pq_min_train_rows)
+        self.vector_loader = vector_loader
+
+    @property
+    def truncated(self) -> bool:
+        """True if rows hold only a prefix of the stored vectors"""
+        return self.dim < self.full_dim
+
+    @property
+    def scan_layout(self) -> str:
+        """What reconstruct() rows are (encoding, scanned / stored dimensions); structures
+        derived from them, like a saved IVF index, are only valid for the same layout"""
+        encoding = f'pq{self.pq.n_subspaces}' if self.encoding == 'pq' else self.encoding
+        return f'{encoding}:{self.dim}/{self.full_dim}'
+
+    def _rescores(self) -> bool:
+        """Whether first-pass scores are approximate and full vectors can fix them"""
+        return (self.encoding != 'none' or self.truncated) and self.vector_loader is not None
+
+    def _prepare_queries(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Normalized full queries, normalized scan prefixes, and a mask of usable queries"""
+        norms = np.linalg.norm(queries, axis=1)
+        full = queries / np.where(norms > 0, norms, 1.0)[:, None]
+        scan = queries[:, :self.dim]
+        if self.truncated:
+            scan_norms = np.linalg.norm(scan, axis=1)
+            scan = scan / np.where(scan_norms > 0, scan_norms, 1.0)[:, None]
+            return full, scan, (norms > 0) & (scan_norms > 0)
+        return full, full, norms > 0
+
+    def scan_query(self, query) -> np.ndarray:
+        """The normalized first-pass form of a full-dimension query (what reconstruct() rows match)"""
+        query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        return self._prepare_queries(query)[1][0]
+
+    def _code_shape(self) -> Tuple[int, np.dtype]:
+        if self.encoding == 'int8':
+            return self.dim, np.int8
+        if self.encoding == 'pq':
+            return self.pq.n_subspaces, np.uint8
+        return self.dim, np.float32
+
+    def _reserve(self, needed: int):
+        """Grow the backing arrays geometrically so appends stay amortized O(1)"""
+        if needed <= self._capacity:
+            return
+
+        capacity = max(self._initial_capacity, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+
+        width, dtype = self._code_shape()
+        codes = np.empty((capacity, width), dtype=dtype)
+        if self._size:
+            codes[:self._size] = self._codes[:self._size]
+        self._codes = codes
+
+        self._scales = np.resize(self._scales, capacity)
+        self._row_ids = np.resize(self._row_ids, capacity)
+        self._chunk_indices = np.resize(self._chunk_indices, capacity)
+        self._paper_idx = np.resize(self._paper_idx, capacity)
+        paper_ids = np.empty(capacity, dtype=object)
+        paper_ids[:self._size] = self._paper_ids[:self._size]
+        self._paper_ids = paper_ids
+
+        self._capacity = capacity
+
+    def add(self, row_ids: List[int], paper_ids: List[str],
+            chunk_indices: List[int], vectors) -> int:
+        """Normalize, encode and append rows to the index, returns number of rows added"""
+        if not len(row_ids):
+            return 0
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+
+        if not self.dim:
+            self.full_dim = vectors.shape[1]
+            self.dim = min(self.scan_dimensions or self.full_dim, self.full_dim)
+
+        if vectors.shape[1] != self.full_dim:
+            logger.warning(
+                f"Skipping {len(row_ids)} embeddings with dimension {vectors.shape[1]} "
+                f"(index dimension is {self.full_dim})"
+            )
+            return 0
+
+        # Truncate first, then normalize, so the prefix is a unit vector itself
+        vectors = _normalize_rows(vectors[:, :self.dim])
+
+        n = len(row_ids)
+        if self.quantization == 'pq' and self.encoding == 'none' and self._size + n >= self.pq_min_train_rows:
+            self._train_pq(vectors)
+
+        self._reserve(self._size + n)
+        start, end = self._size, self._size + n
+
+        if self.encoding == 'int8':
+            self._codes[start:end], self._scales[start:end] = quantize_int8(vectors)
+        elif self.encoding == 'pq':
+            self._codes[start:end] = self.pq.encode(vectors)
+        else:
+            self._codes[start:end] = vectors
+
+        self._row_ids[start:end] = row_ids
+        self._chunk_indices[start:end] = chunk_indices
+        self._paper_ids[start:end] = paper_ids
+        self._paper_idx[start:end] = self._number_papers(paper_ids)
+        self._size = end
+
+        self.last_row_id = max(self.last_row_id, int(max(row_ids)))
+        return n
+
+    def _train_pq(self, vectors: np.ndarray):
+        """Learn PQ codebooks from the rows held so far plus `vectors`, and re-encode the held rows"""
+        self.pq = ProductQuantizer(self.dim, self.pq_subspaces)
+        self.pq.train(np.vstack([self._codes[:self._size], vectors]) if self._size else vectors)
+
+        codes = np.empty((self._capacity, self.pq.n_subspaces), dtype=np.uint8)
+        for block_start in range(0, self._size, self.SCAN_BLOCK_ROWS):
+            block = slice(block_start, min(block_start + self.SCAN_BLOCK_ROWS, self._size))
+            codes[block] = self.pq.encode(self._codes[block])
+        self._codes = codes
+        self.encoding = 'pq'
+
+    def attach(self, vectors: np.ndarray, row_ids, paper_ids, chunk_indices):
+        """Use an existing normalized float32 matrix (e.g. a np.memmap) as the row storage.
+
+        All arrays cover every row, including the ones already in the index.
+        """
+        if self.quantization != 'none':
+            raise ValueError("Only an unquantized index can attach float32 vectors")
+        if 0 < self.scan_dimensions < vectors.shape[1]:
+            raise ValueError("An index with scan_dimensions holds copies of the prefixes, use add()")
+
+        self.dim = self.full_dim = vectors.shape[1]
+        self._codes = vectors
+        self._row_ids = np.asarray(row_ids, dtype=np.int64)
+        self._chunk_indices = np.asarray(chunk_indices, dtype=np.int32)
+        self._paper_ids = np.asarray(paper_ids, dtype=object)
+        self._paper_idx = np.concatenate([self.paper_idx,
+                                          self._number_papers(self._paper_ids[self._size:])])
+        self._size = self._capacity = len(vectors)
+        self.last_row_id = int(self._row_ids[-1]) if self._size else 0
+
+    def reconstruct(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Float32 first-pass rows for positions start:end (approximate if quantized,
+        the normalized prefix if scan_dimensions is set)"""
+        end = self._size if end is None else min(end, self._size)
+        if self.encoding == 'int8':
+            return self._codes[start:end].astype(np.float32) * self._scales[start:end, None]
+        if self.encoding == 'pq':
+            return self.pq.decode(self._codes[start:end])
+        return self._codes[start:end]
+
+    def _scan_scores(self, query: np.ndarray, positions: Optional[np.ndarray]) -> np.ndarray:
+        """First-pass scores for the given row positions (all rows if None)"""
+        if self.encoding == 'none':
+            rows = self.vectors if positions is None else self._codes[positions]
+            return rows @ query
+
+        count = self._size if positions is None else len(positions)
+        scores = np.empty(count, dtype=np.float32)
+        table = self.pq.lookup_table(query) if self.encoding == 'pq' else None
+
+        for block_start in range(0, count, self.SCAN_BLOCK_ROWS):
+            block_end = min(block_start + self.SCAN_BLOCK_ROWS, count)
+            if positions is None:
+                block = slice(block_start, block_end)
+            else:
+                block = positions[block_start:block_end]
+
+            if self.encoding == 'int8':
+                scores[block_start:block_end] = (
+                    (self._codes[block].astype(np.float32) @ query) * self._scales[block]
+                )
+            else:
+                scores[block_start:block_end] = self.pq.score(table, self._codes[block])
+
+        return scores
+
+    def search(self, query, k: int,
+               candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Score rows with one matrix-vector product, return (positions, scores) best first.
+
+        If candidates is given, only those row positions are scored.
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self._size == 0 or k <= 0:
+            return empty
+
+        query = np.asarray(query, dtype=np.float32)
+        if query.ndim != 1 or query.shape[0] != self.full_dim:
+            return empty
+        full_query, scan_query, valid = self._prepare_queries(query.reshape(1, -1))
+        if not valid[0]:
+            return empty
+        query = full_query[0]
+
+        if candidates is not None and not len(candidates):
+            return empty
+
+        scores = self._scan_scores(scan_query[0], candidates)
+
+        if not self._rescores():
+            order = _top_k(scores, k)
+            positions = order if candidates is None else candidates[order]
+            return positions, scores[order]
+
+        # Rescore a shortlist of the approximate hits with full float32 vectors
+        shortlist = _top_k(scores, k * self.rescore_multiplier)
+        positions = shortlist if candidates is None else candidates[shortlist]
+        full_vectors = np.asarray(self.vector_loader(self.row_ids[positions]), dtype=np.float32)
+        if full_vectors.shape != (len(positions), self.full_dim):
+            logger.warning("Could not load float32 vectors for rescoring, using approximate scores")
+            order = _top_k(scores[shortlist], k)
+            return positions[order], scores[shortlist][order]
+        exact_scores = _normalize_rows(full_vectors) @ query
+
+        order = _top_k(exact_scores, k)
+        return positions[order], exact_scores[order]
+
+    def _scan_block_many(self, queries: np.ndarray, rows,
+                         tables: Optional[List[np.ndarray]]) -> np.ndarray:
+        """First-pass scores of rows (slice or positions) against every query, shape (rows, queries)"""
+        codes = self._codes[rows]
+        if self.encoding == 'none':
+            return codes @ queries.T
+        if self.encoding == 'int8':
+            return (codes.astype(np.float32) @ queries.T) * self._scales[rows, None]
+        return np.stack([self.pq.score(table, codes) for table in tables], axis=1)
+
+    def search_many(self, queries, k: int,
+                    candidates: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Score a batch of queries with blocked matrix-matrix products.
+
+        Returns one (positions, scores) pair per query, like search(). If
+        candidates is given, only those row positions are scored.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self._size == 0 or k <= 0 or queries.shape[1] != self.full_dim:
+            return [empty] * len(queries)
+
+        queries, scan_queries, valid = self._prepare_queries(queries)
+
+        count = self._size if candidates is None else len(candidates)
+        if not count:
+            return [empty] * len(queries)
+
+        rescore = self._rescores()
+        first_k = min(k * self.rescore_multiplier if rescore else k, count)
+        tables = [self.pq.lookup_table(q) for q in scan_queries] if self.encoding == 'pq' else None
+
+        # Running top first_k per query, merged block by block
+        top_scores = np.empty((0, len(queries)), dtype=np.float32)
+        top_positions = np.empty((0, len(queries)), dtype=np.int64)
+        for block_start in range(0, count, self.SCAN_BLOCK_ROWS):
+            block_end = min(block_start + self.SCAN_BLOCK_ROWS, count)
+            if candidates is None:
+                rows = slice(block_start, block_end)
+                row_positions = np.arange(block_start, block_end)
+            else:
+                rows = row_positions = candidates[block_start:block_end]
+            block_scores = self._scan_block_many(scan_queries, rows, tables)
+            block_positions = np.broadcast_to(row_positions[:, None], block_scores.shape)
+
+            scores = np.vstack([top_scores, block_scores])
+            positions = np.vstack([top_positions, block_positions])
+            if len(scores) > first_k:
+                keep = np.argpartition(-scores, first_k - 1, axis=0)[:first_k]
+                scores = np.take_along_axis(scores, keep, axis=0)
+                positions = np.take_along_axis(positions, keep, axis=0)
+            top_scores, top_positions = scores, positions
+
+        results = []
+        for j in range(len(queries)):
+            if not valid[j]:
+                results.append(empty)
+                continue
+
+            order = np.argsort(-top_scores[:, j], kind='stable')
+            positions, scores = top_positions[order, j], top_scores[order, j]
+            if not rescore:
+                results.append((positions[:k], scores[:k]))
+                continue
+
+            full_vectors = np.asarray(self.vector_loader(self.row_ids[positions]), dtype=np.float32)
+            if full_vectors.shape != (len(positions), self.full_dim):
+                results.append((positions[:k], scores[:k]))
+                continue
+            exact_scores = _normalize_rows(full_vectors) @ queries[j]
+            order = _top_k(exact_scores, k)
+            results.append((positions[order], exact_scores[order]))
+
+        return results
+
+    def memory_bytes(self) -> Dict:
+        """Resident bytes per row for the vector data and the id arrays"""
+        width, dtype = self._code_shape() if self.dim else (0, np.float32)
+        vector_bytes = width * np.dtype(dtype).itemsize
+        if self.encoding == 'int8':
+            vector_bytes += self._scales.itemsize
+        id_bytes = (self._row_ids.itemsize + self._chunk_indices.itemsize
+                    + self._paper_ids.itemsize + self._paper_idx.itemsize)
+
+        return {
+            'quantization': self.quantization,
+            'encoding': self.encoding,
+            'scan_dimensions': self.dim,
+            'full_dimensions': self.full_dim,
+            'rows': self._size,
+            'vector_bytes_per_row': vector_bytes,
+            'id_bytes_per_row': id_bytes,
+            'mb_per_million_rows': (vector_bytes + id_bytes) * 1_000_000 / 2**20
+        }
+
+
+class PaperMetadata:
+    """Per-paper filter columns, aligned with EmbeddingIndex paper numbers.
+
+    Filters are evaluated as boolean arrays over papers and gathered to rows
+    through EmbeddingIndex.paper_idx before any scoring happens.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.category_columns = {}
+        self._categories = np.zeros((0, 0), dtype=bool)
+        self._published = np.empty(0, dtype='datetime64[D]')
+        self._has_summary = np.zeros(0, dtype=bool)
+
+    def _grow(self, size: int, n_categories: int):
+        categories = np.zeros((size, n_categories), dtype=bool)
+        categories[:self._categories.shape[0], :self._categories.shape[1]] = self._categories
+        self._categories = categories
+
+        published = np.full(size, np.datetime64('NaT'), dtype='datetime64[D]')
+        published[:len(self._published)] = self._published
+        self._published = published
+
+        self._has_summary = np.concatenate([self._has_summary,
+                                            np.zeros(size - len(self._has_summary), dtype=bool)])
+
+    def update(self, numbers, categories: List[List[str]], published_dates: List[Optional[str]],
+               has_summary: List[bool]):
+        """Set the filter columns for the given paper numbers"""
+        numbers = np.asarray(numbers, dtype=np.int64)
+        if not len(numbers):
+            return
+
+        for paper_categories in categories:
+            for category in paper_categories:
+                self.category_columns.setdefault(category, len(self.category_columns))
+
+        size = max(self.size, int(numbers.max()) + 1)
+        if size > self._categories.shape[0] or len(self.category_columns) > self._categories.shape[1]:
+            self._grow(size, len(self.category_columns))
+        self.size = size
+
+        for number, paper_categories in zip(numbers, categories):
+            self._categories[number] = False
+            self._categories[number, [self.category_columns[c] for c in paper_categories]] = True
+
+        self._published[numbers] = [_to_day(date) for date in published_dates]
+        self._has_summary[numbers] = has_summary
+
+    def set_has_summary(self, numbers):
+        """Replace the has_summary column: True exactly for the given paper numbers"""
+        self._has_summary[:] = False
+        numbers = np.asarray(numbers, dtype=np.int64)
+        self._has_summary[numbers[numbers < self.size]] = True
+
+    def add_has_summary(self, numbers):
+        """Set has_summary for the given paper numbers, leaving the rest as they are"""
+        numbers = np.asarray(numbers, dtype=np.int64)
+        self._has_summary[numbers[numbers < self.size]] = True
+
+    def mask(self, categories: Optional[List[str]] = None, date_from=None, date_to=None,
+             has_summary: Optional[bool] = None) -> Optional[np.ndarray]:
+        """Boolean array over papers matching every given filter, None if no filter is set"""
+        if not categories and date_from is None and date_to is None and has_summary is None:
+            return None
+
+        mask = np.ones(self.size, dtype=bool)
+        if categories:
+            columns = [self.category_columns[c] for c in categories if c in self.category_columns]
+            mask &= self._categories[:self.size, columns].any(axis=1) if columns else False
+        if date_from is not None:
+            mask &= self._published[:self.size] >= _to_day(date_from)
+        if date_to is not None:
+            mask &= self._published[:self.size] <= _to_day(date_to)
+        if has_summary is not None:
+            mask &= self._has_summary[:self.size] == bool(has_summary)
+        return mask
+
+
+def _to_day(value) -> np.datetime64:
+    """Day-precision datetime64 from an ISO date string, date or datetime (NaT if missing)"""
+    if value is None or value == '':
+        return np.datetime64('NaT')
+    return np.datetime64(str(value)[:10], 'D')
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 quantization with one float32 scale per vector"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first"""
+    k = min(k, len(scores))
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k largest scores in each row, best first"""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+def update_knn_graph(vectors: np.ndarray, neighbors: np.ndarray, similarities: np.ndarray,
+                     pending, block_size: int = 256) -> np.ndarray:
+    """Bring a k-nearest-neighbour graph over normalized vectors up to date, in place.
+
+    neighbors / similarities are (n, k) arrays, best first, with -1 / -inf in
+    empty slots. Rows in `pending` (new or changed vectors) are recomputed
+    with blocked matrix products against all rows; every other row only takes
+    in pending vectors that beat its current k-th neighbour, so the cost
+    follows the number of pending rows. A row that loses a link to a moved
+    vector is not rescored against the other non-pending rows, so it may
+    stay a little short of exact until a full rebuild. Returns a mask of
+    the rows that changed.
+    """
+    n, k = neighbors.shape
+    pending = np.asarray(pending, dtype=np.int64)
+    is_pending = np.zeros(n, dtype=bool)
+    is_pending[pending] = True
+    changed = np.zeros(n, dtype=bool)
+
+    # Links to pending vectors are stale; the block loop re-offers them
+    stale = (neighbors >= 0) & is_pending[np.maximum(neighbors, 0)]
+    neighbors[stale] = -1
+    similarities[stale] = -np.inf
+    changed |= stale.any(axis=1)
+    order = np.argsort(-similarities, axis=1, kind='stable')
+    neighbors[:] = np.take_along_axis(neighbors, order, axis=1)
+    similarities[:] = np.take_along_axis(similarities, order, axis=1)
+
+    k_own = min(k, n - 1)
+    for start in range(0, len(pending), block_size):
+        block = pending[start:start + block_size]
+        scores = vectors[block] @ vectors.T
+        scores[np.arange(len(block)), block] = -np.inf
+
+        # Pending rows: exact top-k over everything
+        neighbors[block] = -1
+        similarities[block] = -np.inf
+        if k_own > 0:
+            top = _top_k_rows(scores, k_own)
+            neighbors[block, :k_own] = top
+            similarities[block, :k_own] = np.take_along_axis(scores, top, axis=1)
+        changed[block] = True
+
+        # Other rows: merge in block vectors closer than their current k-th neighbour
+        rows = np.flatnonzero(~is_pending & (scores.max(axis=0) > similarities[:, -1]))
+        if len(rows):
+            candidate_sims = np.concatenate([similarities[rows], scores[:, rows].T], axis=1)
+            candidate_ids = np.concatenate([neighbors[rows], np.broadcast_to(block, (len(rows), len(block)))],
+                                           axis=1)
+            top = _top_k_rows(candidate_sims, k)
+            neighbors[rows] = np.take_along_axis(candidate_ids, top, axis=1)
+            similarities[rows] = np.take_along_axis(candidate_sims, top, axis=1)
+            changed[rows] = True
+
+    neighbors[np.isneginf(similarities)] = -1
+    return changed
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _cluster_sums(vectors: np.ndarray, assignments: np.ndarray, n_clusters: int):
+    """Per-cluster vector sums and counts, vectorized with a sort + reduceat"""
+    counts = np.bincount(assignments, minlength=n_clusters)
+    sums = np.zeros((n_clusters, vectors.shape[1]), dtype=vectors.dtype)
+
+    order = np.argsort(assignments, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    nonempty = np.flatnonzero(counts)
+    if len(nonempty):
+        sums[nonempty] = np.add.reduceat(vectors[order], starts[nonempty], axis=0)
+    return sums, counts
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 20,
+                     seed: int = 0) -> np.ndarray:
+    """Cluster normalized vectors by cosine similarity, returns normalized centroids"""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums, counts = _cluster_sums(vectors, assignments, n_clusters)
+
+        # Re-seed empty clusters with random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+        centroids = _normalize_rows(sums)
+
+    return centroids.astype(np.float32)
+
+
+def kmeans_plus_plus(vectors: np.ndarray, n_clusters: int, seed: int = 0) -> np.ndarray:
+    """k-means++ seeding for normalized vectors (distance = 1 - cosine)"""
+    rng = np.random.default_rng(seed)
+    chosen = [int(rng.integers(len(vectors)))]
+    distance = 1 - vectors @ vectors[chosen[0]]
+
+    for _ in range(1, min(n_clusters, len(vectors))):
+        weights = np.maximum(distance, 0).astype(np.float64) ** 2
+        total = weights.sum()
+        chosen.append(int(rng.choice(len(vectors), p=weights / total)) if total > 0
+                      else int(rng.integers(len(vectors))))
+        distance = np.minimum(distance, 1 - vectors @ vectors[chosen[-1]])
+
+    return vectors[chosen].astype(np.float32)
+
+
+def minibatch_kmeans(vectors: np.ndarray, centroids: np.ndarray, counts: np.ndarray,
+                     batch_size: int = 256, epochs: int = 1, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical mini-batch k-means updates starting from existing centroids.
+
+    counts holds how many points each centroid has absorbed so far; each
+    batch moves a centroid toward the mean of its points with rate
+    batch_count / total_count, so a later run refines the clusters with new
+    points instead of starting over. Returns normalized centroids and counts.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = centroids.astype(np.float32).copy()
+    counts = counts.astype(np.int64).copy()
+
+    for _ in range(epochs):
+        order = rng.permutation(len(vectors))
+        for start in range(0, len(order), batch_size):
+            batch = vectors[order[start:start + batch_size]]
+            assignments = np.argmax(batch @ centroids.T, axis=1)
+            sums, batch_counts = _cluster_sums(batch, assignments, len(centroids))
+
+            hit = np.flatnonzero(batch_counts)
+            counts[hit] += batch_counts[hit]
+            rate = (batch_counts[hit] / counts[hit]).astype(np.float32)[:, None]
+            centroids[hit] = _normalize_rows((1 - rate) * centroids[hit]
+                                             + rate * sums[hit] / batch_counts[hit, None])
+
+    return centroids, counts
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 20,
+           seed: int = 0) -> np.ndarray:
+    """Euclidean k-means, returns centroids"""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+        assignments = np.argmax(vectors @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+        sums, counts = _cluster_sums(vectors, assignments, n_clusters)
+
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+    return centroids.astype(np.float32)
+
+
+class ProductQuantizer:
+    """Splits vectors into n_subspaces slices and encodes each with a 256-entry codebook"""
+
+    N_CENTROIDS = 256
+    # Fewer rows than this leave most codewords fit to a handful of vectors
+    MIN_TRAIN_ROWS = N_CENTROIDS * 16
+
+    def __init__(self, dim: int, n_subspaces: int = 64, train_iterations: int = 15):
+        # Use the largest subspace count <= n_subspaces that divides dim
+        n_subspaces = max(1, min(n_subspaces, dim))
+        while dim % n_subspaces:
+            n_subspaces -= 1
+
+        self.dim = dim
+        self.n_subspaces = n_subspaces
+        self.sub_dim = dim // n_subspaces
+        self.train_iterations = train_iterations
+        self.codebooks = None  # (n_subspaces, N_CENTROIDS, sub_dim)
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.reshape(len(vectors), self.n_subspaces, self.sub_dim)
+
+    def train(self, vectors: np.ndarray):
+        sample_size = min(len(vectors), self.N_CENTROIDS * 64)
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)]
+        sub_vectors = self._split(sample)
+
+        self.codebooks = np.zeros((self.n_subspaces, self.N_CENTROIDS, self.sub_dim), dtype=np.float32)
+        for m in range(self.n_subspaces):
+            centroids = kmeans(sub_vectors[:, m], self.N_CENTROIDS, self.train_iterations, seed=m)
+            self.codebooks[m, :len(centroids)] = centroids
+            # Small training sets: pad unused codewords with a copy so they are never closer
+            self.codebooks[m, len(centroids):] = centroids[0]
+
+        logger.info(f"Trained product quantizer: {self.n_subspaces} x {self.sub_dim} dims on {sample_size} rows")
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub_vectors = self._split(vectors)
+        codes = np.empty((len(vectors), self.n_subspaces), dtype=np.uint8)
+        half_norms = 0.5 * (self.codebooks ** 2).sum(axis=2)
+        for m in range(self.n_subspaces):
+            codes[:, m] = np.argmax(sub_vectors[:, m] @ self.codebooks[m].T - half_norms[m], axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = self.codebooks[np.arange(self.n_subspaces), codes]
+        return parts.reshape(len(codes), self.dim)
+
+    def lookup_table(self, query: np.ndarray) -> np.ndarray:
+        """Inner products between each query slice and every codeword"""
+        return np.einsum('md,mkd->mk', query.reshape(self.n_subspaces, self.sub_dim), self.codebooks)
+
+    def score(self, table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Asymmetric distance computation: sum of per-subspace table lookups"""
+        return table[np.arange(self.n_subspaces), codes].sum(axis=1)
+
+
+class IVFIndex:
+    """Inverted-file (IVF-flat) candidate generator aligned with EmbeddingIndex row positions.
+
+    Rows are bucketed by their nearest k-means centroid; a query only scores
+    the rows in its nprobe closest buckets.
+    """
+
+    # Rows per list used when picking nlist for small corpora
+    MIN_ROWS_PER_LIST = 39
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, train_iterations: int = 20):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+
+        self._order = None
+        self._offsets = None
+
+    def __len__(self) -> int:
+        return len(self.assignments)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray):
+        """Learn centroids from the current rows and assign every row"""
+        nlist = max(1, min(self.nlist, len(vectors) // self.MIN_ROWS_PER_LIST))
+        # Train on a sample so training cost doesn't grow with the corpus
+        sample_size = min(len(vectors), nlist * 256)
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)]
+
+        self.centroids = spherical_kmeans(sample, nlist, self.train_iterations)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.add(vectors)
+        self.trained_size = len(vectors)
+        logger.info(f"Trained IVF index with {len(self.centroids)} lists over {len(vectors)} rows")
+
+    def add(self, vectors: np.ndarray):
+        """Assign new rows (appended after the existing ones) to their nearest list"""
+        if not len(vectors):
+            return
+        new = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+        self.assignments = np.concatenate([self.assignments, new])
+        self._order = None
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Row positions in the nprobe lists closest to the query"""
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind='stable')
+            self._offsets = np.searchsorted(self.assignments[self._order],
+                                            np.arange(len(self.centroids) + 1))
+
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = _top_k(self.centroids @ query, nprobe)
+        return np.concatenate([
+            self._order[self._offsets[c]:self._offsets[c + 1]] for c in probes
+        ])
+
+    def save(self, path: str, row_ids: np.ndarray, layout: str = ''):
+        """Persist centroids and assignments, keyed by embedding row id and by the
+        layout of the vectors they were trained on (see EmbeddingIndex.scan_layout)"""
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments,
+                 row_ids=row_ids[:len(self.assignments)], trained_size=self.trained_size,
+                 nprobe=self.nprobe, dim=self.centroids.shape[1], layout=layout)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, row_ids: np.ndarray, dim: int, layout: str = '') -> bool:
+        """Load a saved index if it matches the current rows, the query dimension
+        and the vector layout; returns False if stale"""
+        if not os.path.exists(path):
+            return False
+        try:
+            data = np.load(path)
+            # Files written before the layout was recorded can't be checked
+            if 'layout' not in data or str(data['layout']) != layout or data['centroids'].shape[1] != dim:
+                logger.info("Saved IVF index was built for different vectors, retraining")
+                return False
+            saved_ids = data['row_ids']
+            if len(saved_ids) > len(row_ids) or not np.array_equal(saved_ids, row_ids[:len(saved_ids)]):
+                logger.info("Saved IVF index does not match embeddings, retraining")
+                return False
+            self.centroids = data['centroids']
+            self.assignments = data['assignments']
+            self.trained_size = int(data['trained_size'])
+            self._order = None
+            return True
+        except Exception as e:
+            logger.warning(f"Could not load IVF index from {path}: {e}")
+            return False
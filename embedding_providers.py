@@ -0,0 +1,177 @@
+"""
+Embedding Providers - Backends that turn texts into embedding vectors
+"openai" calls the embeddings API; "hashing" and "sentence-transformers"
+run locally on the CPU, so archives can be embedded with no API key,
+no network and no API cost. Selected with embedding_provider in config.json.
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import List, Optional
+import logging
+
+import numpy as np
+
+try:
+    from openai import OpenAI, AsyncOpenAI
+except ImportError:  # Only needed by the openai provider
+    OpenAI = AsyncOpenAI = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Optional local model backend
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ('openai', 'hashing', 'sentence-transformers')
+
+# OpenAI embedding models: dimensions and USD per 1M input tokens
+OPENAI_MODELS = {
+    'text-embedding-3-small': (1536, 0.02),
+    'text-embedding-3-large': (3072, 0.13),
+    'text-embedding-ada-002': (1536, 0.10)
+}
+
+
+class EmbeddingProvider:
+    """Base class: embed() returns one vector per text and raises if the batch failed.
+
+    `model` names the vector space; it keys the embedding and query caches,
+    so vectors from different providers are never mixed up. Remote providers
+    go through request packing limits and the shared rate limiter.
+    """
+
+    name = 'base'
+    remote = False
+    cost_per_million_tokens = 0.0
+
+    def __init__(self, model: str, dimensions: int):
+        self.model = model
+        self.dimensions = dimensions
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def async_session(self):
+        """Per-run state for embed_async (an API client for remote providers)"""
+        yield None
+
+    async def embed_async(self, texts: List[str], session=None) -> List[List[float]]:
+        """Local providers are CPU-bound: run embed() off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.embed, texts)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI embeddings API (or a compatible server via base_url)"""
+
+    name = 'openai'
+    remote = True
+
+    def __init__(self, api_key: str, model: str = 'text-embedding-3-small',
+                 base_url: Optional[str] = None):
+        if OpenAI is None:
+            raise ImportError("OpenAI library not installed. Please run: pip install openai")
+        dimensions, self.cost_per_million_tokens = OPENAI_MODELS.get(model, (1536, 0.02))
+        super().__init__(model, dimensions)
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=self.model, input=texts, encoding_format="float")
+        return [data.embedding for data in response.data]
+
+    @asynccontextmanager
+    async def async_session(self):
+        # Retries are left to call_with_backoff
+        async with AsyncOpenAI(api_key=self.client.api_key, base_url=self.client.base_url,
+                               max_retries=0) as client:
+            yield client
+
+    async def embed_async(self, texts: List[str], session=None) -> List[List[float]]:
+        response = await session.embeddings.create(model=self.model, input=texts, encoding_format="float")
+        return [data.embedding for data in response.data]
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=1 << 20)
+def _hash_feature(feature: str) -> int:
+    """Stable 64-bit hash (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Deterministic feature-hashing vectors: no model, no network, same output everywhere.
+
+    Word unigrams and bigrams are hashed into `dimensions` signed buckets
+    with sublinear term frequency, then L2-normalized, so cosine similarity
+    measures lexical overlap. Good enough for backfills and offline runs.
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dimensions: int = 1024):
+        super().__init__(f'hashing-{dimensions}', dimensions)
+
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        # Empty or symbol-only text still gets a non-zero vector
+        return tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])] or ['<empty>']
+
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in Counter(self._features(text)).items():
+                hashed = _hash_feature(feature)
+                sign = 1.0 if hashed >> 63 else -1.0
+                vectors[row, hashed % self.dimensions] += sign * (1.0 + math.log(count))
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+        return list(vectors)
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """A sentence-transformers model from the hub cache or a local directory, run on CPU"""
+
+    name = 'sentence-transformers'
+
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', device: str = 'cpu', batch_size: int = 64):
+        if SentenceTransformer is None:
+            raise ImportError("sentence-transformers not installed. Please run: pip install sentence-transformers")
+        self._model = SentenceTransformer(model_name, device=device)
+        self.batch_size = batch_size
+        super().__init__(f'st-{os.path.basename(model_name.rstrip("/"))}',
+                         self._model.get_sentence_embedding_dimension())
+
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        vectors = self._model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                     normalize_embeddings=True, show_progress_bar=False)
+        return list(vectors.astype(np.float32))
+
+
+def create_embedding_provider(config: dict, api_key: Optional[str] = None) -> EmbeddingProvider:
+    """The provider named by config['embedding_provider'] (default "openai")"""
+    name = config.get('embedding_provider', 'openai')
+
+    if name == 'hashing':
+        return HashingEmbeddingProvider(config.get('hashing_dimensions', 1024))
+    if name == 'sentence-transformers':
+        return SentenceTransformerProvider(
+            config.get('sentence_transformer_model', 'all-MiniLM-L6-v2'),
+            device=config.get('sentence_transformer_device', 'cpu')
+        )
+    if name != 'openai':
+        raise ValueError(f"Unknown embedding_provider '{name}', expected one of {PROVIDERS}")
+    return OpenAIEmbeddingProvider(api_key, config.get('embedding_model', 'text-embedding-3-small'),
+                                   base_url=config.get('openai_base_url'))
@@ -0,0 +1,32 @@
+"""
+Rename versioned paper ids (2512.01537v1) to canonical arXiv ids.
+Older versions stored next to a newer one are linked to it instead of being
+processed and searched twice. PDFs are renamed to match. Safe to re-run.
+"""
+import json
+import os
+from database_manager import DatabaseManager
+
+with open('config.json', 'r') as f:
+    config = json.load(f)
+pdf_dir = config.get('pdf_directory', './data/pdfs')
+
+db = DatabaseManager()
+
+print("🔄 Moving papers to canonical arXiv ids...")
+results = db.migrate_canonical_ids()
+
+renamed_pdfs = 0
+for old_id, canonical in results['renamed'].items():
+    old_path = os.path.join(pdf_dir, f"{old_id}.pdf")
+    new_path = os.path.join(pdf_dir, f"{canonical}.pdf")
+    if os.path.exists(old_path) and not os.path.exists(new_path):
+        os.rename(old_path, new_path)
+        renamed_pdfs += 1
+
+print(f"✅ Renamed {len(results['renamed'])} papers ({renamed_pdfs} PDFs)")
+print(f"✅ Linked {results['duplicates']} older versions to their latest version")
+if results['failed']:
+    print(f"⚠️  Could not migrate {len(results['failed'])} papers: {results['failed'][:10]}")
+
+db.close()
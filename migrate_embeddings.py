@@ -0,0 +1,21 @@
+"""
+Convert pickled embedding blobs to the compact binary float32 format.
+Runs as one transaction: an interrupted run is rolled back and can simply be re-run.
+"""
+import argparse
+from database_manager import DatabaseManager
+
+parser = argparse.ArgumentParser(description="Migrate embeddings to binary float32 blobs")
+parser.add_argument("--batch-size", type=int, default=500, help="Rows read and converted per step")
+args = parser.parse_args()
+
+db = DatabaseManager()
+
+print("🔄 Converting pickled embeddings to binary float32...")
+results = db.migrate_embedding_blobs(batch_size=args.batch_size)
+
+print(f"✅ Converted {results['converted']} embeddings in {results['batches']} steps")
+if results['failed']:
+    print(f"⚠️  Could not convert {len(results['failed'])} rows: {results['failed'][:10]}")
+
+db.close()
@@ -3,6 +3,7 @@ Pipeline Orchestrator - Coordinates all components
 Author: Amaan
 """
 
+import asyncio
 import json
 import os
 from datetime import datetime
@@ -18,6 +19,7 @@ try:
     from pdf_parser import PDFParser
     from vector_store import VectorStore
     from paper_summarizer import PaperSummarizer
+    from rate_limiter import RateLimiter
 except ImportError as e:
     print(f"Error importing components: {e}")
     print("Make sure all component files are in the same directory.")
@@ -41,14 +43,16 @@ class PipelineOrchestrator:
             self.config = json.load(f)
         
         # Initialize components
+        # One manager for every component: each thread gets its own WAL
+        # connection, so searches never wait on an ingest in progress
         self.db = DatabaseManager()
-        self.arxiv_bot = ArxivBot()
-        self.pdf_parser = PDFParser()
-        self.vector_store = VectorStore()
+        self.arxiv_bot = ArxivBot(db=self.db)
+        self.pdf_parser = PDFParser(db=self.db)
+        self.vector_store = VectorStore(db=self.db)
 
         # Initialize summarizer (optional - only if enabled)
         try:
-            self.summarizer = PaperSummarizer()
+            self.summarizer = PaperSummarizer(db=self.db)
             self.summarizer_enabled = True
             logger.info("Paper Summarizer initialized successfully")
         except Exception as e:
@@ -86,19 +90,28 @@ class PipelineOrchestrator:
             results['steps']['parse'] = parse_results
             logger.info(f"✓ Parsed {parse_results['success']} papers")
             
-            # Step 3: Create embeddings
-            logger.info("Step 3: Creating embeddings...")
-            embedding_results = self.vector_store.process_all_papers()
+            # Steps 3-4 call OpenAI; in async mode they run concurrently under one rate limiter
+            summary_results = None
+            if self.config.get('async_pipeline', False):
+                logger.info("Steps 3-4: Creating embeddings and summaries (async)...")
+                embedding_results, summary_results = asyncio.run(self._run_openai_steps_async())
+            else:
+                # Step 3: Create embeddings
+                logger.info("Step 3: Creating embeddings...")
+                embedding_results = self.vector_store.process_all_papers()
             results['steps']['embeddings'] = embedding_results
             logger.info(f"✓ Created embeddings for {embedding_results['success']} papers")
             logger.info(f"  Estimated OpenAI API cost: ${embedding_results['estimated_cost']:.4f}")
+            logger.info(f"  Embedding cache hit rate: {embedding_results['cache_hit_rate']:.0%} "
+                        f"(~{embedding_results['tokens_avoided']} tokens avoided)")
 
             # Step 4: Generate summaries (if enabled)
             if self.summarizer_enabled and self.summarizer:
-                logger.info("Step 4: Generating structured summaries...")
-                summary_results = self.summarizer.generate_summaries_batch(
-                    limit=self.config.get('max_papers_per_run', 50)
-                )
+                if summary_results is None:
+                    logger.info("Step 4: Generating structured summaries...")
+                    summary_results = self.summarizer.generate_summaries_batch(
+                        limit=self.config.get('max_papers_per_run', 50)
+                    )
                 results['steps']['summaries'] = summary_results
                 logger.info(f"✓ Generated summaries for {summary_results['success']} papers")
                 logger.info(f"  Estimated OpenAI API cost: ${summary_results['estimated_cost']:.4f}")
@@ -106,6 +119,18 @@ class PipelineOrchestrator:
                 logger.info("Step 4: Skipping summary generation (disabled or unavailable)")
                 results['steps']['summaries'] = {'skipped': True}
 
+            # Step 5: Add newly embedded papers to the kNN paper graph
+            logger.info("Step 5: Updating paper similarity graph...")
+            graph_results = self.vector_store.update_paper_graph()
+            results['steps']['graph'] = graph_results
+            logger.info(f"✓ Updated neighbour lists of {graph_results['updated']} papers")
+
+            # Step 6: Refine topic clusters with the new papers
+            logger.info("Step 6: Refining topic clusters...")
+            topic_results = self.vector_store.update_topics()
+            results['steps']['topics'] = topic_results
+            logger.info(f"✓ {topic_results['clusters']} topics, {topic_results['reassigned']} papers (re)assigned")
+
             results['status'] = 'SUCCESS'
             
         except Exception as e:
@@ -133,9 +158,31 @@ class PipelineOrchestrator:
         
         return results
     
-    def search_papers(self, query: str, n_results: int = 5) -> Dict:
-        """Search papers using vector similarity"""
-        results = self.vector_store.semantic_search(query, n_results)
+    async def _run_openai_steps_async(self):
+        """Embeddings and summaries concurrently on AsyncOpenAI, sharing one rate limiter"""
+        limiter = RateLimiter.from_config(self.config)
+        embedding_step = self.vector_store.process_all_papers_async(limiter=limiter)
+
+        if self.summarizer_enabled and self.summarizer:
+            embedding_results, summary_results = await asyncio.gather(
+                embedding_step,
+                self.summarizer.generate_summaries_batch_async(
+                    limit=self.config.get('max_papers_per_run', 50), limiter=limiter
+                )
+            )
+        else:
+            embedding_results, summary_results = await embedding_step, None
+
+        logger.info(f"  Rate limiter held requests back for {limiter.waited_seconds:.1f}s")
+        return embedding_results, summary_results
+
+    def search_papers(self, query: str, n_results: int = 5, categories: list = None,
+                      date_from=None, date_to=None, has_summary: bool = None) -> Dict:
+        """Search papers using vector similarity, optionally restricted by category / date / summary"""
+        results = self.vector_store.semantic_search(
+            query, n_results, categories=categories, date_from=date_from,
+            date_to=date_to, has_summary=has_summary
+        )
         
         return {
             'query': query,
@@ -143,6 +190,42 @@ class PipelineOrchestrator:
             'timestamp': datetime.now().isoformat()
         }
     
+    def similar_papers(self, arxiv_id: str, k: int = 5) -> Dict:
+        """Papers most like arxiv_id, nearest by paper centroid"""
+        results = self.vector_store.similar_papers(arxiv_id, k)
+
+        return {
+            'arxiv_id': arxiv_id,
+            'results': results,
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def get_paper_graph(self, arxiv_ids: list, k: int = 3) -> Dict:
+        """Precomputed similarity graph around these papers (nodes + edges) for the UI"""
+        return self.vector_store.paper_neighborhood(arxiv_ids, k)
+    
+    def get_topics(self) -> list:
+        """Stored topic clusters (label, size), largest first"""
+        return self.db.get_topic_clusters()
+    
+    def get_paper_summary(self, arxiv_id: str):
+        """Load a paper's structured summary on demand (search results don't include it)"""
+        return self.db.get_paper_summary(arxiv_id)
+    
+    def search_papers_many(self, queries: list, n_results: int = 5, **filters) -> list:
+        """Search several queries with one batched embedding request and scoring pass"""
+        all_results = self.vector_store.semantic_search_many(queries, n_results, **filters)
+        timestamp = datetime.now().isoformat()
+
+        return [
+            {
+                'query': query,
+                'results': results,
+                'timestamp': timestamp
+            }
+            for query, results in zip(queries, all_results)
+        ]
+    
     def schedule_weekly_run(self):
         """Schedule pipeline to run weekly"""
         # Schedule for every Sunday at 2 AM
@@ -246,6 +329,8 @@ def main():
                     print(f"  📄 Papers parsed: {parse.get('success', 0)}")
                     print(f"  🔮 Embeddings created: {embed.get('success', 0)}")
                     print(f"  💰 API cost: ${embed.get('estimated_cost', 0):.4f}")
+                    print(f"  ♻️  Embedding cache hit rate: {embed.get('cache_hit_rate', 0):.0%} "
+                          f"(~{embed.get('tokens_avoided', 0)} tokens avoided)")
                 
             elif choice == "2":
                 status = orchestrator.get_status()
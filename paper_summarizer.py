@@ -3,21 +3,24 @@ Paper Summarizer - Generates structured summaries using fine-tuned model
 Author: Nikita
 """
 
+import asyncio
 import json
 import os
 import re
 from typing import Dict, List, Optional
 import logging
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from database_manager import DatabaseManager
+from embedding_batcher import count_tokens
+from rate_limiter import RateLimiter, call_with_backoff
 
 logger = logging.getLogger(__name__)
 
 class PaperSummarizer:
     """Generates structured summaries for research papers using fine-tuned model"""
 
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db: DatabaseManager = None):
+        self.db = db or DatabaseManager()
 
         # Load configuration
         with open('config.json', 'r') as f:
@@ -32,8 +35,8 @@ class PaperSummarizer:
                 "or add it to .streamlit/secrets.toml"
             )
 
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=api_key)
+        # Initialize OpenAI client (openai_base_url optionally points at a compatible server)
+        self.client = OpenAI(api_key=api_key, base_url=self.config.get('openai_base_url'))
 
         # Get fine-tuned model ID from config
         self.fine_tuned_model = self.config.get('fine_tuned_model')
@@ -84,28 +87,10 @@ class PaperSummarizer:
                 logger.info(f"Summary already exists for {paper_id}")
                 return True
 
-            # Get paper data
-            paper = self.db.get_paper(paper_id)
-            if not paper:
-                logger.error(f"Paper not found: {paper_id}")
+            prepared = self._prepare_request(paper_id)
+            if not prepared:
                 return False
-
-            # Get full text (prefer full_text, fallback to abstract)
-            text = paper.get('full_text') or paper.get('abstract')
-            if not text:
-                logger.error(f"No text available for {paper_id}")
-                return False
-
-            # Truncate text if needed
-            if len(text) > self.max_chars:
-                text = text[:self.max_chars]
-                logger.warning(f"Text truncated to {self.max_chars} chars for {paper_id}")
-
-            # Build prompt
-            prompt = self._build_prompt(text)
-
-            # Choose model
-            model = self.fine_tuned_model if self.fine_tuned_model else self.fallback_model
+            paper, prompt, model = prepared
 
             # Generate summary
             logger.info(f"Generating summary for {paper_id} using {model}")
@@ -115,8 +100,74 @@ class PaperSummarizer:
                 temperature=self.temperature
             )
 
-            raw_summary = response.choices[0].message.content
+            return self._store_summary(paper_id, paper, response.choices[0].message.content)
+
+        except Exception as e:
+            logger.error(f"Error generating summary for {paper_id}: {e}")
+            return False
+
+    async def generate_summary_async(self, paper_id: str, client: AsyncOpenAI,
+                                     limiter: RateLimiter) -> bool:
+        """generate_summary on AsyncOpenAI, through the pipeline's shared rate limiter"""
+        try:
+            if self.db.get_paper_summary(paper_id):
+                logger.info(f"Summary already exists for {paper_id}")
+                return True
+
+            prepared = self._prepare_request(paper_id)
+            if not prepared:
+                return False
+            paper, prompt, model = prepared
+
+            # Prompt plus a typical structured summary
+            tokens = count_tokens(prompt, model) + self.config.get('summary_expected_tokens', 1000)
+
+            logger.info(f"Generating summary for {paper_id} using {model}")
+            response = await call_with_backoff(
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=self.temperature
+                ),
+                limiter, tokens, max_retries=self.config.get('openai_max_retries', 5)
+            )
+
+            return self._store_summary(paper_id, paper, response.choices[0].message.content)
+
+        except Exception as e:
+            logger.error(f"Error generating summary for {paper_id}: {e}")
+            return False
+
+    def _prepare_request(self, paper_id: str) -> Optional[tuple]:
+        """(paper, prompt, model) for a paper, None if there is nothing to summarize"""
+        # Get paper data
+        paper = self.db.get_paper(paper_id, content=('full_text',))
+        if not paper:
+            logger.error(f"Paper not found: {paper_id}")
+            return None
+
+        # Get full text (prefer full_text, fallback to abstract)
+        text = paper.get('full_text') or paper.get('abstract')
+        if not text:
+            logger.error(f"No text available for {paper_id}")
+            return None
+
+        # Truncate text if needed
+        if len(text) > self.max_chars:
+            text = text[:self.max_chars]
+            logger.warning(f"Text truncated to {self.max_chars} chars for {paper_id}")
+
+        # Build prompt
+        prompt = self._build_prompt(text)
+
+        # Choose model
+        model = self.fine_tuned_model if self.fine_tuned_model else self.fallback_model
+
+        return paper, prompt, model
 
+    def _store_summary(self, paper_id: str, paper: Dict, raw_summary: str) -> bool:
+        """Parse, score and store a generated summary"""
+        try:
             # Parse summary sections
             sections = self._parse_summary_sections(raw_summary)
 
@@ -144,7 +195,7 @@ class PaperSummarizer:
             return True
 
         except Exception as e:
-            logger.error(f"Error generating summary for {paper_id}: {e}")
+            logger.error(f"Error storing summary for {paper_id}: {e}")
             return False
 
     def generate_summaries_batch(self, limit: int = 50) -> Dict:
@@ -160,20 +211,64 @@ class PaperSummarizer:
             'estimated_cost': 0.0
         }
 
+        for paper_id in self._papers_with_text(papers, results):
+            if self.generate_summary(paper_id):
+                results['success'] += 1
+            else:
+                results['failed'].append(paper_id)
+
+        return self._finish_batch(results)
+
+    async def generate_summaries_batch_async(self, limit: int = 50,
+                                             limiter: Optional[RateLimiter] = None) -> Dict:
+        """generate_summaries_batch with up to summary_concurrency requests in flight"""
+        limiter = limiter or RateLimiter.from_config(self.config)
+        papers = self.db.get_papers_without_summaries(limit)
+
+        results = {
+            'total': len(papers),
+            'success': 0,
+            'failed': [],
+            'skipped': 0,
+            'estimated_cost': 0.0
+        }
+
+        paper_ids = self._papers_with_text(papers, results)
+        semaphore = asyncio.Semaphore(self.config.get('summary_concurrency', 4))
+
+        async with AsyncOpenAI(api_key=self.client.api_key, base_url=self.client.base_url,
+                               max_retries=0) as client:
+            async def summarize(paper_id):
+                async with semaphore:
+                    return await self.generate_summary_async(paper_id, client, limiter)
+
+            outcomes = await asyncio.gather(*(summarize(paper_id) for paper_id in paper_ids))
+
+        for paper_id, ok in zip(paper_ids, outcomes):
+            if ok:
+                results['success'] += 1
+            else:
+                results['failed'].append(paper_id)
+
+        return self._finish_batch(results)
+
+    def _papers_with_text(self, papers: List[Dict], results: Dict) -> List[str]:
+        """Ids of papers that have text to summarize; the rest are counted as skipped"""
+        paper_ids = []
         for paper in papers:
             paper_id = paper['arxiv_id']
 
             # Check if we should skip (no text available)
-            if not paper.get('full_text') and not paper.get('abstract'):
+            if not paper.get('has_full_text') and not paper.get('abstract'):
                 results['skipped'] += 1
                 logger.warning(f"Skipping {paper_id}: no text available")
                 continue
 
-            if self.generate_summary(paper_id):
-                results['success'] += 1
-            else:
-                results['failed'].append(paper_id)
+            paper_ids.append(paper_id)
+        return paper_ids
 
+    def _finish_batch(self, results: Dict) -> Dict:
+        """Add the cost estimate and log the batch outcome"""
         # Estimate cost (rough estimate based on tokens)
         # Fine-tuned models typically cost more than base models
         # Assuming ~1000 tokens per summary * $0.012 per 1K tokens for gpt-4o-mini fine-tuned
@@ -6,26 +6,55 @@ Author: Amaan
 import PyPDF2
 import re
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 import logging
 from database_manager import DatabaseManager
+from dedup import NearDuplicateDetector
 
 logger = logging.getLogger(__name__)
 
+# Standard paper sections found by _extract_sections; each one long enough becomes a chunk of that type
+SECTION_PATTERNS = {
+    'abstract': r'(?i)\babstract\b.*?(?=\n\s*\n|\b(?:introduction|1\.|keywords)\b)',
+    'introduction': r'(?i)\b(?:1\.?\s*)?introduction\b.*?(?=\n\s*(?:2\.|related|background|method))',
+    'methodology': r'(?i)\b(?:3\.?\s*)?(?:method|methodology|approach)\b.*?(?=\n\s*(?:4\.|experiment|evaluation|results))',
+    'results': r'(?i)\b(?:4\.?\s*)?(?:results|experiments|evaluation)\b.*?(?=\n\s*(?:5\.|discussion|conclusion|related))',
+    'conclusion': r'(?i)\b(?:5\.?\s*)?(?:conclusion|summary)\b.*?(?=\n\s*(?:references|acknowledgment|\Z))'
+}
+
+# Chunk types prepare_chunks_for_embedding produces: title + abstract, the sections,
+# or overlapping windows of the full text when no section was found
+CHUNK_TYPES = ('intro',) + tuple(SECTION_PATTERNS) + ('content',)
+
 class PDFParser:
     """Extracts text from PDFs and stores in SQLite"""
     
-    def __init__(self, pdf_dir="./data/pdfs"):
+    def __init__(self, pdf_dir="./data/pdfs", db: DatabaseManager = None):
         self.pdf_dir = pdf_dir
-        self.db = DatabaseManager()
+        self.db = db or DatabaseManager()
+        self.dedup = NearDuplicateDetector(self.db)
     
     def parse_paper(self, arxiv_id: str) -> bool:
         """Parse a single paper and store in database"""
+        content = self._parse_content(arxiv_id)
+        if content is None:
+            return False
+        
+        # Update database
+        if not self.db.update_paper_content(*content):
+            return False
+        
+        logger.info(f"Parsed paper: {arxiv_id}")
+        return True
+    
+    def _parse_content(self, arxiv_id: str) -> Optional[tuple]:
+        """(arxiv_id, full_text, sections, duplicate_of) for a paper's PDF, None if it could not
+        be parsed; duplicate_of is the paper with the same text, if any, for the caller to store"""
         pdf_path = os.path.join(self.pdf_dir, f"{arxiv_id}.pdf")
         
         if not os.path.exists(pdf_path):
             logger.error(f"PDF not found: {pdf_path}")
-            return False
+            return None
         
         try:
             # Extract text from PDF
@@ -34,18 +63,17 @@ class PDFParser:
             # Extract sections
             sections = self._extract_sections(full_text)
             
-            # Update database
-            self.db.update_paper_content(arxiv_id, full_text, sections)
+            # Same text as a paper we already have: link it so it isn't embedded or summarized
+            original = self.dedup.check(arxiv_id, full_text, 'full_text')
             
-            logger.info(f"Parsed paper: {arxiv_id}")
-            return True
+            return arxiv_id, full_text, sections, original
             
         except Exception as e:
             logger.error(f"Error parsing {arxiv_id}: {e}")
-            return False
+            return None
     
-    def parse_all_unprocessed(self, limit=50) -> Dict:
-        """Parse all unprocessed papers"""
+    def parse_all_unprocessed(self, limit=50, batch_size=10) -> Dict:
+        """Parse all unprocessed papers, storing batch_size papers per transaction"""
         papers = self.db.get_unprocessed_papers(limit)
         
         results = {
@@ -54,11 +82,23 @@ class PDFParser:
             'failed': []
         }
         
-        for paper in papers:
-            if self.parse_paper(paper['arxiv_id']):
-                results['success'] += 1
-            else:
+        parsed, duplicates = [], []
+        for i, paper in enumerate(papers):
+            content = self._parse_content(paper['arxiv_id'])
+            if content is None:
                 results['failed'].append(paper['arxiv_id'])
+            else:
+                arxiv_id, full_text, sections, original = content
+                parsed.append((arxiv_id, full_text, sections))
+                if original:
+                    duplicates.append((arxiv_id, original))
+            
+            if parsed and (len(parsed) >= batch_size or i == len(papers) - 1):
+                if self.db.update_paper_contents_bulk(parsed, duplicates):
+                    results['success'] += len(parsed)
+                else:
+                    results['failed'].extend(arxiv_id for arxiv_id, _, _ in parsed)
+                parsed, duplicates = [], []
         
         logger.info(f"Parsed {results['success']}/{results['total']} papers")
         return results
@@ -84,16 +124,7 @@ class PDFParser:
         """Extract standard paper sections"""
         sections = {}
         
-        # Common section patterns
-        patterns = {
-            'abstract': r'(?i)\babstract\b.*?(?=\n\s*\n|\b(?:introduction|1\.|keywords)\b)',
-            'introduction': r'(?i)\b(?:1\.?\s*)?introduction\b.*?(?=\n\s*(?:2\.|related|background|method))',
-            'methodology': r'(?i)\b(?:3\.?\s*)?(?:method|methodology|approach)\b.*?(?=\n\s*(?:4\.|experiment|evaluation|results))',
-            'results': r'(?i)\b(?:4\.?\s*)?(?:results|experiments|evaluation)\b.*?(?=\n\s*(?:5\.|discussion|conclusion|related))',
-            'conclusion': r'(?i)\b(?:5\.?\s*)?(?:conclusion|summary)\b.*?(?=\n\s*(?:references|acknowledgment|\Z))'
-        }
-        
-        for section_name, pattern in patterns.items():
+        for section_name, pattern in SECTION_PATTERNS.items():
             match = re.search(pattern, text, re.DOTALL)
             if match:
                 section_text = match.group()
@@ -105,7 +136,7 @@ class PDFParser:
     
     def prepare_chunks_for_embedding(self, arxiv_id: str) -> List[Dict]:
         """Prepare text chunks for vector embedding"""
-        paper = self.db.get_paper(arxiv_id)
+        paper = self.db.get_paper(arxiv_id, content=('full_text', 'sections'))
         
         if not paper or not paper.get('full_text'):
             return []
@@ -0,0 +1,120 @@
+"""
+Rate Limiter - Shared requests/tokens per minute budget for async OpenAI calls
+One RateLimiter is shared by every component in a pipeline run, so embeddings
+and summaries together stay under the account limits.
+"""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Two token buckets (requests per minute, tokens per minute) for asyncio code.
+
+    acquire() waits until both buckets can cover a request; a limit of 0 or
+    None disables that bucket. pause() stops every caller for a while, e.g.
+    after the API answered 429.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute or 0
+        self.tokens_per_minute = tokens_per_minute or 0
+
+        self._requests = float(self.requests_per_minute)
+        self._tokens = float(self.tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = None
+
+        self.waited_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'RateLimiter':
+        return cls(config.get('openai_requests_per_minute'), config.get('openai_tokens_per_minute'))
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute,
+                                 self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until a request of this size fits, 0 if it fits now"""
+        wait = max(0.0, self._paused_until - now)
+        if self.requests_per_minute and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int = 0):
+        """Wait for room for one request using about `tokens` tokens"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # A request larger than the whole bucket would never fit
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        # Callers are served in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    break
+                self.waited_seconds += wait
+                await asyncio.sleep(wait)
+
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+
+    def pause(self, seconds: float):
+        """Hold back all callers for `seconds`"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on an API error, if present"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('retry-after')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def call_with_backoff(request: Callable[[], Awaitable], limiter: RateLimiter, tokens: int = 0,
+                            max_retries: int = 5, base_delay: float = 1.0):
+    """Await request() under the limiter, retrying 429 and 5xx responses with exponential backoff.
+
+    A 429 also pauses the shared limiter, so other callers back off too.
+    """
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(tokens)
+        try:
+            return await request()
+        except Exception as e:
+            status = getattr(e, 'status_code', None)
+            if status is None or (status != 429 and status < 500) or attempt == max_retries:
+                raise
+            delay = _retry_after(e) or base_delay * 2 ** attempt * (1 + 0.25 * random.random())
+            logger.warning(f"OpenAI returned {status}, retrying in {delay:.1f}s "
+                           f"(attempt {attempt + 1}/{max_retries})")
+            if status == 429:
+                limiter.pause(delay)  # the next acquire() waits it out
+            else:
+                await asyncio.sleep(delay)
@@ -8,10 +8,32 @@ cursor = conn.cursor()
 cursor.execute("DELETE FROM embeddings")
 print(f"✅ Deleted {cursor.rowcount} old embeddings")
 
+# Queued retries refer to the old chunks
+cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'embedding_retry_queue'")
+if cursor.fetchone():
+    cursor.execute("DELETE FROM embedding_retry_queue")
+    print(f"✅ Cleared {cursor.rowcount} queued embedding retries")
+
+# Paper centroids, the paper graph and topics are derived from the deleted chunks
+cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'paper_centroids'")
+if cursor.fetchone():
+    cursor.execute("DELETE FROM paper_centroids")
+    print(f"✅ Cleared {cursor.rowcount} paper centroids")
+cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'paper_neighbors'")
+if cursor.fetchone():
+    cursor.execute("DELETE FROM paper_neighbors")
+    print(f"✅ Cleared {cursor.rowcount} paper graph edges")
+for table in ('topic_clusters', 'paper_topics'):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,))
+    if cursor.fetchone():
+        cursor.execute(f"DELETE FROM {table}")
+print("✅ Cleared topic clusters")
+
 # Reset the embedding flags on papers
 cursor.execute("UPDATE papers SET embedding_created = 0")
 print(f"✅ Reset {cursor.rowcount} papers for re-embedding")
 
 conn.commit()
 conn.close()
-print("✅ Ready to create new OpenAI embeddings!")
\ No newline at end of file
+# embedding_cache is kept on purpose: unchanged chunks are re-used without API calls
+print("✅ Ready to create new OpenAI embeddings! (cached chunk embeddings will be re-used)")
\ No newline at end of file
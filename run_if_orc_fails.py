@@ -12,9 +12,11 @@ parse_results = orchestrator.pdf_parser.parse_all_unprocessed(limit=64)
 print(f"✅ Parsed {parse_results['success']} papers")
 
 # Step 2: Create embeddings  
-print("\n🔮 Step 2: Creating OpenAI embeddings...")
+print("\n🔮 Step 2: Creating embeddings...")
 embedding_results = orchestrator.vector_store.process_all_papers(limit=64)
 print(f"✅ Created embeddings for {embedding_results['success']} papers")
 print(f"💰 Estimated cost: ${embedding_results['estimated_cost']:.4f}")
+print(f"♻️  Embedding cache hit rate: {embedding_results['cache_hit_rate']:.0%} "
+      f"(~{embedding_results['tokens_avoided']} tokens avoided)")
 
 print("\n✨ Pipeline complete! You can now search.")
\ No newline at end of file
@@ -21,6 +21,13 @@ def init_orchestrator():
 
 orchestrator = init_orchestrator()
 
+
+def dot_string(text) -> str:
+    """Quote text for DOT source: backslashes first (or a trailing one would escape the
+    closing quote), then quotes; line breaks become DOT's \\n"""
+    text = str(text).replace("\\", "\\\\").replace('"', '\\"')
+    return '"' + text.replace("\r", "").replace("\n", "\\n") + '"'
+
 # ---------- Page layout ----------
 st.title("🧬 Medical Research Paper RAG Bot")
 st.markdown(
@@ -116,14 +123,22 @@ with col_chat:
 with col_graph:
     st.subheader("Knowledge Graph")
     if st.session_state.last_papers:
-        st.write("Graph of relationships between the retrieved papers and concepts.")
-        # Placeholder for Graphiti visualization:
-        # fig = build_graph(st.session_state.last_papers)
-        # st.plotly_chart(fig, use_container_width=True)
-        st.info(
-            "Connect this section to your Graphiti-based visualization.\n"
-            "Use the list of `last_papers` from session_state as the nodes/edges source."
-        )
+        st.write("Retrieved papers (filled) and their nearest neighbours in the library.")
+        # Neighbour lists are precomputed by the pipeline, this is only a lookup
+        graph = orchestrator.get_paper_graph([p["arxiv_id"] for p in st.session_state.last_papers], k=3)
+        if graph["edges"]:
+            lines = ["graph {", '  node [shape=box, style="rounded,filled", fontsize=10];']
+            for arxiv_id, node in graph["nodes"].items():
+                label = dot_string(" ".join(node["title"].split())[:40])
+                color = "#93c5fd" if node["seed"] else "#f1f5f9"
+                lines.append(f'  {dot_string(arxiv_id)} [label={label}, fillcolor="{color}", '
+                             f'tooltip={dot_string(arxiv_id)}];')
+            for a, b, similarity in graph["edges"]:
+                lines.append(f'  {dot_string(a)} -- {dot_string(b)} [penwidth={1 + 3 * max(similarity, 0):.1f}];')
+            lines.append("}")
+            st.graphviz_chart("\n".join(lines), use_container_width=True)
+        else:
+            st.info("No graph yet for these papers. It is built by the pipeline after embedding.")
     else:
         st.info("Run a search to see the graph of related papers.")
 
@@ -0,0 +1,30 @@
+"""
+Shared pytest setup: the project modules live at the repository root
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """The components read config.json from the working directory: run in tmp_path
+    with the repository's config, changed through the returned write_config(**overrides)"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    with open(os.path.join(REPO_ROOT, 'config.json')) as f:
+        config = json.load(f)
+
+    def write_config(**overrides):
+        config.update(overrides)
+        with open(tmp_path / 'config.json', 'w') as f:
+            json.dump(config, f)
+
+    write_config()
+    return write_config
@@ -0,0 +1,120 @@
+"""
+Schema migrations: PRAGMA user_version bookkeeping and the indexes each
+migration promises, checked with EXPLAIN QUERY PLAN
+"""
+
+import pickle
+import sqlite3
+
+import pytest
+
+from database_manager import EMBEDDING_MAGIC, DatabaseManager, decode_embedding
+
+QUERY_PLAN_CHECKS = [
+    (version, sql, index)
+    for version, _, _, checks in DatabaseManager._MIGRATIONS
+    for sql, index in checks
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'ragbot.db'))
+    yield manager
+    manager.close()
+
+
+def test_fresh_database_is_at_schema_version(db):
+    assert db.conn.execute("PRAGMA user_version").fetchone()[0] == DatabaseManager.SCHEMA_VERSION
+
+
+def test_migration_versions_are_consecutive():
+    versions = [version for version, _, _, _ in DatabaseManager._MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+@pytest.mark.parametrize('version, sql, index', QUERY_PLAN_CHECKS,
+                         ids=[index for _, _, index in QUERY_PLAN_CHECKS])
+def test_query_uses_migration_index(db, version, sql, index):
+    assert db.query_uses_index(sql, index), db.explain_query_plan(sql)
+
+
+def test_reopening_does_not_rerun_migrations(tmp_path):
+    path = str(tmp_path / 'ragbot.db')
+    DatabaseManager(path).close()
+
+    manager = DatabaseManager(path)
+    manager._migrate_query_indexes = lambda: pytest.fail("migration ran twice")
+    manager._run_migrations()
+    manager.close()
+
+
+def test_legacy_database_is_migrated(tmp_path):
+    # Layout from before the migration runner: inline full text, no version columns
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE papers (
+        arxiv_id TEXT PRIMARY KEY, title TEXT NOT NULL, abstract TEXT, authors TEXT,
+        published_date DATETIME, categories TEXT, pdf_url TEXT, pdf_downloaded BOOLEAN DEFAULT 0,
+        full_text TEXT, sections TEXT, processed BOOLEAN DEFAULT 0,
+        embedding_created BOOLEAN DEFAULT 0, summary_generated BOOLEAN DEFAULT 0,
+        fetched_date DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("""
+    INSERT INTO papers (arxiv_id, title, authors, categories, full_text, sections, processed, pdf_downloaded)
+    VALUES ('2401.00001', 'T', '[]', '[]', 'full text', '{"introduction": "intro"}', 1, 1)
+    """)
+    conn.commit()
+    conn.close()
+
+    manager = DatabaseManager(path)
+    columns = {row[1] for row in manager.conn.execute("PRAGMA table_info(papers)")}
+    assert {'version', 'duplicate_of'} <= columns
+    assert not {'full_text', 'sections'} & columns
+    assert manager.get_paper_content('2401.00001') == {'full_text': 'full text',
+                                                       'sections': {'introduction': 'intro'}}
+    assert manager.get_stats()['processed_papers'] == 1
+    manager.close()
+
+
+def test_summary_watermark_moves_on_insert_replace_and_delete(db):
+    def store(paper_id):
+        db.store_paper_summary(paper_id=paper_id, title='T', authors='', date='', abstract_summary='',
+                               methodology='', results='', related_work='', raw_summary='', structure_score=50)
+
+    assert db.get_summary_watermark() == (0, 0)
+    store('2401.00001')
+    store('2401.00002')
+    removed, max_rowid = db.get_summary_watermark()
+    assert removed == 0 and db.get_summarized_paper_ids(after_rowid=max_rowid - 1) == ['2401.00002']
+
+    store('2401.00001')  # INSERT OR REPLACE deletes the old row first
+    assert db.get_summary_watermark() == (1, max_rowid + 1)
+
+    db.delete_paper_summary('2401.00001')
+    store('2401.00003')  # may reuse the deleted row's rowid
+    assert db.get_summary_watermark()[0] == 2
+    assert db.get_summary_stats()['total_summaries'] == 2
+
+
+def test_embedding_blob_migration_bumps_generation_once(db):
+    db.insert_paper({'arxiv_id': '2401.00001', 'title': 'T', 'abstract': 'a'})
+    db.conn.executemany("""
+    INSERT INTO embeddings (paper_id, chunk_index, chunk_text, embedding, chunk_type)
+    VALUES ('2401.00001', ?, 'text', ?, 'content')
+    """, [(i, pickle.dumps([float(i), 1.0, 2.0])) for i in range(7)])
+    db.conn.commit()
+    generation = db.get_embedding_generation()
+
+    results = db.migrate_embedding_blobs(batch_size=3)
+
+    assert (results['converted'], results['batches']) == (7, 3)
+    assert db.get_embedding_generation() == generation + 1
+    blobs = [row[0] for row in db.conn.execute("SELECT embedding FROM embeddings ORDER BY chunk_index")]
+    assert all(blob[:4] == EMBEDDING_MAGIC for blob in blobs)
+    assert list(decode_embedding(blobs[5])) == [5.0, 1.0, 2.0]
+
+    assert db.migrate_embedding_blobs()['converted'] == 0
+    assert db.get_embedding_generation() == generation + 1
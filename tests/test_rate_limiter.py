@@ -0,0 +1,222 @@
+"""
+Rate limiting against a stub OpenAI server that answers 429 with Retry-After:
+call_with_backoff retries and honours the header, the shared limiter pauses,
+and the async embedding and summary runs still return every result in order
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+openai = pytest.importorskip('openai')
+
+from database_manager import DatabaseManager, decode_embedding
+from rate_limiter import RateLimiter, call_with_backoff
+
+RETRY_AFTER = 0.2
+DIMENSIONS = 16
+
+
+def stub_embedding(text: str) -> list:
+    """Deterministic vector per input text, so stored rows can be matched to their chunk"""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:4], 'little')
+    return np.random.default_rng(seed).standard_normal(DIMENSIONS).tolist()
+
+
+class StubOpenAI:
+    """Local /v1/embeddings and /v1/chat/completions. The first `throttle_first`
+    requests and every `throttle_every`-th one are answered with 429"""
+
+    def __init__(self, throttle_every: int = 0, throttle_first: int = 0):
+        self.throttle_every = throttle_every
+        self.throttle_first = throttle_first
+        self.requests = 0
+        self.throttled = 0
+        self.request_times = []
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if stub._throttle():
+                    self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                               {'retry-after': str(RETRY_AFTER)})
+                elif self.path.endswith('/embeddings'):
+                    inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+                    self._send(200, {
+                        'object': 'list', 'model': body['model'],
+                        'data': [{'object': 'embedding', 'index': i, 'embedding': stub_embedding(text)}
+                                 for i, text in enumerate(inputs)],
+                        'usage': {'prompt_tokens': 1, 'total_tokens': 1}
+                    })
+                else:
+                    prompt = body['messages'][-1]['content']
+                    marker = re.search(r'MARKER-\w+', prompt).group(0)
+                    self._send(200, {
+                        'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {
+                            'role': 'assistant',
+                            'content': f"**Title:** {marker}\n\n**Authors:** A\n\n**Date:** 2024\n\n"
+                                       "**Abstract:** a\n\n**Methodology:** m\n\n**Results:** r\n\n"
+                                       "**Related Work:** w"}}],
+                        'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+                    })
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _throttle(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            self.request_times.append(time.monotonic())
+            throttle = (self.requests <= self.throttle_first or
+                        bool(self.throttle_every) and self.requests % self.throttle_every == 0)
+            self.throttled += throttle
+            return throttle
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_factory():
+    stubs = []
+
+    def start(**kwargs):
+        stubs.append(StubOpenAI(**kwargs))
+        return stubs[-1]
+
+    yield start
+    for stub in stubs:
+        stub.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'ragbot.db'))
+    yield manager
+    manager.close()
+
+
+def add_parsed_papers(db, count):
+    """Papers with parsed content and no sections, so they are chunked from the full text"""
+    paper_ids = [f'2401.{i:05d}' for i in range(count)]
+    db.insert_papers_bulk([{'arxiv_id': paper_id, 'title': f'Paper {i}', 'authors': ['A. Author'],
+                            'abstract': f'Abstract MARKER-{i}'} for i, paper_id in enumerate(paper_ids)])
+    db.update_paper_contents_bulk([
+        (paper_id, f'MARKER-{i} ' + ' '.join(f'word{i}_{w}' for w in range(400)), {})
+        for i, paper_id in enumerate(paper_ids)])
+    return paper_ids
+
+
+def test_pause_holds_back_acquire():
+    limiter = RateLimiter()
+    limiter.pause(RETRY_AFTER)
+
+    start = time.monotonic()
+    asyncio.run(limiter.acquire())
+
+    assert time.monotonic() - start >= RETRY_AFTER * 0.9
+    assert limiter.waited_seconds >= RETRY_AFTER * 0.9
+
+
+def test_call_with_backoff_retries_after_retry_after(stub_factory):
+    stub = stub_factory(throttle_first=2)
+    limiter = RateLimiter()
+
+    async def run():
+        async with openai.AsyncOpenAI(api_key='sk-test', base_url=stub.url, max_retries=0) as client:
+            return await call_with_backoff(
+                lambda: client.embeddings.create(model='text-embedding-3-small', input=['hello']),
+                limiter, max_retries=3, base_delay=30)
+
+    response = asyncio.run(run())
+
+    assert response.data[0].embedding == pytest.approx(stub_embedding('hello'))
+    assert (stub.requests, stub.throttled) == (3, 2)
+    # Each retry waited for the header's delay (not the 30s base delay) on the limiter
+    gaps = np.diff(stub.request_times)
+    assert all(RETRY_AFTER * 0.9 <= gap < 5 for gap in gaps)
+    assert limiter.waited_seconds >= 2 * RETRY_AFTER * 0.9
+
+
+def test_call_with_backoff_raises_when_retries_run_out(stub_factory):
+    stub = stub_factory(throttle_every=1)
+    limiter = RateLimiter()
+
+    async def run():
+        async with openai.AsyncOpenAI(api_key='sk-test', base_url=stub.url, max_retries=0) as client:
+            return await call_with_backoff(
+                lambda: client.embeddings.create(model='text-embedding-3-small', input=['hello']),
+                limiter, max_retries=2)
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(run())
+    assert stub.requests == 3
+
+
+def test_process_all_papers_async_stores_every_chunk_in_order(stub_factory, workdir, db):
+    from vector_store import VectorStore
+
+    stub = stub_factory(throttle_every=3)
+    workdir(openai_base_url=stub.url, embedding_provider='openai', embedding_concurrency=4,
+            embedding_max_request_tokens=2000)
+    paper_ids = add_parsed_papers(db, 12)
+    store = VectorStore(db=db)
+    expected = {paper_id: [chunk['text'] for chunk in store.parser.prepare_chunks_for_embedding(paper_id)]
+                for paper_id in paper_ids}
+
+    results = asyncio.run(store.process_all_papers_async(limit=len(paper_ids)))
+
+    assert stub.throttled > 0
+    assert results['success'] == len(paper_ids)
+    assert results['failed'] == [] and results['queued'] == []
+    for paper_id, texts in expected.items():
+        rows = db.conn.execute("""
+        SELECT chunk_index, chunk_text, embedding FROM embeddings WHERE paper_id = ? ORDER BY chunk_index
+        """, (paper_id,)).fetchall()
+        assert [row[0] for row in rows] == list(range(len(texts)))
+        assert [row[1] for row in rows] == texts
+        for _, text, blob in rows:
+            assert decode_embedding(blob) == pytest.approx(stub_embedding(text), rel=1e-6)
+
+
+def test_generate_summaries_batch_async_summarizes_every_paper(stub_factory, workdir, db):
+    from paper_summarizer import PaperSummarizer
+
+    stub = stub_factory(throttle_every=3)
+    workdir(openai_base_url=stub.url, summary_concurrency=4)
+    paper_ids = add_parsed_papers(db, 9)
+    summarizer = PaperSummarizer(db=db)
+
+    results = asyncio.run(summarizer.generate_summaries_batch_async(limit=len(paper_ids)))
+
+    assert stub.throttled > 0
+    assert results['success'] == len(paper_ids)
+    assert results['failed'] == []
+    for i, paper_id in enumerate(paper_ids):
+        assert db.get_paper_summary(paper_id)['title'] == f'MARKER-{i}'
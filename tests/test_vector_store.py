@@ -0,0 +1,45 @@
+"""
+VectorStore against a temporary database with the local hashing provider
+"""
+
+import numpy as np
+import pytest
+
+from database_manager import DatabaseManager
+
+DIMENSIONS = 64
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'ragbot.db'))
+    yield manager
+    manager.close()
+
+
+def add_embedded_papers(db, papers=40, chunks=5):
+    db.insert_papers_bulk([{'arxiv_id': f'2401.{i:05d}', 'title': f'Paper {i}', 'abstract': 'a'}
+                           for i in range(papers)])
+    rng = np.random.default_rng(0)
+    db.store_embeddings_bulk([(f'2401.{i:05d}', c, f'chunk {c} of paper {i}', rng.standard_normal(DIMENSIONS),
+                               'content') for i in range(papers) for c in range(chunks)], mark_created=True)
+
+
+def test_saved_ivf_index_is_retrained_when_scan_dimensions_change(workdir, db):
+    from vector_store import VectorStore
+
+    workdir(embedding_provider='hashing', hashing_dimensions=DIMENSIONS, search_engine='ivf', scan_dimensions=0)
+    add_embedded_papers(db)
+    first = VectorStore(db=db)
+    assert first.semantic_search('paper chunk', 3)
+    assert first.ann.centroids.shape[1] == DIMENSIONS
+
+    workdir(scan_dimensions=DIMENSIONS // 2)
+    second = VectorStore(db=db)
+    assert len(second.semantic_search('paper chunk', 3)) == 3
+    assert second.ann.centroids.shape[1] == DIMENSIONS // 2
+
+    # The retrained file is reused by the next instance with the same setup
+    third = VectorStore(db=db)
+    third.refresh_index()
+    assert np.array_equal(third.ann.centroids, second.ann.centroids)
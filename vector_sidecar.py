@@ -0,0 +1,200 @@
+"""
+Vector Sidecar - Append-only memory-mapped file of normalized embeddings
+Lets every process that opens the same database share one page-cached copy
+of the vectors instead of decoding them from SQLite.
+"""
+
+import json
+import os
+import numpy as np
+from contextlib import contextmanager
+from typing import Optional
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows - appends are not locked
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class VectorSidecar:
+    """Raw float32 vectors + int64 row ids stored next to the database, opened with np.memmap.
+
+    Layout (for data/ragbot.db, generation G):
+      ragbot.vectors.gG.f32  rows x dim little-endian float32, normalized
+      ragbot.vectors.gG.ids  rows little-endian int64 embedding row ids (ascending)
+      ragbot.vectors.json    {"generation", "dim", "rows", "last_row_id"}
+    The metadata file is only rewritten after the data is on disk, so a crashed
+    append leaves trailing bytes that are ignored and overwritten next time.
+    Data files are named by generation so a rebuild never truncates a file that
+    another process still has mapped.
+    """
+
+    def __init__(self, db_path: str):
+        self.base_path = os.path.splitext(db_path)[0] + '.vectors'
+        self.meta_path = self.base_path + '.json'
+        self.lock_path = self.base_path + '.lock'
+
+        self.generation = None
+        self.dim = 0
+        self.rows = 0
+        self.last_row_id = 0
+
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.row_ids = np.empty(0, dtype=np.int64)
+
+    @property
+    def vectors_path(self) -> str:
+        return f"{self.base_path}.g{self.generation}.f32"
+
+    @property
+    def ids_path(self) -> str:
+        return f"{self.base_path}.g{self.generation}.ids"
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self.meta_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'generation': self.generation,
+                'dim': self.dim,
+                'rows': self.rows,
+                'last_row_id': self.last_row_id
+            }, f)
+        os.replace(tmp_path, self.meta_path)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock so only one process appends at a time"""
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _map(self):
+        """(Re)map the files for the rows recorded in the metadata"""
+        if self.rows == 0:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+            self.row_ids = np.empty(0, dtype=np.int64)
+            return
+        self.vectors = np.memmap(self.vectors_path, dtype='<f4', mode='r', shape=(self.rows, self.dim))
+        self.row_ids = np.memmap(self.ids_path, dtype='<i8', mode='r', shape=(self.rows,))
+
+    def open(self, generation: int, max_row_id: int) -> bool:
+        """Map the sidecar if it matches the embeddings table, returns False if missing or stale"""
+        meta = self._read_meta()
+        if not meta or meta.get('generation') != generation or meta.get('last_row_id', 0) > max_row_id:
+            return False
+
+        dim, rows = meta['dim'], meta['rows']
+        base = f"{self.base_path}.g{generation}"
+        try:
+            if os.path.getsize(base + '.f32') < rows * dim * 4 or os.path.getsize(base + '.ids') < rows * 8:
+                logger.warning("Vector sidecar is truncated, rebuilding")
+                return False
+        except OSError:
+            return False
+
+        if (generation, dim, rows) != (self.generation, self.dim, self.rows):
+            self.generation, self.dim, self.rows = generation, dim, rows
+            self.last_row_id = meta['last_row_id']
+            self._map()
+        return True
+
+    def reset(self, generation: int):
+        """Start an empty sidecar for a new generation of the embeddings table"""
+        with self._locked():
+            # Remove data files of older generations (open maps keep working on POSIX)
+            directory = os.path.dirname(self.base_path) or '.'
+            prefix = os.path.basename(self.base_path) + '.g'
+            for name in os.listdir(directory):
+                if name.startswith(prefix) and name.endswith(('.f32', '.ids')):
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+
+            self.generation = generation
+            for path in (self.vectors_path, self.ids_path):
+                open(path, 'wb').close()
+            self.dim = 0
+            self.rows = 0
+            self.last_row_id = 0
+            self._write_meta()
+            self._map()
+        logger.info(f"Reset vector sidecar at {self.vectors_path} (generation {generation})")
+
+    def append(self, row_ids, vectors) -> int:
+        """Append normalized vectors for rows newer than last_row_id, returns rows written"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+
+        with self._locked():
+            # Another process may have appended since we last looked
+            meta = self._read_meta()
+            if meta and meta.get('generation') == self.generation:
+                self.dim, self.rows, self.last_row_id = meta['dim'], meta['rows'], meta['last_row_id']
+
+            if not self.dim and len(vectors):
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                logger.warning(
+                    f"Skipping {len(row_ids)} embeddings with dimension {vectors.shape[1]} "
+                    f"(sidecar dimension is {self.dim})"
+                )
+                # Don't re-read the skipped rows on every refresh
+                self.last_row_id = max(self.last_row_id, int(row_ids.max()))
+                self._write_meta()
+                return 0
+
+            keep = row_ids > self.last_row_id
+            if not keep.any():
+                self._map()
+                return 0
+
+            vectors = vectors[keep]
+            row_ids = row_ids[keep]
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = (vectors / norms).astype('<f4')
+
+            for path, data, row_bytes in ((self.vectors_path, vectors, self.dim * 4),
+                                          (self.ids_path, row_ids.astype('<i8'), 8)):
+                with open(path, 'r+b') as f:
+                    f.truncate(self.rows * row_bytes)
+                    f.seek(self.rows * row_bytes)
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            self.rows += len(row_ids)
+            self.last_row_id = int(row_ids[-1])
+            self._write_meta()
+            self._map()
+
+        return len(row_ids)
+
+    def get_vectors(self, row_ids) -> np.ndarray:
+        """Vectors for specific row ids, in the order given (zeros for unknown ids)"""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if not self.rows:
+            return np.zeros((len(row_ids), self.dim), dtype=np.float32)
+
+        positions = np.searchsorted(self.row_ids, row_ids)
+        positions = np.minimum(positions, self.rows - 1)
+        found = self.row_ids[positions] == row_ids
+
+        vectors = np.zeros((len(row_ids), self.dim), dtype=np.float32)
+        vectors[found] = self.vectors[positions[found]]
+        return vectors
@@ -1,59 +1,171 @@
 """
-Vector Store - Embeddings management with OpenAI and SQLite backend
+Vector Store - Embeddings management with OpenAI (or a local provider) and SQLite backend
 Author: Amaan
 """
 
+import asyncio
 import numpy as np
 import os
 import json
-from typing import List, Dict, Optional
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Dict, Optional, Tuple
 import logging
 from database_manager import DatabaseManager
-from pdf_parser import PDFParser
-
-# OpenAI import
-try:
-    from openai import OpenAI
-except ImportError:
-    print("OpenAI library not installed. Please run: pip install openai")
-    raise
+from pdf_parser import PDFParser, CHUNK_TYPES
+from embedding_index import (EmbeddingIndex, IVFIndex, PaperMetadata, update_knn_graph,
+                             kmeans_plus_plus, minibatch_kmeans)
+from vector_sidecar import VectorSidecar
+from rate_limiter import RateLimiter, call_with_backoff
+from embedding_batcher import (count_tokens, token_upper_bound, truncate_to_tokens, pack_requests,
+                               MAX_INPUT_TOKENS, MAX_REQUEST_TOKENS, MAX_REQUEST_INPUTS)
+from embedding_providers import create_embedding_provider
 
 logger = logging.getLogger(__name__)
 
+# Words ignored when labelling topics
+LABEL_STOPWORDS = frozenset("""
+a an and are as at based be by can for from has have in into is it its of on or our over that the their
+these this to towards under using via we which with without new paper approach method methods model
+models study results show propose proposed large language learning data task tasks use used
+""".split())
+
+# Hits beyond n_results whose details _build_results fetches up front
+RESULT_DETAIL_MARGIN = 5
+
+# Chunk weights in a paper's centroid, keyed by pdf_parser.CHUNK_TYPES; types not listed count 1.0.
+# The abstract is part of the 'intro' chunk (title + abstract), so it is weighted there
+DEFAULT_CENTROID_WEIGHTS = {'intro': 2.0, 'introduction': 1.5, 'conclusion': 1.5}
+
 class VectorStore:
-    """Manages embeddings using OpenAI API and SQLite for storage"""
+    """Manages embeddings using OpenAI API (or a local provider) and SQLite for storage"""
     
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.parser = PDFParser()
+    def __init__(self, db: DatabaseManager = None):
+        self.db = db or DatabaseManager()
+        self.parser = PDFParser(db=self.db)
         
         # Load configuration
         with open('config.json', 'r') as f:
             self.config = json.load(f)
         
-        # Get API key - try multiple sources
-        api_key = self._get_api_key()
-        
-        if not api_key:
-            raise ValueError(
-                "OpenAI API key not found! Please either:\n"
-                "1. Create .streamlit/secrets.toml with your key\n"
-                "2. Set environment variable: export OPENAI_API_KEY='your-key'\n"
-                "3. Pass it directly when initializing VectorStore"
-            )
-        
-        self.client = OpenAI(api_key=api_key)
-        self.embedding_model = self.config.get('embedding_model', 'text-embedding-3-small')
+        # Local providers ("hashing", "sentence-transformers") need no API key
+        provider_name = self.config.get('embedding_provider', 'openai')
+        api_key = None
+        if provider_name == 'openai':
+            # Get API key - try multiple sources
+            api_key = self._get_api_key()
+            
+            if not api_key:
+                raise ValueError(
+                    "OpenAI API key not found! Please either:\n"
+                    "1. Create .streamlit/secrets.toml with your key\n"
+                    "2. Set environment variable: export OPENAI_API_KEY='your-key'\n"
+                    "3. Pass it directly when initializing VectorStore\n"
+                    "4. Or set \"embedding_provider\": \"hashing\" in config.json to embed locally"
+                )
         
-        # Embedding dimensions for different models
-        self.embedding_dimensions = {
-            'text-embedding-3-small': 1536,
-            'text-embedding-3-large': 3072,
-            'text-embedding-ada-002': 1536
-        }
+        # openai_base_url (optional) points both clients at a compatible server
+        self.provider = create_embedding_provider(self.config, api_key)
+        # Provider-specific model name, so caches never mix vector spaces
+        self.embedding_model = self.provider.model
         
-        logger.info(f"Using OpenAI {self.embedding_model} for embeddings")
+        # Resident index, built lazily on first search
+        self.index = EmbeddingIndex(
+            quantization=self.config.get('quantization', 'none'),
+            pq_subspaces=self.config.get('pq_subspaces', 64),
+            # PQ codebooks are trained once this many rows are loaded (float32 until then)
+            pq_min_train_rows=self.config.get('pq_min_train_rows', 4096),
+            rescore_multiplier=self.config.get('rescore_multiplier', 8),
+            # Leading dimensions kept in memory for the first pass (0 = all)
+            scan_dimensions=self.config.get('scan_dimensions', 0)
+        )
+        self._index_built = False
+        self._index_generation = None
+        # The orchestrator is shared by every UI session, so concurrent searches
+        # refresh the same index; appends and rebuilds happen under this lock
+        self._index_lock = threading.RLock()
+
+        # Filter columns (categories, published date, summary) per indexed paper
+        self.paper_metadata = PaperMetadata()
+        self._summary_watermark = None
+
+        # Memory-mapped vector file shared by every process using this database
+        self.sidecar = VectorSidecar(self.db.db_path) if self.config.get('vector_sidecar', True) else None
+        self.index.vector_loader = self.sidecar.get_vectors if self.sidecar else self.db.get_embedding_vectors
+
+        # Query embedding cache: in-process LRU in front of a SQLite table
+        self.query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()  # lookups reorder the LRU
+        self.query_cache_size = self.config.get('query_cache_size', 1024)
+        self.query_cache_ttl = self.config.get('query_cache_ttl_hours', 168) * 3600
+        self.query_cache_max_entries = self.config.get('query_cache_max_entries', 50000)
+        self.query_cache_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+        # Chunk embedding cache counters (content-addressed, see _content_hash)
+        self.embedding_cache_stats = {'hits': 0, 'misses': 0, 'tokens_avoided': 0, 'tokens_sent': 0}
+
+        # Request packing limits and concurrency for bulk embedding
+        self.max_input_tokens = self.config.get('embedding_max_input_tokens', MAX_INPUT_TOKENS)
+        self.max_request_tokens = self.config.get('embedding_max_request_tokens', MAX_REQUEST_TOKENS)
+        self.max_request_inputs = self.config.get('embedding_max_request_inputs', MAX_REQUEST_INPUTS)
+        # Local providers are CPU-bound; one batch at a time
+        self.embedding_concurrency = self.config.get('embedding_concurrency', 4) if self.provider.remote else 1
+        self.embedding_requests = 0
+        self.last_embedding_error = None
+
+        # Failed chunks are queued and retried with exponential backoff
+        self.retry_base_seconds = self.config.get('embedding_retry_base_seconds', 60)
+        self.retry_max_attempts = self.config.get('embedding_retry_max_attempts', 6)
+        self.retry_batch_size = self.config.get('embedding_retry_batch_size', 2000)
+
+        # Paper centroids for "more like this", loaded lazily by similar_papers
+        self.centroid_weights = self.config.get('centroid_chunk_weights', DEFAULT_CENTROID_WEIGHTS)
+        unknown = sorted(set(self.centroid_weights) - set(CHUNK_TYPES))
+        if unknown:
+            logger.warning(f"centroid_chunk_weights has keys that are not chunk types and are ignored: "
+                           f"{unknown} (chunk types: {list(CHUNK_TYPES)})")
+        self._centroid_ids = []
+        self._centroid_rows = {}
+        self._centroid_matrix = None
+        self._centroid_generation = None
+        self._centroid_watermark = 0
+        self._centroid_lock = threading.RLock()
+
+        # kNN paper graph over the centroids (see update_paper_graph)
+        self.graph_neighbors = self.config.get('graph_neighbors', 10)
+        self.graph_block_size = self.config.get('graph_block_size', 256)
+
+        # Topic clusters over the centroids (see update_topics)
+        self.topic_count = self.config.get('topic_clusters', 12)
+        self.topic_batch_size = self.config.get('topic_batch_size', 256)
+        self.topic_epochs = self.config.get('topic_epochs', 5)
+
+        # Retrieval mode: "vector" (cosine only) or "hybrid" (BM25 + cosine with RRF)
+        self.search_mode = self.config.get('search_mode', 'vector')
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='retrieval')
+
+        # Optional approximate nearest-neighbour engine ("exact" or "ivf")
+        self.search_engine = self.config.get('search_engine', 'exact')
+        self.ann_path = os.path.splitext(self.db.db_path)[0] + '.ivf.npz'
+        self.ann = self._create_ann_index()
+
+        logger.info(f"Using {self.provider.name} {self.embedding_model} for embeddings")
     
+    def _create_ann_index(self) -> Optional[IVFIndex]:
+        """Create the configured ANN engine, None for exact search"""
+        if self.search_engine == 'ivf':
+            return IVFIndex(
+                nlist=self.config.get('ivf_nlist', 256),
+                nprobe=self.config.get('ivf_nprobe', 8)
+            )
+        if self.search_engine != 'exact':
+            logger.warning(f"Unknown search_engine '{self.search_engine}', using exact search")
+        return None
+
     def _get_api_key(self) -> Optional[str]:
         """Get API key from multiple sources"""
         # Try Streamlit secrets first
@@ -78,61 +190,272 @@ class VectorStore:
         # Fall back to environment variable
         return os.environ.get('OPENAI_API_KEY')
     
-    def create_embedding(self, text: str) -> List[float]:
-        """Create embedding for text using OpenAI API"""
+    def create_embedding(self, text: str) -> Optional[List[float]]:
+        """Create embedding for text with the configured provider, None if the request failed"""
         try:
-            # Truncate text if too long (OpenAI has token limits)
-            # text-embedding-3-small supports up to 8191 tokens
-            # Roughly 1 token = 4 characters, so limit to ~32000 chars to be safe
-            if len(text) > 32000:
-                text = text[:32000]
+            # Truncate text if too long (text-embedding-3-* accept up to 8191 tokens)
+            truncated = truncate_to_tokens(text, self.max_input_tokens, self.embedding_model)
+            if truncated != text:
+                text = truncated
                 logger.warning("Text truncated to fit token limit")
             
-            # Create embedding using OpenAI API
-            response = self.client.embeddings.create(
-                model=self.embedding_model,
-                input=text,
-                encoding_format="float"
-            )
-            
-            # Extract embedding vector
-            embedding = response.data[0].embedding
+            # Create embedding using the provider (OpenAI API by default)
+            embedding = self.provider.embed([text])[0]
             
             return embedding
             
         except Exception as e:
             logger.error(f"Error creating embedding: {e}")
-            # Return a zero vector as fallback
-            dim = self.embedding_dimensions.get(self.embedding_model, 1536)
-            return [0.0] * dim
+            self.last_embedding_error = str(e)
+            return None
     
-    def create_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Create embeddings for multiple texts efficiently (OpenAI supports batch)"""
+    @staticmethod
+    def _normalize_query(text: str) -> str:
+        """Cache key text: case- and whitespace-insensitive"""
+        return re.sub(r'\s+', ' ', text).strip().lower()
+
+    def create_query_embedding(self, query: str) -> List[float]:
+        """Create a search query embedding, served from the LRU / SQLite cache when possible"""
+        key = (self.embedding_model, self._normalize_query(query))
+
+        embedding = self._lookup_query_embedding(key)
+        if embedding is not None:
+            return embedding
+
+        embedding = self.db.get_cached_query_embedding(*key, max_age_seconds=self.query_cache_ttl)
+        if embedding is not None:
+            self.query_cache_stats['db_hits'] += 1
+        else:
+            self.query_cache_stats['misses'] += 1
+            embedding = self.create_embedding(query)
+            if embedding is None:
+                return self._failed_query_embedding()
+            embedding = np.asarray(embedding, dtype=np.float32)
+            self.db.store_cached_query_embedding(*key, embedding,
+                                                 max_entries=self.query_cache_max_entries,
+                                                 max_age_seconds=self.query_cache_ttl)
+
+        self._remember_query_embedding(key, embedding)
+        return embedding
+
+    def create_query_embeddings(self, queries: List[str]) -> np.ndarray:
+        """Embed several search queries, sending all cache misses in one batched API request"""
+        embeddings = [None] * len(queries)
+        misses = {}
+
+        for i, query in enumerate(queries):
+            key = (self.embedding_model, self._normalize_query(query))
+            cached = self._lookup_query_embedding(key)
+            if cached is not None:
+                embeddings[i] = cached
+            elif key in misses:
+                misses[key].append(i)
+            else:
+                cached = self.db.get_cached_query_embedding(*key, max_age_seconds=self.query_cache_ttl)
+                if cached is not None:
+                    self.query_cache_stats['db_hits'] += 1
+                    embeddings[i] = cached
+                    self._remember_query_embedding(key, cached)
+                else:
+                    misses[key] = [i]
+
+        if misses:
+            self.query_cache_stats['misses'] += len(misses)
+            texts = [queries[positions[0]] for positions in misses.values()]
+            vectors = self.create_embeddings_batch(texts) if len(texts) > 1 else [self.create_embedding(texts[0])]
+
+            for (key, positions), vector in zip(misses.items(), vectors):
+                failed = vector is None
+                vector = self._failed_query_embedding() if failed else np.asarray(vector, dtype=np.float32)
+                for i in positions:
+                    embeddings[i] = vector
+                if not failed:
+                    self.db.store_cached_query_embedding(*key, vector,
+                                                         max_entries=self.query_cache_max_entries,
+                                                         max_age_seconds=self.query_cache_ttl)
+                    self._remember_query_embedding(key, vector)
+
+        return np.vstack(embeddings).astype(np.float32)
+
+    def _failed_query_embedding(self) -> np.ndarray:
+        """Zero query vector for a failed request: matches nothing and is never cached or stored"""
+        return np.zeros(self.provider.dimensions, dtype=np.float32)
+
+    def _lookup_query_embedding(self, key: tuple) -> Optional[np.ndarray]:
+        """An embedding from the in-process LRU (marked most recently used), else None"""
+        with self._query_cache_lock:
+            embedding = self.query_cache.get(key)
+            if embedding is not None:
+                self.query_cache.move_to_end(key)
+                self.query_cache_stats['memory_hits'] += 1
+            return embedding
+
+    def _remember_query_embedding(self, key: tuple, embedding: np.ndarray):
+        """Put an embedding in the in-process LRU"""
+        with self._query_cache_lock:
+            self.query_cache[key] = embedding
+            if len(self.query_cache) > self.query_cache_size:
+                self.query_cache.popitem(last=False)
+
+    def create_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Create embeddings for multiple texts efficiently (OpenAI supports batch).
+
+        If the request fails every entry is None; callers must not store those.
+        """
         try:
             # Truncate texts if needed
-            texts = [text[:32000] if len(text) > 32000 else text for text in texts]
+            texts = [truncate_to_tokens(text, self.max_input_tokens, self.embedding_model) for text in texts]
             
             # OpenAI can handle multiple texts in one API call (more efficient)
-            response = self.client.embeddings.create(
-                model=self.embedding_model,
-                input=texts,
-                encoding_format="float"
-            )
-            
-            # Extract all embeddings
-            embeddings = [data.embedding for data in response.data]
+            embeddings = self.provider.embed(texts)
             
             logger.info(f"Created {len(embeddings)} embeddings in batch")
             return embeddings
             
         except Exception as e:
             logger.error(f"Error creating batch embeddings: {e}")
-            # Return zero vectors as fallback
-            dim = self.embedding_dimensions.get(self.embedding_model, 1536)
-            return [[0.0] * dim for _ in texts]
+            self.last_embedding_error = str(e)
+            return [None] * len(texts)
+
+    def _pack_texts(self, texts: List[str]) -> tuple:
+        """Truncate texts and group them into requests under the per-request limits"""
+        texts = [truncate_to_tokens(text, self.max_input_tokens, self.embedding_model) for text in texts]
+        token_counts = [min(token_upper_bound(text, self.embedding_model), self.max_input_tokens)
+                        for text in texts]
+        requests = pack_requests(token_counts, self.max_request_tokens, self.max_request_inputs)
+        self.embedding_requests += len(requests)
+        return texts, token_counts, requests
+
+    def create_embeddings_packed(self, texts: List[str]) -> List[List[float]]:
+        """Embed any number of texts: pack them into requests sized to the API's
+        per-request token and input limits, and send the requests concurrently.
+
+        Returns one embedding per text, in order.
+        """
+        texts, _, requests = self._pack_texts(texts)
+
+        if len(requests) == 1 and len(texts) == 1:
+            return [self.create_embedding(texts[0])]
+
+        embeddings = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.embedding_concurrency, len(requests))),
+                                thread_name_prefix='embed') as executor:
+            futures = {
+                executor.submit(self.create_embeddings_batch, [texts[i] for i in positions]): positions
+                for positions in requests
+            }
+            for future, positions in futures.items():
+                for i, embedding in zip(positions, future.result()):
+                    embeddings[i] = embedding
+
+        logger.info(f"Embedded {len(texts)} texts in {len(requests)} requests")
+        return embeddings
+
+    async def _create_embeddings_batch_async(self, session, texts: List[str],
+                                             limiter: RateLimiter, tokens: int) -> List[List[float]]:
+        """One embeddings request, through the shared rate limiter for remote providers"""
+        try:
+            if not self.provider.remote:
+                return await self.provider.embed_async(texts, session)
+            return await call_with_backoff(
+                lambda: self.provider.embed_async(texts, session),
+                limiter, tokens, max_retries=self.config.get('openai_max_retries', 5)
+            )
+        except Exception as e:
+            logger.error(f"Error creating batch embeddings: {e}")
+            self.last_embedding_error = str(e)
+            return [None] * len(texts)
+
+    async def create_embeddings_packed_async(self, texts: List[str], session,
+                                             limiter: RateLimiter) -> List[List[float]]:
+        """Async create_embeddings_packed: requests run concurrently under the shared limiter"""
+        texts, token_counts, requests = self._pack_texts(texts)
+        semaphore = asyncio.Semaphore(self.embedding_concurrency)
+
+        async def send(positions):
+            async with semaphore:
+                return await self._create_embeddings_batch_async(
+                    session, [texts[i] for i in positions], limiter,
+                    sum(token_counts[i] for i in positions))
+
+        embeddings = [None] * len(texts)
+        batches = await asyncio.gather(*(send(positions) for positions in requests))
+        for positions, batch in zip(requests, batches):
+            for i, embedding in zip(positions, batch):
+                embeddings[i] = embedding
+
+        logger.info(f"Embedded {len(texts)} texts in {len(requests)} async requests")
+        return embeddings
     
+    def _content_hash(self, text: str) -> str:
+        """Embedding cache key: sha256 over the model name and the exact chunk text"""
+        return hashlib.sha256(f"{self.embedding_model}\0{text}".encode('utf-8')).hexdigest()
+
+    def _estimate_tokens(self, text: str) -> int:
+        """Token count used for cost reporting"""
+        return count_tokens(text, self.embedding_model)
+
+    def _split_cached(self, chunk_texts: List[str]) -> tuple:
+        """Cached embeddings (None where missing) and {content_hash: positions} of the misses"""
+        hashes = [self._content_hash(text) for text in chunk_texts]
+        cached = self.db.get_cached_embeddings(hashes)
+
+        embeddings = [None] * len(chunk_texts)
+        misses = {}
+        for i, (text, content_hash) in enumerate(zip(chunk_texts, hashes)):
+            if content_hash in cached:
+                vector, token_count = cached[content_hash]
+                embeddings[i] = vector
+                self.embedding_cache_stats['hits'] += 1
+                self.embedding_cache_stats['tokens_avoided'] += token_count or self._estimate_tokens(text)
+            else:
+                # Identical chunks are embedded once
+                misses.setdefault(content_hash, []).append(i)
+        return embeddings, misses
+
+    def _fill_misses(self, chunk_texts: List[str], embeddings: list, misses: Dict, vectors: list):
+        """Put freshly created vectors in place and add them to the embedding cache"""
+        new_entries = []
+        for (content_hash, positions), vector in zip(misses.items(), vectors):
+            self.embedding_cache_stats['misses'] += 1
+            for i in positions:
+                embeddings[i] = vector
+            # Failed requests leave None in place for the caller to queue
+            if vector is not None:
+                token_count = self._estimate_tokens(chunk_texts[positions[0]])
+                self.embedding_cache_stats['tokens_sent'] += token_count
+                new_entries.append((content_hash, vector, token_count))
+        if new_entries:
+            self.db.store_cached_embeddings(self.embedding_model, new_entries)
+
+    def _embed_chunks_cached(self, chunk_texts: List[str]) -> List[List[float]]:
+        """Embeddings for chunk texts, only sending texts without a cached embedding to the provider.
+
+        Texts may come from many papers; misses are packed into as few
+        requests as the limits allow (see create_embeddings_packed).
+        """
+        embeddings, misses = self._split_cached(chunk_texts)
+        if misses:
+            texts = [chunk_texts[positions[0]] for positions in misses.values()]
+            self._fill_misses(chunk_texts, embeddings, misses, self.create_embeddings_packed(texts))
+        return embeddings
+
+    async def _embed_chunks_cached_async(self, chunk_texts: List[str], session,
+                                         limiter: RateLimiter) -> List[List[float]]:
+        """Async _embed_chunks_cached"""
+        embeddings, misses = self._split_cached(chunk_texts)
+        if misses:
+            texts = [chunk_texts[positions[0]] for positions in misses.values()]
+            vectors = await self.create_embeddings_packed_async(texts, session, limiter)
+            self._fill_misses(chunk_texts, embeddings, misses, vectors)
+        return embeddings
+
     def process_paper(self, arxiv_id: str) -> bool:
-        """Create and store embeddings for a paper"""
+        """Create and store embeddings for a paper (unchanged chunks come from the embedding cache).
+
+        Chunks whose request fails are queued for retry; the paper is only
+        marked embedding_created, and True returned, once every chunk is stored.
+        """
         try:
             # Get chunks from parser
             chunks = self.parser.prepare_chunks_for_embedding(arxiv_id)
@@ -144,35 +467,95 @@ class VectorStore:
             # Extract texts for batch processing
             chunk_texts = [chunk['text'] for chunk in chunks]
             
-            # Create embeddings in batch (more efficient for OpenAI API)
-            if len(chunk_texts) > 1:
-                embeddings = self.create_embeddings_batch(chunk_texts)
-            else:
-                embeddings = [self.create_embedding(chunk_texts[0])]
-            
-            # Store each embedding
-            for chunk, embedding in zip(chunks, embeddings):
-                self.db.store_embedding(
-                    paper_id=arxiv_id,
-                    chunk_index=chunk['index'],
-                    chunk_text=chunk['text'],
-                    embedding=embedding,
-                    chunk_type=chunk['type']
-                )
+            embeddings = self._embed_chunks_cached(chunk_texts)
+            rows, failed = self._embedding_rows(arxiv_id, chunks, embeddings)
+            if self._store_embedding_batch(rows, failed, complete=[] if failed else [arxiv_id]) is None:
+                return False
+            if len(failed) < len(chunks):
+                self.update_paper_centroids([arxiv_id])
             
-            logger.info(f"Created {len(chunks)} embeddings for {arxiv_id}")
-            return True
+            # Pick up the new rows without rebuilding the whole index
+            if self._index_built or self.ann is not None:
+                self.refresh_index()
+
+            logger.info(f"Created {len(chunks) - len(failed)} embeddings for {arxiv_id}")
+            return not failed
             
         except Exception as e:
             logger.error(f"Error processing {arxiv_id}: {e}")
             return False
     
-    def process_all_papers(self, limit=50) -> Dict:
-        """Process all papers that need embeddings"""
-        # Get papers that have been parsed but not embedded
+    @staticmethod
+    def _embedding_rows(arxiv_id: str, chunks: List[Dict],
+                        embeddings: List[Optional[List[float]]]) -> Tuple[List[tuple], List[Dict]]:
+        """Rows for store_embedding_batch from a paper's chunks, and the chunks whose embedding failed"""
+        rows, failed = [], []
+        for chunk, embedding in zip(chunks, embeddings):
+            if embedding is None:
+                failed.append(dict(chunk, paper_id=arxiv_id))
+            else:
+                rows.append((arxiv_id, chunk['index'], chunk['text'], embedding, chunk['type']))
+        return rows, failed
+
+    def _store_embedding_batch(self, rows: List[tuple], failed: List[Dict], resolved: List[tuple] = (),
+                               complete: List[str] = ()) -> Optional[int]:
+        """Store rows, put failed chunks ({paper_id, index, text, type}) in the durable retry queue,
+        drop resolved retries and mark complete papers, all in one transaction.
+
+        Returns the number of papers marked embedding_created, None if nothing was written.
+        """
+        marked = self.db.store_embedding_batch(
+            rows, failed, self.last_embedding_error or 'embedding request failed', self.retry_base_seconds,
+            resolved=resolved, complete=complete)
+        if marked is not None and failed:
+            logger.warning(f"Queued {len(failed)} chunks from "
+                           f"{len({chunk['paper_id'] for chunk in failed})} papers for embedding retry")
+        return marked
+
+    def _due_retries(self) -> List[Dict]:
+        """Queued chunks whose next attempt is due"""
+        return self.db.get_due_embedding_retries(self.retry_batch_size, self.retry_max_attempts)
+
+    def _store_retries(self, chunks: List[Dict], embeddings: List[Optional[List[float]]], results: Dict):
+        """Store retried chunks, re-queue the ones that failed again, complete finished papers"""
+        rows, failed = [], []
+        for chunk, embedding in zip(chunks, embeddings):
+            if embedding is None:
+                failed.append(chunk)
+            else:
+                rows.append((chunk['paper_id'], chunk['index'], chunk['text'], embedding, chunk['type']))
+
+        done = [(row[0], row[1]) for row in rows]
+        papers = sorted({paper_id for paper_id, _ in done})
+        completed = self._store_embedding_batch(rows, failed, resolved=done, complete=papers)
+        if completed is None:
+            # Nothing was written, so every chunk is still queued; count the attempt
+            # (their vectors are in the embedding cache for the next one)
+            done, failed, papers, completed = [], chunks, [], 0
+            self._store_embedding_batch([], failed)
+        self.update_paper_centroids(papers)
+
+        results['retried_chunks'] += len(done)
+        results['retry_failures'] += len(failed)
+        results['retry_completed'] += completed
+
+    def drain_embedding_retries(self) -> Dict:
+        """Retry due chunks from the queue, packed into as few requests as possible"""
+        results = {'retry_completed': 0, 'retried_chunks': 0, 'retry_failures': 0}
+        chunks = self._due_retries()
+        if chunks:
+            embeddings = self._embed_chunks_cached([chunk['text'] for chunk in chunks])
+            self._store_retries(chunks, embeddings, results)
+        return results
+
+    def _start_embedding_run(self, limit: int) -> tuple:
+        """Papers that have been parsed but not embedded (in waves), an empty results dict
+        and a snapshot of the counters to report the run's share of"""
+        # Papers with queued chunks are finished by the retry drainer, not re-chunked
         self.db.cursor.execute("""
         SELECT arxiv_id FROM papers 
-        WHERE processed = 1 AND embedding_created = 0
+        WHERE processed = 1 AND embedding_created = 0 AND duplicate_of IS NULL
+          AND arxiv_id NOT IN (SELECT paper_id FROM embedding_retry_queue)
         LIMIT ?
         """, (limit,))
         
@@ -182,88 +565,838 @@ class VectorStore:
             'total': len(papers),
             'success': 0,
             'failed': [],
+            'queued': [],
+            'retried_chunks': 0,
+            'retry_failures': 0,
+            'retry_completed': 0,
             'total_api_calls': 0,
             'estimated_cost': 0
         }
-        
-        for arxiv_id in papers:
-            if self.process_paper(arxiv_id):
-                results['success'] += 1
-                # Rough estimate: ~5 chunks per paper
-                results['total_api_calls'] += 5
+        counters = (dict(self.embedding_cache_stats), self.embedding_requests)
+
+        # Papers are embedded in waves to bound the memory held by pending vectors
+        wave_size = self.config.get('embedding_wave_papers', 250)
+        waves = [papers[start:start + wave_size] for start in range(0, len(papers), wave_size)]
+        return waves, results, counters
+
+    def _chunk_wave(self, arxiv_ids: List[str], results: Dict) -> Dict[str, List[Dict]]:
+        """Chunks per paper for one wave; papers without chunks are recorded as failed"""
+        wave = {}
+        for arxiv_id in arxiv_ids:
+            try:
+                chunks = self.parser.prepare_chunks_for_embedding(arxiv_id)
+            except Exception as e:
+                logger.error(f"Error chunking {arxiv_id}: {e}")
+                chunks = None
+            if chunks:
+                wave[arxiv_id] = chunks
             else:
+                logger.warning(f"No chunks for {arxiv_id}")
                 results['failed'].append(arxiv_id)
+        return wave
+
+    def _store_wave(self, wave: Dict[str, List[Dict]], embeddings: List[Optional[List[float]]],
+                    results: Dict):
+        """Store a wave's embeddings and queue its failed chunks in one transaction"""
+        offset = 0
+        rows, complete, failed = [], [], []
+        for arxiv_id, chunks in wave.items():
+            paper_rows, paper_failed = self._embedding_rows(arxiv_id, chunks,
+                                                            embeddings[offset:offset + len(chunks)])
+            rows.extend(paper_rows)
+            if paper_failed:
+                failed.extend(paper_failed)
+                results['queued'].append(arxiv_id)
+            else:
+                complete.append(arxiv_id)
+            offset += len(chunks)
+
+        if self._store_embedding_batch(rows, failed, complete=complete) is None:
+            results['failed'].extend(wave)
+            results['queued'] = [arxiv_id for arxiv_id in results['queued'] if arxiv_id not in wave]
+            return
+
+        results['success'] += len(complete)
+        # Partially stored papers get a centroid now and an updated one once their retries land
+        self.update_paper_centroids(complete + sorted({chunk['paper_id'] for chunk in failed}))
+
+    def _finish_embedding_run(self, results: Dict, counters: tuple) -> Dict:
+        """Refresh the index and fill in request, cache and cost figures"""
+        cache_before, requests_before = counters
+
+        stored = results['success'] or results['queued'] or results['retried_chunks']
+        if stored and (self._index_built or self.ann is not None):
+            self.refresh_index()
         
-        # Calculate estimated cost (text-embedding-3-small: $0.02 per 1M tokens)
-        # Rough estimate: 500 tokens per chunk, 5 chunks per paper
-        total_tokens = results['success'] * 5 * 500
-        results['estimated_cost'] = (total_tokens / 1_000_000) * 0.02
+        results['total_api_calls'] = self.embedding_requests - requests_before
+        retry_stats = self.db.get_embedding_retry_stats(self.retry_max_attempts)
+        results['retries_pending'] = retry_stats['pending']
+        results['retries_exhausted'] = retry_stats['exhausted']
+        cache = {key: self.embedding_cache_stats[key] - cache_before[key] for key in cache_before}
+        lookups = cache['hits'] + cache['misses']
+        results['cache_hits'] = cache['hits']
+        results['cache_misses'] = cache['misses']
+        results['cache_hit_rate'] = round(cache['hits'] / lookups, 3) if lookups else 0.0
+        results['tokens_avoided'] = cache['tokens_avoided']
         
+        # Calculate estimated cost (text-embedding-3-small: $0.02 per 1M tokens, local providers: free)
+        price = self.provider.cost_per_million_tokens
+        results['estimated_cost'] = (cache['tokens_sent'] / 1_000_000) * price
+        results['cost_avoided'] = (cache['tokens_avoided'] / 1_000_000) * price
+        
+        if self.ann is not None and stored:
+            self.save_ann_index()
+
         logger.info(f"Processed {results['success']}/{results['total']} papers")
+        if results['retried_chunks'] or results['queued'] or retry_stats['pending'] or retry_stats['exhausted']:
+            logger.info(f"Embedding retries: {results['retried_chunks']} chunks recovered, "
+                        f"{retry_stats['pending']} pending, {retry_stats['exhausted']} gave up")
+        logger.info(f"Embedding cache: {cache['hits']} hits, {cache['misses']} misses, "
+                    f"~{cache['tokens_avoided']} tokens avoided")
         logger.info(f"Estimated API cost: ${results['estimated_cost']:.4f}")
         
         return results
+
+    def process_all_papers(self, limit=50) -> Dict:
+        """Process all papers that need embeddings.
+
+        Chunks of up to embedding_wave_papers papers are pooled, packed into
+        full-size requests and embedded concurrently, so the number of API
+        calls follows the token volume instead of the number of papers.
+        Chunks that failed on earlier runs are retried first.
+        """
+        waves, results, counters = self._start_embedding_run(limit)
+
+        retries = self._due_retries()
+        if retries:
+            embeddings = self._embed_chunks_cached([chunk['text'] for chunk in retries])
+            self._store_retries(retries, embeddings, results)
+
+        for arxiv_ids in waves:
+            wave = self._chunk_wave(arxiv_ids, results)
+            if not wave:
+                continue
+
+            chunk_texts = [chunk['text'] for chunks in wave.values() for chunk in chunks]
+            try:
+                embeddings = self._embed_chunks_cached(chunk_texts)
+            except Exception as e:
+                logger.error(f"Error embedding {len(wave)} papers: {e}")
+                results['failed'].extend(wave)
+                continue
+            self._store_wave(wave, embeddings, results)
+
+        return self._finish_embedding_run(results, counters)
+
+    async def process_all_papers_async(self, limit=50, limiter: Optional[RateLimiter] = None) -> Dict:
+        """process_all_papers on AsyncOpenAI (or the local provider); pass the pipeline's shared limiter"""
+        limiter = limiter or RateLimiter.from_config(self.config)
+        waves, results, counters = self._start_embedding_run(limit)
+
+        async with self.provider.async_session() as session:
+            retries = self._due_retries()
+            if retries:
+                embeddings = await self._embed_chunks_cached_async(
+                    [chunk['text'] for chunk in retries], session, limiter)
+                self._store_retries(retries, embeddings, results)
+
+            for arxiv_ids in waves:
+                wave = self._chunk_wave(arxiv_ids, results)
+                if not wave:
+                    continue
+
+                chunk_texts = [chunk['text'] for chunks in wave.values() for chunk in chunks]
+                try:
+                    embeddings = await self._embed_chunks_cached_async(chunk_texts, session, limiter)
+                except Exception as e:
+                    logger.error(f"Error embedding {len(wave)} papers: {e}")
+                    results['failed'].extend(wave)
+                    continue
+                self._store_wave(wave, embeddings, results)
+
+        return self._finish_embedding_run(results, counters)
     
-    def semantic_search(self, query: str, n_results: int = 5) -> List[Dict]:
-        """Search for similar papers using embeddings"""
-        # Create query embedding using OpenAI
-        query_embedding = np.array(self.create_embedding(query))
-        
-        # Get all embeddings from database
-        self.db.cursor.execute("""
-        SELECT paper_id, chunk_index, chunk_text, embedding
-        FROM embeddings
-        """)
-        
-        results = []
-        for row in self.db.cursor.fetchall():
-            if row[3]:  # If embedding exists
-                import pickle
-                chunk_embedding = np.array(pickle.loads(row[3]))
-                
-                # Calculate cosine similarity
-                similarity = self._cosine_similarity(query_embedding, chunk_embedding)
-                
-                results.append({
-                    'paper_id': row[0],
-                    'chunk_index': row[1],
-                    'chunk_text': row[2],
-                    'similarity': similarity
-                })
-        
-        # Sort by similarity and get top results
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        
-        # Group by paper and get unique papers
-        seen_papers = set()
-        unique_results = []
-        
+    def refresh_index(self) -> int:
+        """Load embedding rows added since the last refresh into the resident index"""
+        with self._index_lock:
+            generation = self.db.get_embedding_generation()
+            max_id = self.db.get_max_embedding_id()
+
+            # Rows were deleted or rewritten (e.g. reset_embeddings.py), start over
+            if generation != self._index_generation or max_id < self.index.last_row_id:
+                if self._index_built:
+                    logger.info("Embeddings table changed, rebuilding index")
+                self._reset_index()
+                self._index_generation = generation
+
+            if self.sidecar is not None:
+                added = self._refresh_from_sidecar(generation, max_id)
+            else:
+                added = self._refresh_from_db(max_id)
+
+            if not self._index_built:
+                logger.info(f"Built embedding index with {len(self.index)} chunks")
+                self._index_built = True
+            elif added:
+                logger.info(f"Added {added} chunks to embedding index")
+
+            self._sync_ann_index()
+            self._refresh_paper_metadata()
+            return added
+
+    def _reset_index(self):
+        """Drop everything derived from the embeddings table"""
+        self.index.clear()
+        self.ann = self._create_ann_index()
+        self.paper_metadata = PaperMetadata()
+        self._summary_watermark = None
+
+    def _refresh_paper_metadata(self):
+        """Load filter columns for newly indexed papers and pick up new summaries"""
+        new_numbers = range(self.paper_metadata.size, len(self.index.paper_list))
+        if len(new_numbers):
+            new_ids = self.index.paper_list[new_numbers.start:]
+            metadata = self.db.get_paper_filter_metadata(new_ids)
+            rows = [metadata.get(paper_id, ([], None, False)) for paper_id in new_ids]
+            categories, published_dates, has_summary = zip(*rows)
+            self.paper_metadata.update(new_numbers, categories, published_dates, has_summary)
+
+        # Summaries are written by another component: new ones are read past the last
+        # rowid seen, a delete or replace since the last refresh reloads the column
+        watermark = self.db.get_summary_watermark()
+        if watermark == self._summary_watermark:
+            return
+        if self._summary_watermark is not None and watermark[0] == self._summary_watermark[0]:
+            summarized = self.db.get_summarized_paper_ids(after_rowid=self._summary_watermark[1])
+            update = self.paper_metadata.add_has_summary
+        else:
+            summarized = self.db.get_summarized_paper_ids()
+            update = self.paper_metadata.set_has_summary
+        update([self.index.paper_numbers[paper_id] for paper_id in summarized
+                if paper_id in self.index.paper_numbers])
+        self._summary_watermark = watermark
+
+    def _filter_rows(self, categories: Optional[List[str]] = None, date_from=None, date_to=None,
+                     has_summary: Optional[bool] = None) -> Optional[np.ndarray]:
+        """Index row positions whose paper passes every filter, None if no filter is set"""
+        paper_mask = self.paper_metadata.mask(categories, date_from, date_to, has_summary)
+        if paper_mask is None:
+            return None
+        return np.flatnonzero(paper_mask[self.index.paper_idx])
+
+    def _refresh_from_db(self, max_id: int) -> int:
+        """Decode new rows straight from SQLite into the index"""
+        added = 0
+        if max_id > self.index.last_row_id:
+            for batch in self.db.iter_embedding_rows(after_id=self.index.last_row_id):
+                row_ids, paper_ids, chunk_indices, vectors = zip(*batch)
+                added += self.index.add(row_ids, paper_ids, chunk_indices, vectors)
+                # Keep skipped rows from being re-read on every refresh
+                self.index.last_row_id = max(self.index.last_row_id, row_ids[-1])
+        return added
+
+    def _refresh_from_sidecar(self, generation: int, max_id: int) -> int:
+        """Append new rows to the memory-mapped sidecar and expose them through the index"""
+        if not self.sidecar.open(generation, max_id):
+            logger.info("Vector sidecar missing or stale, rebuilding from embeddings table")
+            self.sidecar.reset(generation)
+            self._reset_index()
+
+        if max_id > self.sidecar.last_row_id:
+            for batch in self.db.iter_embedding_rows(after_id=self.sidecar.last_row_id):
+                row_ids, _, _, vectors = zip(*batch)
+                self.sidecar.append(row_ids, vectors)
+
+        start = len(self.index)
+        if self.sidecar.rows <= start:
+            return 0
+
+        new_row_ids = np.asarray(self.sidecar.row_ids[start:])
+        paper_ids, chunk_indices = self.db.get_embedding_metadata(new_row_ids)
+
+        if self.index.quantization == 'none' and not self.index.scan_dimensions:
+            # Zero-copy: the index scores the mapped file directly
+            self.index.attach(
+                self.sidecar.vectors,
+                np.concatenate([self.index.row_ids, new_row_ids]),
+                np.concatenate([self.index.paper_ids, paper_ids]),
+                np.concatenate([self.index.chunk_indices, chunk_indices])
+            )
+        else:
+            # Quantize / truncate from the mapped file in blocks to bound temporary memory
+            block = EmbeddingIndex.SCAN_BLOCK_ROWS
+            for offset in range(0, len(new_row_ids), block):
+                self.index.add(
+                    new_row_ids[offset:offset + block],
+                    paper_ids[offset:offset + block],
+                    chunk_indices[offset:offset + block],
+                    self.sidecar.vectors[start + offset:start + offset + block]
+                )
+
+        return self.sidecar.rows - start
+
+    def _sync_ann_index(self):
+        """Load or train the ANN index and assign rows it hasn't seen yet"""
+        if self.ann is None or not len(self.index):
+            return
+
+        if not self.ann.is_trained:
+            if self.ann.load(self.ann_path, self.index.row_ids, self.index.dim, self._ann_layout()):
+                logger.info(f"Loaded IVF index from {self.ann_path}")
+            else:
+                self.ann.train(self.index.reconstruct())
+                self.save_ann_index()
+
+        if len(self.ann) < len(self.index):
+            self.ann.add(self.index.reconstruct(len(self.ann)))
+
+    def _ann_layout(self) -> str:
+        """Embedding model and index layout the ANN file must have been trained for"""
+        return f'{self.embedding_model} {self.index.scan_layout}'
+
+    def save_ann_index(self):
+        """Persist the ANN index next to the database"""
+        if self.ann is not None and self.ann.is_trained:
+            self.ann.save(self.ann_path, self.index.row_ids, self._ann_layout())
+            logger.info(f"Saved IVF index to {self.ann_path}")
+
+    def rebuild_ann_index(self):
+        """Retrain the ANN index from scratch (e.g. after the corpus has grown a lot)"""
+        with self._index_lock:
+            self.refresh_index()
+            self.ann = self._create_ann_index()
+            if self.ann is not None and len(self.index):
+                self.ann.train(self.index.reconstruct())
+                self.save_ann_index()
+
+    def verify_ann_recall(self, n_queries: int = 100, k: int = 10) -> Dict:
+        """Compare ANN results with exact search, using stored chunks as queries"""
+        self.refresh_index()
+        if self.ann is None or not len(self.index):
+            return {'engine': self.search_engine, 'queries': 0, 'recall_at_k': 1.0}
+
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(self.index), min(n_queries, len(self.index)), replace=False)
+
+        recalls = []
+        for position in sample:
+            if self.index.truncated:
+                query = self.index.vector_loader(self.index.row_ids[position:position + 1])[0]
+            else:
+                query = self.index.reconstruct(position, position + 1)[0]
+            exact, _ = self.index.search(query, k)
+            approx, _ = self.index.search(query, k, self.ann.candidates(self.index.scan_query(query)))
+            recalls.append(len(np.intersect1d(exact, approx)) / len(exact))
+
+        return {
+            'engine': self.search_engine,
+            'queries': len(sample),
+            'k': k,
+            'nprobe': self.ann.nprobe,
+            'recall_at_k': float(np.mean(recalls))
+        }
+
+    def _paper_centroid(self, chunks: List[tuple]) -> np.ndarray:
+        """Unit-length weighted mean of a paper's normalized (chunk_type, vector) chunks"""
+        vectors = np.vstack([vector for _, vector in chunks]).astype(np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        weights = np.array([self.centroid_weights.get(chunk_type, 1.0) for chunk_type, _ in chunks],
+                           dtype=np.float32)
+        centroid = weights @ vectors
+        return centroid / max(float(np.linalg.norm(centroid)), 1e-12)
+
+    def update_paper_centroids(self, paper_ids: List[str]) -> int:
+        """Recompute and store the centroids of these papers from their stored chunk vectors"""
+        if not paper_ids:
+            return 0
+        entries = []
+        for paper_id, chunks in self.db.get_chunk_vectors_for_papers(paper_ids).items():
+            try:
+                entries.append((paper_id, self._paper_centroid(chunks), len(chunks)))
+            except ValueError as e:
+                logger.warning(f"Skipping centroid for {paper_id}: {e}")
+        if entries and self.db.store_paper_centroids(entries):
+            self._remember_centroids(entries)
+        return len(entries)
+
+    def _remember_centroids(self, entries: List[tuple]):
+        """Apply stored centroids to the in-memory matrix, if it is loaded"""
+        with self._centroid_lock:
+            if self._centroid_matrix is None:
+                return
+            new_ids, new_vectors = [], []
+            for paper_id, centroid, _ in entries:
+                if len(centroid) != self._centroid_matrix.shape[1]:
+                    # A different embedding space; reload from the table on next lookup
+                    self._centroid_matrix = None
+                    return
+                row = self._centroid_rows.get(paper_id)
+                if row is None:
+                    new_ids.append(paper_id)
+                    new_vectors.append(centroid)
+                else:
+                    self._centroid_matrix[row] = centroid
+            if new_ids:
+                self._centroid_rows.update({paper_id: len(self._centroid_ids) + i for i, paper_id in enumerate(new_ids)})
+                self._centroid_ids.extend(new_ids)
+                self._centroid_matrix = np.vstack([self._centroid_matrix, np.vstack(new_vectors)])
+
+    def _load_centroids(self):
+        """Bring the centroid table up to date (first use on an existing database) and load it.
+
+        Centroids stored since the last load (by this or another process) are
+        picked up by rowid; deleted or replaced embeddings force a full reload.
+        """
+        with self._centroid_lock:
+            generation = self.db.get_embedding_generation()
+            if self._centroid_matrix is not None and generation == self._centroid_generation:
+                watermark = self.db.get_max_centroid_rowid()
+                if watermark > self._centroid_watermark:
+                    for batch in self.db.iter_paper_centroids(after_rowid=self._centroid_watermark):
+                        self._remember_centroids([(paper_id, centroid, None) for paper_id, centroid in batch])
+                    self._centroid_watermark = watermark
+                if self._centroid_matrix is not None:
+                    return
+
+            stale = self.db.get_stale_centroid_papers()
+            if stale:
+                logger.info(f"Computing centroids for {len(stale)} papers")
+                self._centroid_matrix = None
+                for start in range(0, len(stale), 500):
+                    self.update_paper_centroids(stale[start:start + 500])
+
+            watermark = self.db.get_max_centroid_rowid()
+            ids, vectors = [], []
+            for batch in self.db.iter_paper_centroids():
+                for paper_id, centroid in batch:
+                    if vectors and len(centroid) != len(vectors[0]):
+                        continue
+                    ids.append(paper_id)
+                    vectors.append(centroid)
+
+            self._centroid_ids = ids
+            self._centroid_rows = {paper_id: row for row, paper_id in enumerate(ids)}
+            self._centroid_matrix = np.vstack(vectors).astype(np.float32) if vectors else np.empty((0, 0), np.float32)
+            self._centroid_generation = generation
+            self._centroid_watermark = watermark
+
+    def similar_papers(self, arxiv_id: str, k: int = 5) -> List[Dict]:
+        """Papers closest to arxiv_id by centroid cosine similarity, best first.
+
+        One matrix-vector product over all paper centroids instead of
+        chunk-vs-chunk scans; empty if the paper has no embeddings.
+        """
+        self._load_centroids()
+        row = self._centroid_rows.get(arxiv_id)
+        if row is None:
+            self.update_paper_centroids([arxiv_id])
+            row = self._centroid_rows.get(arxiv_id)
+            if row is None:
+                return []
+
+        scores = self._centroid_matrix @ self._centroid_matrix[row]
+        scores[row] = -np.inf
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        hits = [(None, self._centroid_ids[i], float(scores[i])) for i in top]
+        results = self._build_results(hits, k)
         for result in results:
-            if result['paper_id'] not in seen_papers:
-                # Get paper details
-                paper = self.db.get_paper(result['paper_id'])
-                if paper:
-                    paper_result = {
-                        'arxiv_id': paper['arxiv_id'],
-                        'title': paper['title'],
-                        'abstract': paper['abstract'][:200] + '...' if paper.get('abstract') else '',
-                        'similarity': result['similarity'],
-                        'relevant_chunk': result['chunk_text'][:200] + '...'
-                    }
-
-                    # Get summary if available
-                    summary = self.db.get_paper_summary(result['paper_id'])
-                    if summary:
-                        paper_result['summary'] = summary
-                        paper_result['has_summary'] = True
-                    else:
-                        paper_result['has_summary'] = False
-
-                    unique_results.append(paper_result)
-                    seen_papers.add(result['paper_id'])
-
-                    if len(unique_results) >= n_results:
-                        break
+            result.pop('relevant_chunk', None)
+        return results
+
+    def update_paper_graph(self, rebuild: bool = False) -> Dict:
+        """Update the stored kNN paper graph for papers embedded since the last run.
+
+        Only new or re-embedded papers are scored (in blocks, against every
+        centroid); existing lists just take in new papers that beat their
+        k-th neighbour. rebuild=True recomputes every list.
+        """
+        self._load_centroids()
+        ids, n, k = self._centroid_ids, len(self._centroid_ids), self.graph_neighbors
+        pending_ids = ids if rebuild else self.db.get_papers_missing_neighbors()
+        pending = sorted({self._centroid_rows[paper_id] for paper_id in pending_ids
+                          if paper_id in self._centroid_rows})
+        results = {'papers': n, 'pending': len(pending), 'updated': 0}
+        if not pending or n < 2:
+            return results
+
+        neighbors = np.full((n, k), -1, dtype=np.int64)
+        similarities = np.full((n, k), -np.inf, dtype=np.float32)
+        if not rebuild:
+            for paper_id, edges in self.db.get_paper_neighbors().items():
+                row = self._centroid_rows.get(paper_id)
+                if row is None:
+                    continue
+                edges = [(self._centroid_rows[other], similarity) for other, similarity in edges
+                         if other in self._centroid_rows][:k]
+                if edges:
+                    neighbors[row, :len(edges)], similarities[row, :len(edges)] = zip(*edges)
+
+        start = time.time()
+        changed = update_knn_graph(self._centroid_matrix, neighbors, similarities, pending,
+                                   block_size=self.graph_block_size)
+
+        graph = {}
+        for row in np.flatnonzero(changed):
+            keep = neighbors[row] >= 0
+            graph[ids[row]] = [(ids[other], float(similarity))
+                               for other, similarity in zip(neighbors[row][keep], similarities[row][keep])]
+        self.db.replace_paper_neighbors(graph)
+
+        results['updated'] = len(graph)
+        logger.info(f"Paper graph: {len(pending)} papers scored, {len(graph)} neighbour lists "
+                    f"updated in {time.time() - start:.2f}s")
+        return results
+
+    def paper_neighborhood(self, arxiv_ids: List[str], k: int = 3) -> Dict:
+        """The stored graph around these papers: their top-k neighbours and the edges among them.
+
+        Reads precomputed lists only, so it is cheap enough for every UI rerun.
+        """
+        neighbors = self.db.get_paper_neighbors(arxiv_ids)
+        edges = {}
+        for paper_id in arxiv_ids:
+            for neighbor_id, similarity in neighbors.get(paper_id, [])[:k]:
+                edges.setdefault(tuple(sorted((paper_id, neighbor_id))), similarity)
+
+        # Links between the neighbours themselves
+        node_ids = set(arxiv_ids) | {paper_id for edge in edges for paper_id in edge}
+        extra = [paper_id for paper_id in node_ids if paper_id not in arxiv_ids]
+        for paper_id, links in self.db.get_paper_neighbors(extra).items():
+            for neighbor_id, similarity in links[:k]:
+                if neighbor_id in node_ids:
+                    edges.setdefault(tuple(sorted((paper_id, neighbor_id))), similarity)
+
+        papers = self.db.get_papers_brief(list(node_ids))
+        return {
+            'nodes': {paper_id: {'title': papers.get(paper_id, {}).get('title', paper_id),
+                                 'seed': paper_id in arxiv_ids}
+                      for paper_id in node_ids},
+            'edges': [(a, b, similarity) for (a, b), similarity in edges.items()]
+        }
+
+    def update_topics(self, rebuild: bool = False) -> Dict:
+        """Refine the topic clusters with papers embedded since the last run.
+
+        Mini-batch k-means continues from the stored centroids: new papers,
+        plus an equal sample of already clustered ones so older topics keep
+        their weight, go through one epoch. A fresh start (first run,
+        rebuild=True or a different embedding space) runs topic_epochs
+        epochs over every paper. All papers are then reassigned in one
+        blocked pass and the cluster sizes and labels stored.
+        """
+        self._load_centroids()
+        vectors, ids = self._centroid_matrix, self._centroid_ids
+        results = {'papers': len(ids), 'new_papers': 0, 'reassigned': 0, 'clusters': 0}
+        if not ids:
+            return results
+
+        pending = set(self.db.get_papers_missing_topics())
+        stored = None if rebuild else self.db.get_topic_centroids()
+        n_clusters = min(self.topic_count, len(ids))
+        rng = np.random.default_rng(len(ids))
+        if stored is None or stored[0].shape != (n_clusters, vectors.shape[1]):
+            seeds = rng.choice(len(ids), min(len(ids), 20000), replace=False)
+            centroids = kmeans_plus_plus(vectors[seeds], n_clusters, seed=int(rng.integers(1 << 31)))
+            absorbed = np.zeros(n_clusters, dtype=np.int64)
+            train, epochs = np.arange(len(ids)), self.topic_epochs
+            results['new_papers'] = len(ids)
+        else:
+            centroids, absorbed = stored
+            new = sorted({self._centroid_rows[paper_id] for paper_id in pending
+                          if paper_id in self._centroid_rows})
+            if not new:
+                results['clusters'] = len(self.db.get_topic_clusters())
+                return results
+            rest = np.setdiff1d(np.arange(len(ids)), new)
+            sample = rng.choice(rest, min(len(rest), len(new)), replace=False)
+            train, epochs = np.concatenate([new, sample]).astype(np.int64), 1
+            results['new_papers'] = len(new)
+
+        centroids, absorbed = minibatch_kmeans(vectors[train], centroids, absorbed,
+                                               batch_size=self.topic_batch_size, epochs=epochs,
+                                               seed=int(rng.integers(1 << 31)))
+
+        assignments = np.empty(len(ids), dtype=np.int64)
+        similarities = np.empty(len(ids), dtype=np.float32)
+        for start in range(0, len(ids), 4096):
+            scores = vectors[start:start + 4096] @ centroids.T
+            assignments[start:start + 4096] = np.argmax(scores, axis=1)
+            similarities[start:start + 4096] = scores.max(axis=1)
+        sizes = np.bincount(assignments, minlength=n_clusters)
+        labels = self._topic_labels(assignments, similarities, n_clusters)
+
+        # Only assignments that moved (or belong to new papers) are rewritten
+        previous = self.db.get_paper_topics()
+        changed = [(paper_id, cluster_id, similarity)
+                   for paper_id, cluster_id, similarity in zip(ids, assignments, similarities)
+                   if paper_id in pending or previous.get(paper_id) != cluster_id]
+        self.db.store_topic_clusters(centroids, absorbed, sizes, labels)
+        self.db.store_paper_topics(changed)
+
+        results['reassigned'] = len(changed)
+        results['clusters'] = int((sizes > 0).sum())
+        logger.info(f"Topics: {results['clusters']} clusters over {len(ids)} papers, "
+                    f"{len(changed)} assignments updated")
+        return results
+
+    def _topic_labels(self, assignments: np.ndarray, similarities: np.ndarray, n_clusters: int,
+                      per_cluster: int = 200, n_terms: int = 3) -> List[str]:
+        """Label each cluster with its most distinctive title/abstract words (TF-IDF across clusters).
+
+        Only the papers closest to each centroid are read.
+        """
+        members = {}
+        for cluster_id in range(n_clusters):
+            rows = np.flatnonzero(assignments == cluster_id)
+            rows = rows[np.argsort(-similarities[rows])[:per_cluster]]
+            members[cluster_id] = [self._centroid_ids[row] for row in rows]
+        papers = self.db.get_papers_brief([paper_id for ids in members.values() for paper_id in ids])
+
+        term_counts = []
+        for cluster_id in range(n_clusters):
+            counts = {}
+            for paper_id in members[cluster_id]:
+                paper = papers.get(paper_id, {})
+                text = f"{paper.get('title') or ''} {paper.get('abstract') or ''}".lower()
+                for term in set(re.findall(r'[a-z][a-z0-9-]{2,}', text)) - LABEL_STOPWORDS:
+                    counts[term] = counts.get(term, 0) + 1
+            term_counts.append(counts)
+
+        document_frequency = {}
+        for counts in term_counts:
+            for term in counts:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        labels = []
+        for counts in term_counts:
+            scored = sorted(counts, key=lambda term: (-counts[term] * np.log(1 + n_clusters / document_frequency[term]),
+                                                      term))
+            labels.append(', '.join(scored[:n_terms]))
+        return labels
+
+    def semantic_search(self, query: str, n_results: int = 5, exact: bool = False,
+                        include_summaries: bool = False, categories: Optional[List[str]] = None,
+                        date_from=None, date_to=None, has_summary: Optional[bool] = None) -> List[Dict]:
+        """Search for similar papers using embeddings (exact=True bypasses the ANN engine).
+
+        categories (any of), date_from / date_to (published date, inclusive) and
+        has_summary restrict the rows that are scored, so narrow filters make the
+        search cheaper instead of emptying the top-k.
+        """
+        filters = dict(categories=categories, date_from=date_from, date_to=date_to,
+                       has_summary=has_summary)
+        if self.search_mode == 'hybrid' and not exact:
+            return self.hybrid_search(query, n_results, include_summaries, **filters)
+
+        # Create query embedding using OpenAI (cached for repeated queries)
+        query_embedding = np.asarray(self.create_query_embedding(query), dtype=np.float32)
+
+        self.refresh_index()
+
+        hits = self._search_hits(query_embedding, n_results, exact, row_filter=self._filter_rows(**filters))
+        return self._build_results(hits, n_results, include_summaries)
+
+    def hybrid_search(self, query: str, n_results: int = 5, include_summaries: bool = False,
+                      categories: Optional[List[str]] = None, date_from=None, date_to=None,
+                      has_summary: Optional[bool] = None) -> List[Dict]:
+        """Fuse cosine and BM25 rankings with reciprocal rank fusion.
+
+        Each candidate generator runs with its own latency budget; a generator
+        that misses its budget is left out of the fusion instead of delaying it.
+        Filters work as in semantic_search; lexical hits are checked against the
+        same per-paper mask.
+        """
+        n_candidates = max(self.config.get('hybrid_candidates', 50), n_results)
+        rrf_k = self.config.get('hybrid_rrf_k', 60)
+        budgets_ms = {
+            'vector': self.config.get('hybrid_vector_budget_ms', 2000),
+            'chunks_bm25': self.config.get('hybrid_lexical_budget_ms', 200),
+            'papers_bm25': self.config.get('hybrid_lexical_budget_ms', 200),
+        }
+
+        def vector_candidates():
+            query_embedding = np.asarray(self.create_query_embedding(query), dtype=np.float32)
+            return self._search_hits(query_embedding, n_candidates, row_filter=row_filter)
+
+        def chunk_candidates():
+            return [(row_id, paper_id, -score) for row_id, paper_id, score in
+                    self.db.search_chunks_bm25(query, n_candidates * 4, budgets_ms['chunks_bm25'])]
+
+        def paper_candidates():
+            return [(None, paper_id, -score) for paper_id, score in
+                    self.db.search_papers_bm25(query, n_candidates, budgets_ms['papers_bm25'])]
+
+        self.refresh_index()
+        paper_mask = self.paper_metadata.mask(categories, date_from, date_to, has_summary)
+        row_filter = None if paper_mask is None else np.flatnonzero(paper_mask[self.index.paper_idx])
+
+        # Budgets cover the generators only; a slow refresh must not eat into them
+        start = time.perf_counter()
+        futures = {
+            'vector': self._executor.submit(vector_candidates),
+            'chunks_bm25': self._executor.submit(chunk_candidates),
+            'papers_bm25': self._executor.submit(paper_candidates),
+        }
+
+        rankings = {}
+        for name, future in futures.items():
+            remaining = budgets_ms[name] / 1000 - (time.perf_counter() - start)
+            try:
+                rankings[name] = future.result(timeout=max(remaining, 0))
+            except FutureTimeout:
+                logger.warning(f"{name} candidates missed their {budgets_ms[name]}ms budget")
+            except Exception as e:
+                logger.error(f"{name} candidates failed: {e}")
+
+        # Reciprocal rank fusion at paper level; remember each paper's best chunk
+        paper_scores = {}
+        best_chunk = {}
+        cosine = {}
+        for name, ranking in rankings.items():
+            seen = set()
+            for row_id, paper_id, score in ranking:
+                if paper_id in seen:
+                    continue  # Only a paper's best chunk counts
+                if paper_mask is not None:
+                    number = self.index.paper_numbers.get(paper_id)
+                    if number is None or not paper_mask[number]:
+                        continue
+                seen.add(paper_id)
+                paper_scores[paper_id] = paper_scores.get(paper_id, 0.0) + 1.0 / (rrf_k + len(seen))
+                if row_id is not None and paper_id not in best_chunk:
+                    best_chunk[paper_id] = row_id
+                if name == 'vector':
+                    cosine[paper_id] = score
+
+        if not paper_scores:
+            return []
+
+        # Scale so a paper ranked first by every generator scores 1.0
+        max_score = len(rankings) / (rrf_k + 1)
+        ranked = sorted(paper_scores.items(), key=lambda item: item[1], reverse=True)
+        hits = [(best_chunk.get(paper_id), paper_id, score / max_score) for paper_id, score in ranked]
+
+        results = self._build_results(hits, n_results, include_summaries)
+        for result in results:
+            result['vector_similarity'] = cosine.get(result['arxiv_id'])
+            result['retrieval'] = 'hybrid'
+        return results
+
+    def semantic_search_many(self, queries: List[str], n_results: int = 5, exact: bool = False,
+                             categories: Optional[List[str]] = None, date_from=None, date_to=None,
+                             has_summary: Optional[bool] = None) -> List[List[Dict]]:
+        """Search several queries at once: one embeddings request, one matrix-matrix product.
+
+        The filters apply to every query, as in semantic_search.
+        """
+        if not queries:
+            return []
+
+        query_embeddings = self.create_query_embeddings(queries)
+
+        self.refresh_index()
+        row_filter = self._filter_rows(categories, date_from, date_to, has_summary)
+
+        # The ANN engine probes different lists per query, so only exact search is batched
+        k = n_results * 4
+        if exact or self.ann is None:
+            batch = self.index.search_many(query_embeddings, k, row_filter)
+        else:
+            batch = [None] * len(queries)
+
+        all_results = []
+        for query_embedding, first_pass in zip(query_embeddings, batch):
+            hits = self._search_hits(query_embedding, n_results, exact, first_pass, row_filter)
+            all_results.append(self._build_results(hits, n_results))
+        return all_results
+
+    def _search_hits(self, query_embedding: np.ndarray, n_results: int, exact: bool = False,
+                     first_pass=None, row_filter: Optional[np.ndarray] = None) -> List[tuple]:
+        """Best chunk per paper as (row_id, paper_id, similarity), at least n_results papers if possible.
+
+        row_filter limits scoring to those row positions (see _filter_rows).
+        """
+        candidates = None
+        if not exact and self.ann is not None and self.ann.is_trained:
+            if len(query_embedding) == self.index.full_dim and np.any(query_embedding):
+                candidates = self.ann.candidates(self.index.scan_query(query_embedding))
+
+        if row_filter is not None:
+            # A filter smaller than the probed lists is cheaper to scan exactly
+            if candidates is None or len(row_filter) <= len(candidates):
+                candidates = row_filter
+            else:
+                candidates = np.intersect1d(candidates, row_filter, assume_unique=True)
+            if not len(candidates):
+                return []
+        searchable = len(self.index) if candidates is None else len(candidates)
+
+        # Over-fetch chunks so that enough distinct papers survive de-duplication
+        k = n_results * 4
+        while True:
+            if first_pass is not None:
+                positions, scores = first_pass
+                first_pass = None
+            else:
+                positions, scores = self.index.search(query_embedding, k, candidates)
+
+            hits = []
+            seen_papers = set()
+            for position, score in zip(positions, scores):
+                paper_id = self.index.paper_ids[position]
+                if paper_id not in seen_papers:
+                    seen_papers.add(paper_id)
+                    hits.append((int(self.index.row_ids[position]), paper_id, float(score)))
+
+            if len(hits) >= n_results or k >= searchable:
+                return hits
+            k *= 4
+
+    def _build_results(self, hits: List[tuple], n_results: int,
+                       include_summaries: bool = False) -> List[Dict]:
+        """Turn ranked hits into result dicts with two bulk queries (papers, chunk texts).
+
+        Summaries are loaded lazily by the UI (see DatabaseManager.get_paper_summary)
+        unless include_summaries is set.
+        """
+        unique_results = []
+        position = 0
+        while len(unique_results) < n_results and position < len(hits):
+            # Details only for the hits that can make the cut, plus a few in case
+            # some papers were removed since they were indexed
+            batch = hits[position:position + n_results - len(unique_results) + RESULT_DETAIL_MARGIN]
+            position += len(batch)
+
+            paper_ids = [paper_id for _, paper_id, _ in batch]
+            papers = self.db.get_papers_brief(paper_ids)
+            chunk_texts = self.db.get_chunk_texts([row_id for row_id, _, _ in batch if row_id is not None])
+            summaries = self.db.get_paper_summaries(paper_ids) if include_summaries else {}
+
+            for row_id, paper_id, similarity in batch:
+                paper = papers.get(paper_id)
+                if not paper:
+                    continue
+
+                paper_result = {
+                    'arxiv_id': paper['arxiv_id'],
+                    'title': paper['title'],
+                    'abstract': paper['abstract'][:200] + '...' if paper.get('abstract') else '',
+                    'similarity': similarity,
+                    'relevant_chunk': (chunk_texts.get(row_id) or '')[:200] + '...',
+                    'has_summary': bool(paper['has_summary'])
+                }
+                if paper_id in summaries:
+                    paper_result['summary'] = summaries[paper_id]
+
+                unique_results.append(paper_result)
+
+                if len(unique_results) >= n_results:
+                    break
 
         return unique_results
     
@@ -282,15 +1415,24 @@ class VectorStore:
         """Get statistics about embeddings and API usage"""
         stats = self.db.get_stats()
         
-        # Add OpenAI-specific stats
+        # Add provider-specific stats
+        stats['embedding_provider'] = self.provider.name
         stats['embedding_model'] = self.embedding_model
-        stats['embedding_dimensions'] = self.embedding_dimensions.get(self.embedding_model, 'unknown')
+        stats['embedding_dimensions'] = self.provider.dimensions
         
         # Estimate costs
         if stats['total_chunks'] > 0:
             # Rough estimate: 500 tokens per chunk
             estimated_tokens = stats['total_chunks'] * 500
             stats['estimated_tokens_used'] = estimated_tokens
-            stats['estimated_cost_usd'] = (estimated_tokens / 1_000_000) * 0.02
+            stats['estimated_cost_usd'] = (estimated_tokens / 1_000_000) * self.provider.cost_per_million_tokens
+
+        # Query embedding cache counters (this process)
+        lookups = sum(self.query_cache_stats.values())
+        hits = self.query_cache_stats['memory_hits'] + self.query_cache_stats['db_hits']
+        stats['query_cache_memory_hits'] = self.query_cache_stats['memory_hits']
+        stats['query_cache_db_hits'] = self.query_cache_stats['db_hits']
+        stats['query_cache_misses'] = self.query_cache_stats['misses']
+        stats['query_cache_hit_rate'] = round(hits / lookups, 3) if lookups else 0.0
         
         return stats
\ No newline at end of file